@@ -0,0 +1,178 @@
+"""
+Admin routes: dashboard, user management, bulk export (blueprint 'admin', see app.create_app).
+"""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, stream_with_context
+from flask_login import login_required, current_user
+from models import db, User, Department
+import queries
+import stats
+import search
+import export
+import passwords
+import identity
+
+bp = Blueprint('admin', __name__)
+
+@bp.route('/admin_dashboard')
+@login_required
+def admin_dashboard():
+    if current_user.role != 'admin': return redirect(url_for('index'))
+
+    search_text = request.args.get('search', '').strip()
+
+    # Queries
+    docs = queries.admin_users('doctor')
+    pats = queries.admin_users('patient')
+
+    records = []
+    if search_text:
+        # Full-text index (prefix match, best first) instead of a LIKE '%x%' scan
+        docs = search.users_query(search_text, docs)
+        pats = search.users_query(search_text, pats)
+        records, _ = search.page(search.treatments_query(search_text), 1, 20)
+
+    # Appointments: one keyset page at a time
+    try:
+        appt_query = queries.filter_appointments(queries.admin_appointments(), **queries.appointment_filters(request.args))
+        appointments, next_cursor = queries.appointment_page(appt_query, request.args.get('cursor'), request.args.get('limit', type=int))
+    except ValueError:
+        flash('Invalid appointment filter.', 'warning')
+        appointments, next_cursor = queries.appointment_page(queries.admin_appointments())
+
+    departments = Department.query.all()
+    dashboard = stats.dashboard_stats()
+
+    # --- CHART DATA: Doctors per Department ---
+    # Only departments with doctors come back from the GROUP BY
+    dept_names = [row['department'] for row in dashboard['doctors_per_department']]
+    dept_counts = [row['doctors'] for row in dashboard['doctors_per_department']]
+
+    return render_template('admin_dashboard.html',
+                           doctors=docs.all(),
+                           patients=pats.all(),
+                           departments=departments,
+                           appointments=appointments,
+                           next_cursor=next_cursor,
+                           records=records,
+                           total_appointments=dashboard['total_appointments'],
+                           # Pass Chart Data
+                           dept_names=dept_names,
+                           dept_counts=dept_counts)
+
+@bp.route('/api/export/appointments')
+@login_required
+def export_appointments():
+    # Compliance / reporting export. Query args: format (csv/ndjson/parquet), date_from, date_to, since_id,
+    # include_archived (default on: archived appointments are part of the record)
+    if current_user.role != 'admin': return {'message': 'Forbidden'}, 403
+
+    fmt = request.args.get('format', 'csv')
+    if not export.available(fmt):
+        return {'message': f'Unsupported format: {fmt}'}, 400
+    try:
+        filters = queries.appointment_filters(request.args)
+    except ValueError:
+        return {'message': 'Invalid date format. Use YYYY-MM-DD'}, 400
+
+    upto_id = export.watermark()
+    include_archived = request.args.get('include_archived', 'true').lower() not in ('0', 'false', 'no')
+    query = export.statement(upto_id, request.args.get('since_id', type=int), filters['date_from'], filters['date_to'],
+                             include_archived=include_archived)
+    # No Content-Length: the body goes out chunked as each batch is written
+    return Response(stream_with_context(export.WRITERS[fmt](query)), mimetype=export.MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename=appointments-{upto_id}.{fmt}',
+        'X-Export-Watermark': str(upto_id),
+    })
+
+@bp.route('/add_doctor', methods=['GET', 'POST'])
+@login_required
+def add_doctor():
+    if current_user.role != 'admin': return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        email = request.form.get('email')
+        if User.query.filter_by(email=email).first():
+            flash('Email exists.', 'danger')
+        else:
+            try:
+                password = passwords.hash_password(request.form.get('password') or '')
+            except passwords.Busy:
+                flash('The server is busy. Please try again in a moment.', 'warning')
+                return render_template('add_doctor.html', departments=Department.query.all()), 503, passwords.busy_headers()
+            new_doc = User(
+                username=request.form.get('username'),
+                email=email,
+                password=password,
+                role='doctor',
+                department_id=request.form.get('department_id')
+            )
+            db.session.add(new_doc)
+            db.session.commit()
+            flash('Doctor added.', 'success')
+            return redirect(url_for('admin.admin_dashboard'))
+
+    return render_template('add_doctor.html', departments=Department.query.all())
+
+@bp.route('/delete_user/<int:user_id>')
+@login_required
+def delete_user(user_id):
+    if current_user.role != 'admin': return redirect(url_for('index'))
+
+    user = db.session.get(User, user_id)
+    if user:
+        db.session.delete(user)
+        db.session.commit()
+        identity.invalidate(user_id)
+        flash('User deleted.', 'success')
+    return redirect(url_for('admin.admin_dashboard'))
+
+@bp.route('/toggle_status/<int:user_id>')
+@login_required
+def toggle_status(user_id):
+    if current_user.role != 'admin': return redirect(url_for('index'))
+
+    user = db.session.get(User, user_id)
+    if user:
+        user.is_active_user = not user.is_active_user
+        db.session.commit()
+        identity.invalidate(user_id)
+        flash('Status updated.', 'info')
+    return redirect(url_for('admin.admin_dashboard'))
+
+@bp.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
+@login_required
+def edit_user(user_id):
+    # Permission Check
+    if current_user.role != 'admin' and current_user.id != user_id:
+        return redirect(url_for('index'))
+
+    user = db.session.get(User, user_id)
+
+    if request.method == 'POST':
+        new_email = request.form.get('email')
+        new_username = request.form.get('username')
+
+        existing_user = User.query.filter_by(email=new_email).first()
+
+        # If found, AND it is not the same person we are currently editing
+        if existing_user and existing_user.id != user.id:
+            flash('Error: That email is already in use by another account.', 'danger')
+            return redirect(url_for('admin.edit_user', user_id=user.id))
+
+        user.username = new_username
+        user.email = new_email
+
+        # Admin updating Doctor Department
+        if current_user.role == 'admin' and user.role == 'doctor':
+            user.department_id = request.form.get('department_id')
+
+        db.session.commit()
+        identity.invalidate(user_id)
+        flash('Profile updated successfully!', 'success')
+
+        # Redirect back to appropriate dashboard
+        if current_user.role == 'admin': return redirect(url_for('admin.admin_dashboard'))
+        if current_user.role == 'doctor': return redirect(url_for('doctor.doctor_dashboard'))
+        return redirect(url_for('patient.patient_dashboard'))
+
+    return render_template('edit_user.html', user=user, departments=Department.query.all())
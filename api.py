@@ -0,0 +1,298 @@
+"""
+JSON API: Flask-RESTful resources under /api (blueprint 'api', see app.create_app).
+asgi.py serves the read-only GETs natively with the same field sets.
+"""
+from datetime import datetime
+from flask import Blueprint, request
+from flask_login import current_user
+from flask_restful import Resource, Api, reqparse, fields, marshal
+from sqlalchemy.orm import joinedload, contains_eager
+from models import db, User, Appointment, FreeSlot
+from queries import DATE_FMT
+import queries
+import stats
+import booking
+import free_slots
+import search
+import batch
+import timeline
+import assign
+
+bp = Blueprint('api', __name__)
+api = Api(bp)
+
+# 1. Output Format
+resource_fields = {
+    'id': fields.Integer,
+    'doctor_name': fields.String(attribute='doctor_ref.username'),
+    'patient_name': fields.String(attribute='patient_ref.username'),
+    'date': fields.String(attribute=lambda x: x.appointment_date.strftime('%Y-%m-%d')),
+    'time': fields.String(attribute=lambda x: x.appointment_time.strftime('%H:%M')),
+    'status': fields.String
+}
+
+# 2. Input Parser
+parser = reqparse.RequestParser()
+parser.add_argument('doctor_id', type=int, help='Doctor ID is required')
+parser.add_argument('patient_id', type=int, help='Patient ID is required')
+parser.add_argument('date', type=str, help='Date (YYYY-MM-DD)')
+parser.add_argument('slot', type=str, help='Slot (Morning/Evening)')
+parser.add_argument('status', type=str, help='Status (Scheduled/Cancelled)')
+
+page_fields = {
+    'appointments': fields.List(fields.Nested(resource_fields)),
+    'next_cursor': fields.String
+}
+
+class AppointmentAPI(Resource):
+    # GET: View appointments, one keyset page at a time
+    # Query args: cursor, limit, status, doctor_id, patient_id, date_from, date_to
+    def get(self):
+        try:
+            query = queries.filter_appointments(queries.api_appointments(), **queries.appointment_filters(request.args))
+            rows, next_cursor = queries.appointment_page(query, request.args.get('cursor'), request.args.get('limit', type=int))
+        except ValueError:
+            return {'message': 'Invalid cursor or filter. Dates use YYYY-MM-DD'}, 400
+        return marshal({'appointments': rows, 'next_cursor': next_cursor}, page_fields)
+
+    # POST: Book a new appointment
+    def post(self):
+        args = parser.parse_args()
+        
+        # 1. Parse Date & Time
+        try:
+            appt_date = datetime.strptime(args['date'], '%Y-%m-%d').date()
+            appt_time = booking.slot_time(args['slot'])
+        except (TypeError, ValueError):
+            return {'message': 'Invalid date format. Use YYYY-MM-DD'}, 400
+
+        # 2. Claim the slot (atomic - the unique index decides)
+        try:
+            booking.book(args['patient_id'], args['doctor_id'], appt_date, appt_time)
+        except booking.SlotTaken:
+            return {'message': 'Slot already booked.'}, 409
+        return {'message': 'Appointment created successfully'}, 201
+
+    # PUT: Update (Reschedule/Status)
+    def put(self, appointment_id):
+        args = parser.parse_args()
+        appt = db.session.get(Appointment, appointment_id)
+        
+        if not appt:
+            return {'message': 'Appointment not found'}, 404
+
+        if args['status']:
+            appt.status = args['status']
+            
+        if args['date'] and args['slot']:
+            try:
+                appt.appointment_date = datetime.strptime(args['date'], '%Y-%m-%d').date()
+                appt.appointment_time = booking.slot_time(args['slot'])
+            except ValueError:
+                return {'message': 'Invalid date format'}, 400
+
+        # Covers both moving the slot and re-activating a Cancelled appointment
+        try:
+            booking.commit_slot(appt)
+        except booking.SlotTaken:
+            return {'message': 'Slot already booked.'}, 409
+        return {'message': 'Appointment updated'}, 200
+
+    # DELETE: Remove
+    def delete(self, appointment_id):
+        appt = db.session.get(Appointment, appointment_id)
+        if not appt:
+            return {'message': 'Appointment not found'}, 404
+            
+        db.session.delete(appt)
+        db.session.commit()
+        return {'message': 'Appointment deleted'}, 204
+
+class AppointmentBatchAPI(Resource):
+    # POST: {"operations": [{"op": "book", "doctor_id", "patient_id", "date", "slot"},
+    #                       {"op": "cancel", "id"}, {"op": "reschedule", "id", "date", "slot"}, ...]}
+    # Returns one {index, status, id, message} per operation, in request order
+    def post(self):
+        # Books, cancels and moves anyone's appointments: admins only
+        if not current_user.is_authenticated or current_user.role != 'admin':
+            return {'message': 'Forbidden'}, 403
+        operations = (request.get_json(silent=True) or {}).get('operations')
+        if not isinstance(operations, list) or not operations:
+            return {'message': 'Body must be {"operations": [...]}'}, 400
+        if len(operations) > batch.MAX_BATCH:
+            return {'message': f'At most {batch.MAX_BATCH} operations per batch'}, 413
+        try:
+            results = batch.apply_batch(operations)
+        except booking.SlotTaken:
+            return {'message': 'A slot was booked concurrently; nothing was applied. Retry the batch.'}, 409
+        return {'results': results}, 200
+
+class StatsAPI(Resource):
+    # GET: Dashboard aggregates (cached for STATS_CACHE_TTL seconds)
+    def get(self):
+        # Per-role user counts and per-doctor load: admins only
+        if not current_user.is_authenticated or current_user.role != 'admin':
+            return {'message': 'Forbidden'}, 403
+        return stats.dashboard_stats()
+
+free_slot_fields = {
+    'doctor_id': fields.Integer,
+    'doctor_name': fields.String(attribute='doctor.username'),
+    'date': fields.String(attribute=lambda x: x.available_date.strftime('%Y-%m-%d')),
+    'slot': fields.String(attribute='slot_type')
+}
+
+def free_slot_range(args):
+    """date_from / date_to / limit query args for the free slot resources."""
+    date_from = datetime.strptime(args['date_from'], DATE_FMT).date() if args.get('date_from') else None
+    date_to = datetime.strptime(args['date_to'], DATE_FMT).date() if args.get('date_to') else None
+    return date_from, date_to, queries.page_size(args.get('limit', type=int))
+
+class DoctorFreeSlotsAPI(Resource):
+    # GET: Bookable slots of one doctor, earliest first
+    def get(self, doctor_id):
+        try:
+            date_from, date_to, limit = free_slot_range(request.args)
+        except ValueError:
+            return {'message': 'Invalid date format. Use YYYY-MM-DD'}, 400
+        rows = free_slots.for_doctor(doctor_id, date_from, date_to).options(joinedload(FreeSlot.doctor)).limit(limit).all()
+        return marshal(rows, free_slot_fields)
+
+class DepartmentFreeSlotsAPI(Resource):
+    # GET: Bookable slots across a department - the first one is the next available doctor
+    def get(self, department_id):
+        try:
+            date_from, date_to, limit = free_slot_range(request.args)
+        except ValueError:
+            return {'message': 'Invalid date format. Use YYYY-MM-DD'}, 400
+        rows = free_slots.for_department(department_id, date_from, date_to).options(contains_eager(FreeSlot.doctor)).limit(limit).all()
+        return marshal(rows, free_slot_fields)
+
+roster_fields = {
+    'id': fields.Integer,
+    'username': fields.String,
+    'email': fields.String,
+    'visits': fields.Integer,
+    'last_visit': fields.String(attribute=lambda x: x.last_visit.strftime('%Y-%m-%d') if x.last_visit else None),
+    'latest_diagnosis': fields.String
+}
+
+class DoctorPatientsAPI(Resource):
+    # GET: The doctor's patient roster by name. Query args: cursor, limit
+    def get(self, doctor_id):
+        # The doctor themself or an admin
+        if not current_user.is_authenticated or not (current_user.role == 'admin' or current_user.id == doctor_id):
+            return {'message': 'Forbidden'}, 403
+        try:
+            rows, next_cursor = queries.roster_page(doctor_id, request.args.get('cursor'), request.args.get('limit', type=int))
+        except ValueError:
+            return {'message': 'Invalid cursor'}, 400
+        return {'patients': marshal(rows, roster_fields), 'next_cursor': next_cursor}
+
+timeline_fields = {field: fields.Raw for field in timeline.FIELDS}
+
+class PatientTimelineAPI(Resource):
+    # GET: The patient's visits, oldest first. Query args: date_from, date_to (YYYY-MM-DD), start, limit
+    def get(self, patient_id):
+        # Staff, or the patient themself
+        if not current_user.is_authenticated or \
+                (current_user.role not in ('admin', 'doctor') and current_user.id != patient_id):
+            return {'message': 'Forbidden'}, 403
+        try:
+            date_from, date_to, limit = free_slot_range(request.args)
+        except ValueError:
+            return {'message': 'Invalid date format. Use YYYY-MM-DD'}, 400
+        start = max(0, request.args.get('start', 0, type=int))
+        total, rows = timeline.window(timeline.load(patient_id), date_from and date_from.isoformat(),
+                                      date_to and date_to.isoformat(), start, limit)
+        return {'patient_id': patient_id, 'total': total, 'start': start,
+                'visits': marshal([dict(zip(timeline.FIELDS, row)) for row in rows], timeline_fields),
+                'next_start': start + limit if start + limit < total else None}
+
+assignment_fields = dict(resource_fields, doctor_id=fields.Integer)
+
+assign_parser = reqparse.RequestParser()
+assign_parser.add_argument('date_from', type=str, help='First day (YYYY-MM-DD), default today')
+assign_parser.add_argument('date_to', type=str, help='Last day (YYYY-MM-DD)')
+assign_parser.add_argument('patient_id', type=int, help='Patient to book for (admins only)')
+
+class DepartmentAssignAPI(Resource):
+    # POST: Book the earliest free slot in the department, least-loaded doctor first
+    # Args: date_from, date_to; patient_id for admins - patients always book for themselves
+    def post(self, department_id):
+        if not current_user.is_authenticated or current_user.role not in ('admin', 'patient'):
+            return {'message': 'Forbidden'}, 403
+        args = assign_parser.parse_args()
+        try:
+            date_from = datetime.strptime(args['date_from'], DATE_FMT).date() if args['date_from'] else None
+            date_to = datetime.strptime(args['date_to'], DATE_FMT).date() if args['date_to'] else None
+        except ValueError:
+            return {'message': 'Invalid date format. Use YYYY-MM-DD'}, 400
+
+        patient_id = current_user.id if current_user.role == 'patient' else args['patient_id']
+        patient = db.session.get(User, patient_id) if patient_id else None
+        if not patient or patient.role != 'patient':
+            return {'message': 'patient_id must be a patient'}, 400
+
+        try:
+            appt = assign.assign(patient_id, department_id, date_from, date_to)
+        except assign.NoSlot:
+            return {'message': 'No free slot in that window'}, 404
+        except booking.SlotTaken:
+            return {'message': 'Slots were taken concurrently. Retry.'}, 409
+        return marshal(appt, assignment_fields), 201
+
+search_user_fields = {
+    'id': fields.Integer,
+    'username': fields.String,
+    'email': fields.String,
+    'role': fields.String
+}
+
+search_record_fields = {
+    'id': fields.Integer,
+    'appointment_id': fields.Integer,
+    'patient_id': fields.Integer(attribute='appointment.patient_id'),
+    'patient_name': fields.String(attribute='appointment.patient_ref.username'),
+    'doctor_name': fields.String(attribute='appointment.doctor_ref.username'),
+    'date': fields.String(attribute=lambda x: x.appointment.appointment_date.strftime('%Y-%m-%d')),
+    'diagnosis': fields.String,
+    'prescription': fields.String,
+    'doctor_notes': fields.String
+}
+
+class SearchAPI(Resource):
+    # GET: Ranked prefix search. Query args: q, type (users/records/all), role, page, limit
+    def get(self):
+        # Medical records: staff only
+        if not current_user.is_authenticated or current_user.role not in ('admin', 'doctor'):
+            return {'message': 'Forbidden'}, 403
+
+        q = request.args.get('q', '').strip()
+        kind = request.args.get('type', 'all')
+        page_number = request.args.get('page', 1, type=int)
+        limit = queries.page_size(request.args.get('limit', type=int))
+        result = {'q': q, 'page': page_number}
+
+        if kind in ('users', 'all'):
+            base = User.query.filter_by(role=request.args['role']) if request.args.get('role') else None
+            rows, more = search.page(search.users_query(q, base), page_number, limit)
+            result['users'] = marshal(rows, search_user_fields)
+            result['users_has_more'] = more
+        if kind in ('records', 'all'):
+            rows, more = search.page(search.treatments_query(q), page_number, limit)
+            result['records'] = marshal(rows, search_record_fields)
+            result['records_has_more'] = more
+        return result
+
+# Register the Resources
+api.add_resource(StatsAPI, '/api/stats', endpoint='stats')
+api.add_resource(SearchAPI, '/api/search', endpoint='search')
+api.add_resource(AppointmentAPI, '/api/appointments', endpoint='appointments')
+api.add_resource(AppointmentAPI, '/api/appointments/<int:appointment_id>', endpoint='appointment')
+api.add_resource(AppointmentBatchAPI, '/api/appointments/batch', endpoint='appointments_batch')
+api.add_resource(DoctorFreeSlotsAPI, '/api/doctors/<int:doctor_id>/free_slots', endpoint='doctor_free_slots')
+api.add_resource(PatientTimelineAPI, '/api/patients/<int:patient_id>/timeline', endpoint='patient_timeline')
+api.add_resource(DoctorPatientsAPI, '/api/doctors/<int:doctor_id>/patients', endpoint='doctor_patients')
+api.add_resource(DepartmentFreeSlotsAPI, '/api/departments/<int:department_id>/free_slots', endpoint='department_free_slots')
+api.add_resource(DepartmentAssignAPI, '/api/departments/<int:department_id>/assign', endpoint='department_assign')
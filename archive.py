@@ -0,0 +1,89 @@
+"""
+Archival of old appointments.
+
+Completed and Cancelled appointments older than ARCHIVE_AFTER_DAYS, with
+their treatments, are moved from the live tables to appointments_archive /
+treatments_archive (models.ArchivedAppointment / ArchivedTreatment) in the
+'archive' bind: instance/archive.db with SQLite, or ARCHIVE_DATABASE_URL.
+Dashboards, slot checks, search and exports then only touch live rows;
+the patient timeline (timeline.py) reads both stores.
+
+    python archive.py             # archive everything due, ARCHIVE_BATCH at a time
+    python archive.py --dry-run   # only count
+
+The background workers also run it nightly (jobs.py, ARCHIVE_HOUR).
+
+Each batch is copied first and deleted from the live tables second, in two
+transactions because the stores may be different databases. The copy
+replaces archived rows with the same ids, so a batch interrupted between the
+two steps is simply moved again by the next run; readers prefer the live row
+meanwhile.
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+from models import db, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment
+
+ARCHIVED_STATUSES = ('Completed', 'Cancelled')
+
+# Copied column by column: both stores share these names
+APPOINTMENT_COLUMNS = ('id', 'patient_id', 'doctor_id', 'appointment_date', 'appointment_time', 'status', 'created_at')
+TREATMENT_COLUMNS = ('id', 'appointment_id', 'diagnosis', 'prescription', 'doctor_notes', 'date_recorded')
+
+
+def cutoff():
+    return date.today() - timedelta(days=current_app.config['ARCHIVE_AFTER_DAYS'])
+
+def due(before=None):
+    """Live appointments that belong in the archive."""
+    return select(Appointment.id).where(Appointment.status.in_(ARCHIVED_STATUSES),
+                                        Appointment.appointment_date < (before or cutoff()))
+
+def _rows(table, columns, condition):
+    return [dict(row) for row in db.session.execute(select(*[table.c[name] for name in columns]).where(condition)).mappings()]
+
+def move(ids):
+    """Moves the appointments `ids` and their treatments to the archive."""
+    appointments = _rows(Appointment.__table__, APPOINTMENT_COLUMNS, Appointment.id.in_(ids))
+    treatments = _rows(Treatment.__table__, TREATMENT_COLUMNS, Treatment.appointment_id.in_(ids))
+    archived_at = datetime.utcnow()
+    quiet = {'synchronize_session': False}
+
+    # 1. Copy, replacing whatever an interrupted earlier run left for these ids
+    db.session.execute(delete(ArchivedTreatment).where(ArchivedTreatment.appointment_id.in_(ids)), execution_options=quiet)
+    db.session.execute(delete(ArchivedAppointment).where(ArchivedAppointment.id.in_(ids)), execution_options=quiet)
+    db.session.execute(insert(ArchivedAppointment), [dict(row, archived_at=archived_at) for row in appointments])
+    if treatments:
+        db.session.execute(insert(ArchivedTreatment), treatments)
+    db.session.commit()
+
+    # 2. Only then drop the live rows
+    db.session.execute(delete(Treatment).where(Treatment.appointment_id.in_(ids)), execution_options=quiet)
+    db.session.execute(delete(Appointment).where(Appointment.id.in_(ids)), execution_options=quiet)
+    db.session.commit()
+
+def run(before=None, batch_size=None):
+    """Archives every due appointment, `batch_size` per transaction; returns how many moved."""
+    size = batch_size or current_app.config['ARCHIVE_BATCH']
+    moved = 0
+    while True:
+        ids = db.session.scalars(due(before).order_by(Appointment.id).limit(size)).all()
+        if not ids:
+            return moved
+        move(ids)
+        moved += len(ids)
+
+
+if __name__ == '__main__':
+    from app import create_app
+    parser = argparse.ArgumentParser(description='Move old appointments to the archive.')
+    parser.add_argument('--before', type=date.fromisoformat, help='archive visits before this date (default: ARCHIVE_AFTER_DAYS ago)')
+    parser.add_argument('--dry-run', action='store_true', help='only count what would be moved')
+    args = parser.parse_args()
+    with create_app(blueprints=()).app_context():
+        db.create_all(bind_key='archive')
+        if args.dry_run:
+            print(f'{db.session.scalar(select(func.count()).select_from(due(args.before).subquery()))} appointments due for the archive')
+        else:
+            print(f'Archived {run(args.before)} appointments')
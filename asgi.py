@@ -0,0 +1,154 @@
+"""
+ASGI entry point.
+
+    uvicorn asgi:application --workers 4 --port 8000
+
+The read-heavy JSON endpoints run natively on asyncio with an async
+SQLAlchemy engine, so a request waiting on the database holds no thread:
+
+    GET /api/appointments
+    GET /api/doctors/<id>/free_slots
+    GET /api/departments/<id>/free_slots
+
+They build their SELECTs with the same helpers as the Flask resources and
+marshal with the same field sets, so the responses are identical. Every
+other request (pages, login sessions, writes, and /api/stats, which needs
+the admin's login session) goes to the Flask app through
+asgiref's WsgiToAsgi, which runs it on a thread pool.
+
+Needs an ASGI server (uvicorn, requirements-optional.txt) and an async
+driver: aiosqlite for SQLite (requirements.txt), asyncpg for PostgreSQL
+(requirements-optional.txt). ASYNC_DATABASE_URL overrides the driver.
+"""
+import re
+import json
+import time
+from importlib.util import find_spec
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from flask_restful import marshal
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, contains_eager
+from werkzeug.datastructures import MultiDict
+from app import create_app
+from api import free_slot_range, page_fields, free_slot_fields
+from models import db, FreeSlot
+import config
+import metrics
+import queries
+import free_slots
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+flask_app = create_app()
+
+def async_url():
+    if flask_app.config['ASYNC_DATABASE_URL']:
+        return flask_app.config['ASYNC_DATABASE_URL']
+    # Flask-SQLAlchemy's URL: relative SQLite paths are already resolved against instance/
+    with flask_app.app_context():
+        url = db.engine.url
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+def require_driver(url):
+    """Fails at startup, with what to install, when the async driver is missing."""
+    url = make_url(url)
+    driver = url.get_driver_name()
+    if find_spec(driver) is None:
+        raise ImportError(f'asgi.py needs the {driver} package for {url.drivername} URLs: pip install {driver}')
+    return url
+
+engine = create_async_engine(require_driver(async_url()), **config.engine_options(flask_app.config))
+config.init_engine(flask_app, engine.sync_engine)
+Session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# --- ENDPOINTS ---
+# Each takes (session, args[, path ids]) and returns (status, JSON-able body).
+# The statements are built inside an app context because the query helpers
+# start from Model.query; nothing is executed there.
+
+async def appointments(session, args):
+    size = queries.page_size(args.get('limit', type=int))
+    try:
+        with flask_app.app_context():
+            query = queries.filter_appointments(queries.api_appointments(), **queries.appointment_filters(args))
+            stmt = queries.page_query(query, args.get('cursor'), size).statement
+    except ValueError:
+        return 400, {'message': 'Invalid cursor or filter. Dates use YYYY-MM-DD'}
+    rows = (await session.execute(stmt)).unique().scalars().all()
+    rows, next_cursor = queries.split_page(rows, size)
+    return 200, marshal({'appointments': rows, 'next_cursor': next_cursor}, page_fields)
+
+async def doctor_free_slots(session, args, doctor_id):
+    try:
+        date_from, date_to, limit = free_slot_range(args)
+    except ValueError:
+        return 400, {'message': 'Invalid date format. Use YYYY-MM-DD'}
+    with flask_app.app_context():
+        stmt = free_slots.for_doctor(int(doctor_id), date_from, date_to) \
+            .options(joinedload(FreeSlot.doctor)).limit(limit).statement
+    rows = (await session.execute(stmt)).unique().scalars().all()
+    return 200, marshal(rows, free_slot_fields)
+
+async def department_free_slots(session, args, department_id):
+    try:
+        date_from, date_to, limit = free_slot_range(args)
+    except ValueError:
+        return 400, {'message': 'Invalid date format. Use YYYY-MM-DD'}
+    with flask_app.app_context():
+        stmt = free_slots.for_department(int(department_id), date_from, date_to) \
+            .options(contains_eager(FreeSlot.doctor)).limit(limit).statement
+    rows = (await session.execute(stmt)).unique().scalars().all()
+    return 200, marshal(rows, free_slot_fields)
+
+# (pattern, endpoint name as in api.py's Api, handler) - GET only
+ROUTES = [
+    (re.compile(r'^/api/appointments$'), 'api.appointments', appointments),
+    (re.compile(r'^/api/doctors/(\d+)/free_slots$'), 'api.doctor_free_slots', doctor_free_slots),
+    (re.compile(r'^/api/departments/(\d+)/free_slots$'), 'api.department_free_slots', department_free_slots),
+]
+
+
+# --- ASGI APP ---
+
+wsgi = WsgiToAsgi(flask_app)
+
+def _match(scope):
+    if scope['method'] != 'GET':
+        return None
+    for pattern, name, handler in ROUTES:
+        found = pattern.match(scope['path'])
+        if found:
+            return name, handler, found.groups()
+    return None
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    route = _match(scope) if scope['type'] == 'http' else None
+    if route is None:
+        return await wsgi(scope, receive, send)
+
+    name, handler, path_args = route
+    started = time.perf_counter()
+    args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+    async with Session() as session:
+        status, body = await handler(session, args, *path_args)
+    payload = json.dumps(body).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]})
+    await send({'type': 'http.response.body', 'body': payload})
+    # Same /metrics series as the Flask endpoints; SQL counters are not collected here
+    metrics.record(name, 'GET', status, time.perf_counter() - started, 0, 0.0)
@@ -0,0 +1,200 @@
+"""
+Automatic doctor assignment: "book me the earliest free slot in this department".
+
+assign() books the earliest free slot of the department's active doctors in
+a date window. Doctors free at that same slot are told apart by load - the
+one with the fewest Scheduled appointments in the schedule horizon wins -
+so demand spreads over the department instead of piling onto the doctors
+patients pick by hand.
+
+Each (department, window) has a Queue: a heap with one entry per doctor,
+(next free date, slot, load, doctor id), built from the schedule grids
+(schedule.py). An assignment pops the top and re-checks that doctor against
+their grid; an entry made stale by another booking is corrected and pushed
+back (lazy deletion). So an assignment costs O(log doctors) plus a grid
+lookup instead of reading every free slot of the department. A queue is
+rebuilt after ASSIGN_TTL seconds, which also picks up slots freed by
+cancellations, and as soon as a doctor joins, leaves or is blacklisted
+('doctors' stamp, cache.py).
+
+Concurrency: each queue has its own lock, held while it is filled and while
+an assignment takes from it. Those are the steps that read the roster and
+load grids from the database, so a slow load only holds up assignments in
+the same (department, window). The module lock guards the queue registry
+and _claimed, and is never held across SQL. A popped slot stays in _claimed
+until its booking is over, so threads of one process never try the same
+slot, even from queues of overlapping windows. Across processes the unique
+slot index decides: the loser gets SlotTaken from booking.book() and moves
+on to the next entry.
+
+Windows the grids cannot answer (past the horizon, SCHEDULE_GRID off) make
+the same choice in SQL on the free slot index.
+"""
+import heapq
+import threading
+import time
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from models import db, User, Appointment, FreeSlot
+import booking
+import cache
+import free_slots
+import schedule
+
+class NoSlot(Exception):
+    """No active doctor of the department has a free slot in the window."""
+
+_lock = threading.Lock()  # _queues and _claimed; never held across SQL
+_queues = {}              # (department_id, date_from, date_to) -> Queue
+_claimed = set()          # (doctor_id, date, slot_type) being booked right now
+
+
+class Queue:
+    """The department's doctors for one window, best next slot on top."""
+
+    def __init__(self, department_id, date_from, date_to):
+        self.key = (department_id, date_from, date_to)
+        self.department_id, self.date_from, self.date_to = department_id, date_from, date_to
+        self.version = cache.version('doctors', 'schedule')  # before reading the roster
+        self.built_at = time.monotonic()
+        self.heap = []
+        self.lock = threading.Lock()  # fill() and take()
+        self.covered = None  # fill() result: False if a grid cannot cover the window
+
+    def entry(self, doctor_id):
+        """Heap entry of the doctor's first unclaimed free slot; () if none, None if the grid cannot tell."""
+        known = schedule.free_and_booked(doctor_id, self.date_from, self.date_to)
+        if known is None:
+            return None
+        free, booked = known
+        with _lock:
+            claimed = {claim for claim in _claimed if claim[0] == doctor_id}
+        for day, slot_type in free:
+            if (doctor_id, day, slot_type) not in claimed:
+                return (day, schedule.SLOT_BITS[slot_type], booked + len(claimed), doctor_id)
+        return ()
+
+    def fill(self):
+        """Pushes every active doctor of the department; False if a grid cannot cover the window."""
+        doctor_ids = db.session.scalars(select(User.id).where(
+            User.role == 'doctor', User.department_id == self.department_id, User.is_active_user == True)).all()
+        for doctor_id in doctor_ids:
+            entry = self.entry(doctor_id)
+            if entry is None:
+                return False
+            if entry:
+                self.heap.append(entry)
+        heapq.heapify(self.heap)
+        return True
+
+    def stale(self):
+        return time.monotonic() - self.built_at > current_app.config['ASSIGN_TTL'] or \
+            self.version != cache.version('doctors', 'schedule')
+
+    def take(self):
+        """
+        Call with self.lock held. Claims the best slot: (doctor_id, date, slot_type),
+        None when the window is full, False if a grid stopped covering it.
+        """
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            doctor_id = entry[3]
+            current = self.entry(doctor_id)
+            claim = (doctor_id, entry[0], schedule.SLOT_NAMES[entry[1]])
+            if current == entry and not _claim(claim):
+                # Claimed through an overlapping window since entry() looked
+                current = self.entry(doctor_id)
+            if current is None:
+                self.covered = False
+                return False
+            if current != entry:
+                # Booked or claimed since it was pushed: back in at its real place
+                if current:
+                    heapq.heappush(self.heap, current)
+                continue
+            following = self.entry(doctor_id)
+            if following:
+                heapq.heappush(self.heap, following)
+            return claim
+        return None
+
+    def pick(self):
+        """Fills the queue on first use, then take()s; False (and the queue is dropped) if the grids cannot serve it."""
+        with self.lock:
+            if self.covered is None:
+                self.covered = self.fill()
+            pick = self.take() if self.covered else False
+        if pick is False:
+            with _lock:
+                if _queues.get(self.key) is self:
+                    del _queues[self.key]
+        return pick
+
+
+def _claim(claim):
+    """Adds `claim` to _claimed; False if another thread holds it (e.g. from an overlapping window)."""
+    with _lock:
+        if claim in _claimed:
+            return False
+        _claimed.add(claim)
+        return True
+
+
+def _queue(department_id, date_from, date_to):
+    """The window's queue; a new, empty one (filled by its first pick()) when missing or stale."""
+    key = (department_id, date_from, date_to)
+    with _lock:
+        queue = _queues.get(key)
+        if queue is None or queue.stale():
+            # Drop the queues nobody used for a while along the way
+            for old in [k for k, q in _queues.items() if q.stale()]:
+                del _queues[old]
+            queue = _queues[key] = Queue(department_id, date_from, date_to)
+    return queue
+
+def _pick_from_database(department_id, date_from, date_to):
+    """The same choice on the free slot index: earliest slot, then the least-loaded doctor free at it."""
+    doctor_ids = []
+    while not doctor_ids:
+        first = free_slots.for_department(department_id, date_from, date_to).first()
+        if first is None:
+            return None
+        # Empty if the slot was booked between the two reads: look again
+        doctor_ids = [slot.doctor_id for slot in free_slots.for_department(department_id, first.available_date, first.available_date)
+                      .filter(FreeSlot.slot_type == first.slot_type)]
+    load = dict(db.session.execute(
+        select(Appointment.doctor_id, func.count()).where(
+            Appointment.doctor_id.in_(doctor_ids), Appointment.status == 'Scheduled',
+            Appointment.appointment_date >= date.today()).group_by(Appointment.doctor_id)).all())
+    doctor_id = min(doctor_ids, key=lambda d: (load.get(d, 0), d))
+    return doctor_id, first.available_date, first.slot_type
+
+def assign(patient_id, department_id, date_from=None, date_to=None):
+    """
+    Books the patient into the department's best free slot between date_from
+    (default today) and date_to (default ASSIGN_WINDOW_DAYS later); returns
+    the Appointment. Raises NoSlot, or SlotTaken if every try lost a race.
+    """
+    date_from = max(date_from or date.today(), date.today())
+    date_to = date_to or date_from + timedelta(days=current_app.config['ASSIGN_WINDOW_DAYS'] - 1)
+    if date_to < date_from:
+        raise NoSlot()
+    for _ in range(current_app.config['ASSIGN_ATTEMPTS']):
+        pick = _queue(department_id, date_from, date_to).pick()
+        # Picks from the database were never claimed; releasing one would drop another thread's claim
+        claimed = bool(pick)
+        if pick is False:
+            pick = _pick_from_database(department_id, date_from, date_to)
+        if pick is None:
+            raise NoSlot()
+        doctor_id, day, slot_type = pick
+        try:
+            return booking.book(patient_id, doctor_id, day, booking.slot_time(slot_type))
+        except booking.SlotTaken:
+            continue
+        finally:
+            if claimed:
+                with _lock:
+                    _claimed.discard(pick)
+    raise booking.SlotTaken()
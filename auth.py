@@ -0,0 +1,84 @@
+"""
+Auth routes: register, login, logout (blueprint 'auth', see app.create_app).
+"""
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_user, login_required, logout_user
+from models import db, User
+import passwords
+
+bp = Blueprint('auth', __name__)
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        email = request.form.get('email')
+
+        # Simple check: Does user exist?
+        if User.query.filter_by(email=email).first():
+            flash('Email already registered.', 'danger')
+            return redirect(url_for('auth.register'))
+
+        try:
+            password = passwords.hash_password(request.form.get('password') or '')
+        except passwords.Busy:
+            flash('Too many sign-ups right now. Please try again in a moment.', 'warning')
+            return render_template('register.html'), 503, passwords.busy_headers()
+
+        new_user = User(
+            username=request.form.get('username'),
+            email=email,
+            password=password,
+            role=request.form.get('role')
+        )
+        db.session.add(new_user)
+        db.session.commit()
+
+        flash('Account created! You can now log in.', 'success')
+        return redirect(url_for('auth.login'))
+
+    return render_template('register.html')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        user = User.query.filter_by(email=email).first()
+
+        # Guard Clause 1: User doesn't exist?
+        if not user:
+            flash('No account found.', 'warning')
+            return render_template('login.html')
+
+        # Guard Clause 2: Wrong password? (outdated hashes are upgraded here)
+        try:
+            valid = passwords.check(user, password)
+        except passwords.Busy:
+            flash('Too many sign-ins right now. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503, passwords.busy_headers()
+        if not valid:
+            flash('Incorrect password.', 'danger')
+            return render_template('login.html')
+
+        # Guard Clause 3: Account inactive?
+        if not user.is_active_user:
+            flash('Account deactivated. Contact admin.', 'danger')
+            return render_template('login.html')
+
+        # Success!
+        db.session.commit()  # saves an upgraded hash, if any
+        login_user(user)
+        flash('Login successful!', 'success')
+
+        if user.role == 'admin': return redirect(url_for('admin.admin_dashboard'))
+        if user.role == 'doctor': return redirect(url_for('doctor.doctor_dashboard'))
+        return redirect(url_for('patient.patient_dashboard'))
+
+    return render_template('login.html')
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    flash('You have been logged out.', 'info')
+    return redirect(url_for('auth.login'))
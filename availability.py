@@ -0,0 +1,61 @@
+"""
+Doctor availability writes.
+Saves only what changed: new slots go in with one bulk INSERT, unticked
+slots go out with one bulk DELETE, and dates outside the edited window
+(including past history) are never touched.
+"""
+from datetime import timedelta
+from sqlalchemy import delete, insert, tuple_
+from models import db, DoctorAvailability
+import free_slots
+
+SLOT_TYPES = ('Morning', 'Evening')
+MAX_TEMPLATE_WEEKS = 26
+
+def current_slots(doctor_id, days):
+    """{(date, slot_type)} the doctor has open on the given dates."""
+    rows = db.session.query(DoctorAvailability.available_date, DoctorAvailability.slot_type) \
+        .filter(DoctorAvailability.doctor_id == doctor_id, DoctorAvailability.available_date.in_(days)).all()
+    return {(d, s) for d, s in rows}
+
+def _apply(doctor_id, to_add, to_remove):
+    """Bulk insert/delete in the caller's transaction, then re-sync the touched free slots."""
+    if to_remove:
+        db.session.execute(delete(DoctorAvailability).where(
+            DoctorAvailability.doctor_id == doctor_id,
+            tuple_(DoctorAvailability.available_date, DoctorAvailability.slot_type).in_(sorted(to_remove))))
+    if to_add:
+        db.session.execute(insert(DoctorAvailability), [
+            {'doctor_id': doctor_id, 'available_date': d, 'slot_type': s} for d, s in sorted(to_add)])
+    # Bulk statements skip the flush hook, so refresh the free slot index here
+    free_slots.refresh(db.session.connection(), {(doctor_id, d) for d, _ in to_add | to_remove})
+
+def save_window(doctor_id, days, selected):
+    """
+    Makes the doctor's slots on `days` exactly `selected` ({(date, slot_type)}).
+    Selected slots on other dates or of unknown slot types are ignored.
+    Returns (added, removed) counts.
+    """
+    window = set(days)
+    selected = {(d, slot_type) for d, slot_type in selected if d in window and slot_type in SLOT_TYPES}
+    current = current_slots(doctor_id, days)
+    to_add = selected - current
+    to_remove = current - selected
+    _apply(doctor_id, to_add, to_remove)
+    db.session.commit()
+    return len(to_add), len(to_remove)
+
+def expand_weekly(doctor_id, weekdays, slot_types, start, weeks):
+    """
+    Opens `slot_types` on every `weekdays` (0=Monday) for `weeks` weeks from
+    `start`, e.g. Mondays Morning for 13 weeks. Existing slots are kept.
+    Returns the number of slots added.
+    """
+    weeks = min(weeks, MAX_TEMPLATE_WEEKS)
+    days = [start + timedelta(days=i) for i in range(weeks * 7)]
+    days = [d for d in days if d.weekday() in weekdays]
+    wanted = {(d, s) for d in days for s in slot_types}
+    to_add = wanted - current_slots(doctor_id, days)
+    _apply(doctor_id, to_add, set())
+    db.session.commit()
+    return len(to_add)
@@ -0,0 +1,232 @@
+"""
+Batch booking, cancelling and rescheduling for /api/appointments/batch.
+
+A batch of up to MAX_BATCH operations costs a fixed number of statements:
+one SELECT for the appointments it references, one for the roles of the
+doctors and patients it books, one for the Scheduled appointments holding
+the slots it targets, then one bulk INSERT, up to
+four bulk UPDATEs, the free slot refresh and the job queue INSERT, all in
+a single transaction.
+
+Operations are checked in order against an in-memory map of those slots, so
+a cancel followed by a booking of the same slot in one batch succeeds, and a
+reschedule may take the slot of an appointment the batch moves away later. An
+operation that fails validation or collides gets its own error result and
+is skipped; the rest are committed together. If a concurrent request takes
+one of the slots between the check and the write, the unique index rejects
+the whole batch and SlotTaken is raised - nothing is written. Other
+integrity errors are re-raised as they are.
+
+Scheduled appointments that move are first parked under PARKED_STATUS,
+which the unique slot index ignores, and then written to their new slots
+as Scheduled. So moves that trade slots (A to B's slot, B to A's) never
+collide halfway through; only the end state is checked.
+"""
+from datetime import datetime
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Appointment
+from booking import SlotTaken, slot_time
+import free_slots
+import jobs
+
+MAX_BATCH = 1000
+PARKED_STATUS = 'Moving'  # never committed: only between the two move UPDATEs
+
+def _parse_op(op):
+    """Normalises one operation dict; raises ValueError with a message for the caller."""
+    kind = op.get('op')
+    if kind not in ('book', 'cancel', 'reschedule'):
+        raise ValueError("op must be 'book', 'cancel' or 'reschedule'")
+    try:
+        if kind == 'book':
+            parsed = {'op': kind, 'id': None, 'doctor_id': int(op['doctor_id']), 'patient_id': int(op['patient_id'])}
+        else:
+            # Rescheduling keeps the doctor; only date and slot move
+            parsed = {'op': kind, 'id': int(op['id']), 'doctor_id': None, 'patient_id': None}
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('book needs doctor_id and patient_id; cancel and reschedule need id')
+    if kind != 'cancel':
+        try:
+            parsed['date'] = datetime.strptime(op.get('date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('Invalid date format. Use YYYY-MM-DD')
+        parsed['time'] = slot_time(op.get('slot'))
+    return parsed
+
+SLOT_TAKEN = {'status': 409, 'message': 'Slot already booked.'}
+
+def _walk(parsed, existing, roles, held, refused):
+    """
+    Checks the operations in order against `held` (slot -> Scheduled appointment
+    id, None for a new booking); `roles` maps the booked user ids to their role. Returns (results by index, inserts, insert_index,
+    updates, touched (doctor, date) pairs, displacing). A reschedule may take the
+    slot of another appointment of the batch that a later operation moves or
+    cancels away (a swap); `displacing` maps such operations to that slot for
+    _collisions(). Operations in `refused` get a 409 and are not applied.
+    """
+    held = dict(held)
+    results, inserts, insert_index, updates, touched, displacing = {}, [], {}, {}, set(), {}
+    for i, p in sorted(parsed.items()):
+        if i in refused:
+            results[i] = dict(SLOT_TAKEN, index=i)
+            continue
+        if p['op'] == 'book':
+            if roles.get(p['doctor_id']) != 'doctor' or roles.get(p['patient_id']) != 'patient':
+                results[i] = {'index': i, 'status': 400, 'message': 'doctor_id must be a doctor and patient_id a patient'}
+                continue
+            slot = (p['doctor_id'], p['date'], p['time'])
+            if slot in held:
+                results[i] = dict(SLOT_TAKEN, index=i)
+                continue
+            held[slot] = None
+            inserts.append({'patient_id': p['patient_id'], 'doctor_id': p['doctor_id'], 'appointment_date': p['date'],
+                            'appointment_time': p['time'], 'status': 'Scheduled'})
+            insert_index[slot] = i
+            touched.add(slot[:2])
+            results[i] = {'index': i, 'status': 201, 'message': 'Appointment created successfully'}
+            continue
+
+        appt = existing.get(p['id'])
+        if appt is None:
+            results[i] = {'index': i, 'status': 404, 'message': 'Appointment not found'}
+            continue
+        # State as left by earlier operations of this batch
+        change = updates.get(appt.id, {})
+        scheduled = change.get('status', appt.status) == 'Scheduled'
+        old_slot = (appt.doctor_id, change.get('appointment_date', appt.appointment_date),
+                    change.get('appointment_time', appt.appointment_time))
+
+        if p['op'] == 'cancel':
+            new_slot, values = None, {'status': 'Cancelled'}
+            results[i] = {'index': i, 'status': 200, 'id': appt.id, 'message': 'Appointment cancelled'}
+        else:
+            new_slot, values = (appt.doctor_id, p['date'], p['time']), {'appointment_date': p['date'], 'appointment_time': p['time']}
+            holder = held.get(new_slot, appt.id)
+            if scheduled and holder != appt.id:
+                if holder not in existing:
+                    results[i] = dict(SLOT_TAKEN, index=i)
+                    continue
+                displacing[i] = new_slot  # the holder has to leave it later in the batch
+            results[i] = {'index': i, 'status': 200, 'id': appt.id, 'message': 'Appointment updated'}
+
+        if scheduled:
+            if held.get(old_slot) == appt.id:
+                del held[old_slot]
+            if new_slot:
+                held[new_slot] = appt.id
+        updates.setdefault(appt.id, {'id': appt.id}).update(values)
+        touched.add(old_slot[:2])
+        if new_slot:
+            touched.add(new_slot[:2])
+    return results, inserts, insert_index, updates, touched, displacing
+
+def _collisions(existing, held, updates, inserts, displacing):
+    """The displacing operations whose slot ends the batch with two Scheduled appointments."""
+    final = {}
+    for slot, appt_id in held.items():
+        if appt_id not in updates:
+            final.setdefault(slot, []).append(appt_id)
+    for appt_id, change in updates.items():
+        appt = existing[appt_id]
+        if change.get('status', appt.status) == 'Scheduled':
+            slot = (appt.doctor_id, change.get('appointment_date', appt.appointment_date),
+                    change.get('appointment_time', appt.appointment_time))
+            final.setdefault(slot, []).append(appt_id)
+    for row in inserts:
+        final.setdefault((row['doctor_id'], row['appointment_date'], row['appointment_time']), []).append(None)
+    return {i for i, slot in displacing.items() if len(final.get(slot, ())) > 1}
+
+def _holders(slots):
+    """{(doctor_id, date, time): id} of the Scheduled appointments holding `slots`."""
+    if not slots:
+        return {}
+    rows = db.session.query(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time, Appointment.id) \
+        .filter(Appointment.status == 'Scheduled',
+                tuple_(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time).in_(sorted(slots))).all()
+    return {(d, day, t): appt_id for d, day, t, appt_id in rows}
+
+def apply_batch(operations):
+    """
+    Applies `operations` in order and returns one result dict per operation.
+    Slot checks see the effect of earlier operations in the same batch, so a
+    cancel followed by a book of the same slot succeeds, and appointments may
+    trade slots. Failed operations are skipped; the rest are committed together.
+    """
+    results = [None] * len(operations)
+    parsed = {}
+    for i, op in enumerate(operations):
+        try:
+            parsed[i] = _parse_op(op)
+        except ValueError as e:
+            results[i] = {'index': i, 'status': 400, 'message': str(e)}
+        except AttributeError:
+            results[i] = {'index': i, 'status': 400, 'message': 'Each operation must be an object'}
+
+    # 1. Appointments referenced by cancel/reschedule - one query
+    ids = {p['id'] for p in parsed.values() if p['id']}
+    existing = {a.id: a for a in Appointment.query.filter(Appointment.id.in_(ids))} if ids else {}
+    #    and the roles of the doctors and patients to book - one query
+    user_ids = {p[key] for p in parsed.values() if p['op'] == 'book' for key in ('doctor_id', 'patient_id')}
+    roles = dict(db.session.execute(select(User.id, User.role).where(User.id.in_(user_ids))).all()) if user_ids else {}
+
+    # 2. Who holds each targeted slot right now - one query
+    targets = {(p['doctor_id'] or existing[p['id']].doctor_id, p['date'], p['time'])
+               for p in parsed.values() if 'date' in p and (p['doctor_id'] or p['id'] in existing)}
+    held = _holders(targets)
+
+    # 3. Walk the batch in order against the in-memory slot map. If a swap does
+    #    not work out, its first operation is refused and the walk starts over
+    refused = set()
+    while True:
+        walked, inserts, insert_index, updates, touched, displacing = _walk(parsed, existing, roles, held, refused)
+        collided = _collisions(existing, held, updates, inserts, displacing)
+        if not collided:
+            break
+        refused.add(min(collided))
+    for i, result in walked.items():
+        results[i] = result
+
+    # 4. Write everything in one transaction. Order matters for the unique
+    #    index: cancellations free slots, moved appointments are parked off it,
+    #    then moves land and new bookings claim what is left.
+    cancels = [u for u in updates.values() if 'status' in u]
+    moves = [u for u in updates.values() if 'status' not in u]
+    scheduled_moves = [u for u in moves if existing[u['id']].status == 'Scheduled']
+    steps = (cancels,
+             [{'id': u['id'], 'status': PARKED_STATUS} for u in scheduled_moves],
+             [dict(u, status='Scheduled') for u in scheduled_moves],
+             [u for u in moves if existing[u['id']].status != 'Scheduled'])
+    queued = []
+    for u in updates.values():
+        appt = existing[u['id']]
+        day, t = u.get('appointment_date', appt.appointment_date), u.get('appointment_time', appt.appointment_time)
+        if 'status' in u:
+            if appt.status != 'Cancelled':
+                queued += jobs.appointment_jobs(appt.id, day, t, 'cancelled')
+        elif appt.status == 'Scheduled':
+            queued += jobs.appointment_jobs(appt.id, day, t, 'rescheduled')
+    try:
+        for rows in steps:
+            if rows:
+                db.session.execute(update(Appointment), rows)
+        if inserts:
+            # Each new booking holds a distinct slot, so the slot maps a returned row back to
+            # its operation (cheaper than sort_by_parameter_order, which goes row by row on SQLite)
+            created = db.session.execute(insert(Appointment).returning(
+                Appointment.id, Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time), inserts)
+            for new_id, doctor_id, day, t in created:
+                results[insert_index[(doctor_id, day, t)]]['id'] = new_id
+                queued += jobs.appointment_jobs(new_id, day, t, 'booked')
+        # Bulk statements skip the flush hooks that maintain the free slot index and queue notifications
+        free_slots.refresh(db.session.connection(), touched)
+        jobs.insert(db.session.connection(), queued)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # Only a slot a concurrent request took between our check and the write is a
+        # clash; same error class covers NOT NULL, foreign keys etc.
+        if _holders(targets) != held:
+            raise SlotTaken()
+        raise
+    return results
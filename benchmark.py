@@ -0,0 +1,518 @@
+"""
+Latency / throughput benchmark for the main pages and API calls.
+
+    python seed_data.py --patients 100000 --appointments 1000000   # once
+    python benchmark.py --requests 200 --out bench_results.json
+    python benchmark.py --baseline bench_results.json               # compare with an earlier run
+    python benchmark.py --url http://127.0.0.1:5000 --processes 8   # drive a running server over HTTP
+    python benchmark.py --servers dev gunicorn-sync gunicorn-gthread uvicorn --only api_appointments api_stats
+    python benchmark.py --password-methods pbkdf2:sha256:100000 scrypt:16384:8:1 scrypt:32768:8:1
+    python benchmark.py --conflict-checks --requests 10000
+    python benchmark.py --cold-start --requests 10
+    python benchmark.py --batch 100 --requests 20
+    python benchmark.py --availability --requests 200
+    python benchmark.py --indexes 1000000 --requests 50
+
+By default every scenario runs in-process through the Flask test client.
+With --url, --processes workers each log in and send requests over HTTP,
+so the server's worker model is included in the numbers.
+
+--servers starts each named server in turn (see SERVERS) on a local port and
+runs the scenarios against it over HTTP, to compare worker models on the
+same machine and data.
+
+--password-methods runs only the login scenario, once per hashing method,
+with --processes concurrent clients, to show what each cost factor does to
+login latency and throughput (503s mean the hashing pool was saturated).
+
+--conflict-checks times the slot conflict check itself, in-process: the
+SQL lookup (booking.is_taken) against the schedule grid (schedule.is_taken),
+on the same random (doctor, date, slot) samples. Any answer on which the two
+disagree is counted as an error.
+
+--cold-start starts a fresh interpreter per sample (see COLD_START_CASES)
+and times importing app.py, create_app() and the first request, with every
+route group or only the API, and with the template cache filled or disabled.
+
+--batch N books N slots per round, --requests rounds, twice: one
+booking.book() call (and commit) per slot, then one batch.apply_batch()
+call per round. Latencies are per round, so the two compare directly.
+
+--availability times saving a doctor's 7-day availability form with a few
+slots ticked or unticked: availability.save_window() (only the changes)
+against the old save, which deleted every slot of the doctor and inserted
+them again. Both keep the slots outside the window. Each sample is a random
+doctor from the busiest 500.
+
+--indexes N seeds a scratch SQLite file with N past appointments
+(seed_data.py, in a subprocess) and times each of migrate.py's HOT_LOOKUPS
+without the indexes of models.py, then with them (migrate.py creates them
+as on an upgrade). The scratch database is deleted afterwards.
+
+Note: the booking scenario and --batch write real appointments into the
+database, and --password-methods re-hashes the benchmark patient's password.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import json
+import random
+import statistics
+import time
+import multiprocessing
+from datetime import date, timedelta
+import http.cookiejar
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+import urllib.parse
+import urllib.request
+from sqlalchemy import func
+from app import create_app, precompile_templates
+from models import db, User, Appointment, DoctorAvailability
+import seed_data
+import passwords
+import booking
+import batch
+import schedule
+import availability
+import free_slots
+
+app = create_app()
+
+REGRESSION_PCT = 20  # p95 slower than baseline by more than this is flagged
+
+# Worker models for --servers; {port} and {workers} are filled in
+SERVERS = {
+    'dev': [sys.executable, '-c', 'from app import create_app; create_app().run(port={port}, threaded=True)'],
+    'gunicorn-sync': ['gunicorn', '-w', '{workers}', '-b', '127.0.0.1:{port}', 'wsgi:application'],
+    'gunicorn-gthread': ['gunicorn', '-w', '{workers}', '-k', 'gthread', '--threads', '8', '-b', '127.0.0.1:{port}', 'wsgi:application'],
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--workers', '{workers}', '--port', '{port}', '--log-level', 'warning'],
+}
+# Servers from requirements-optional.txt; skipped when not installed
+SERVER_PACKAGES = {'gunicorn-sync': 'gunicorn', 'gunicorn-gthread': 'gunicorn', 'uvicorn': 'uvicorn'}
+
+
+# --- TARGETS ---
+
+def pick_accounts():
+    """An admin, the busiest doctor and a patient with history, plus booking targets."""
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        doctor_id = Appointment.query.with_entities(Appointment.doctor_id) \
+            .group_by(Appointment.doctor_id).order_by(func.count().desc()).limit(1).scalar()
+        patient_id = Appointment.query.with_entities(Appointment.patient_id) \
+            .group_by(Appointment.patient_id).order_by(func.count().desc()).limit(1).scalar()
+        doctor, patient = db.session.get(User, doctor_id), db.session.get(User, patient_id)
+        doctors = [u.id for u in User.query.filter_by(role='doctor').limit(500)]
+        return {'admin': admin.email, 'doctor': doctor.email, 'patient': patient.email,
+                'patient_id': patient.id, 'doctors': doctors, 'department_id': doctor.department_id}
+
+def scenarios(accounts):
+    """name -> (role that runs it, function(session) building one request)."""
+    def book(_):
+        # Far-future random slot so most bookings succeed instead of colliding
+        day = date.today() + timedelta(days=random.randint(365, 3650))
+        slot = random.choice(['Morning', 'Evening'])
+        return 'POST', f"/book_appointment/{random.choice(accounts['doctors'])}", {'date': day.isoformat(), 'slot': slot}
+
+    return {
+        'login': (None, lambda _: ('POST', '/login', {'email': accounts['patient'], 'password': seed_data.PASSWORD})),
+        'admin_dashboard': ('admin', lambda _: ('GET', '/admin_dashboard', None)),
+        'doctor_dashboard': ('doctor', lambda _: ('GET', '/doctor_dashboard', None)),
+        'patient_dashboard': ('patient', lambda _: ('GET', '/patient_dashboard', None)),
+        'patient_history': ('doctor', lambda _: ('GET', f"/patient_history/{accounts['patient_id']}", None)),
+        'book_appointment': ('patient', book),
+        'api_appointments': ('admin', lambda _: ('GET', '/api/appointments', None)),
+        'api_stats': ('admin', lambda _: ('GET', '/api/stats', None)),
+        'api_free_slots': (None, lambda _: ('GET', f"/api/departments/{accounts['department_id']}/free_slots", None)),
+    }
+
+
+# --- DRIVERS ---
+
+class TestClientSession:
+    def __init__(self, email):
+        self.client = app.test_client()
+        if email:
+            self.send('POST', '/login', {'email': email, 'password': seed_data.PASSWORD})
+
+    def send(self, method, path, data):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code
+
+class HttpSession:
+    def __init__(self, base_url, email):
+        self.base_url = base_url.rstrip('/')
+        # Do not follow redirects: a 302 after login/booking is the measured response
+        no_redirect = type('NoRedirect', (urllib.request.HTTPRedirectHandler,), {'redirect_request': lambda *a: None})
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), no_redirect)
+        if email:
+            self.send('POST', '/login', {'email': email, 'password': seed_data.PASSWORD})
+
+    def send(self, method, path, data):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+def accounts_email(accounts, role):
+    return accounts[role] if role else None
+
+def run_scenario(make_session, build, count):
+    """Returns (latencies in seconds, wall seconds, error count) for `count` requests."""
+    session = make_session()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(count):
+        method, path, data = build(session)
+        t = time.perf_counter()
+        status = session.send(method, path, data)
+        latencies.append(time.perf_counter() - t)
+        if status >= 500:
+            errors += 1
+    return latencies, time.perf_counter() - started, errors
+
+def _http_worker(args):
+    base_url, email, name, accounts, count, seed = args
+    random.seed(seed)
+    build = scenarios(accounts)[name][1]
+    return run_scenario(lambda: HttpSession(base_url, email), build, count)
+
+
+def password_sweep(accounts, methods, clients, count):
+    """Login scenario per hashing method, `clients` concurrent test clients each sending `count`."""
+    build = scenarios(accounts)['login'][1]
+    results = {}
+    for method in methods:
+        with app.app_context():
+            app.config['PASSWORD_METHOD'] = method
+            user = User.query.filter_by(email=accounts['patient']).first()
+            user.password = passwords.hash_password(seed_data.PASSWORD)
+            db.session.commit()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            parts = list(pool.map(lambda _: run_scenario(lambda: TestClientSession(None), build, count), range(clients)))
+        wall = time.perf_counter() - started
+        results[f'login[{method}]'] = summarize([x for part in parts for x in part[0]], wall, sum(part[2] for part in parts))
+    return results
+
+def conflict_sweep(accounts, count):
+    """booking.is_taken (SQL) vs schedule.is_taken (grid) on `count` random slots of the horizon."""
+    with app.app_context():
+        schedule.warm()
+        horizon = app.config['SCHEDULE_HORIZON_DAYS']
+        samples = [(random.choice(accounts['doctors']), date.today() + timedelta(days=random.randrange(horizon)),
+                    booking.slot_time(random.choice(['Morning', 'Evening']))) for _ in range(count)]
+        answers, results = {}, {}
+        for name, check in (('sql', booking.is_taken), ('grid', schedule.is_taken)):
+            latencies = []
+            started = time.perf_counter()
+            for sample in samples:
+                t = time.perf_counter()
+                answers.setdefault(name, []).append(check(*sample))
+                latencies.append(time.perf_counter() - t)
+            results[f'conflict_check[{name}]'] = summarize(latencies, time.perf_counter() - started, 0)
+        results['conflict_check[grid]']['errors'] = sum(a != b for a, b in zip(answers['sql'], answers['grid']))
+    return results
+
+def batch_sweep(accounts, size, count):
+    """`count` rounds of `size` bookings: one booking.book() per slot vs one batch.apply_batch() per round."""
+    # Distinct slots far beyond the booking scenario's range, so nothing collides
+    slots = set()
+    while len(slots) < 2 * size * count:
+        slots.add((random.choice(accounts['doctors']), date.today() + timedelta(days=random.randint(3650, 36500)),
+                   random.choice(['Morning', 'Evening'])))
+    slots = list(slots)
+    rounds = {'single': slots[:size * count], 'batch': slots[size * count:]}
+    results = {}
+    with app.app_context():
+        for name, picked in rounds.items():
+            latencies, errors = [], 0
+            started = time.perf_counter()
+            for start in range(0, len(picked), size):
+                chunk = picked[start:start + size]
+                t = time.perf_counter()
+                if name == 'single':
+                    for doctor_id, day, slot in chunk:
+                        try:
+                            booking.book(accounts['patient_id'], doctor_id, day, booking.slot_time(slot))
+                        except booking.SlotTaken:
+                            errors += 1
+                else:
+                    done = batch.apply_batch([{'op': 'book', 'doctor_id': doctor_id, 'patient_id': accounts['patient_id'],
+                                               'date': day.isoformat(), 'slot': slot} for doctor_id, day, slot in chunk])
+                    errors += sum(r['status'] != 201 for r in done)
+                latencies.append(time.perf_counter() - t)
+            results[f'booking[{name}x{size}]'] = summarize(latencies, time.perf_counter() - started, errors)
+    return results
+
+def reinsert_window(doctor_id, days, selected):
+    """The old availability save: delete all of the doctor's slots, add back the rest plus `selected`."""
+    before = {(a.available_date, a.slot_type) for a in DoctorAvailability.query.filter_by(doctor_id=doctor_id)}
+    after = {(d, slot) for d, slot in before if d not in days} | selected
+    DoctorAvailability.query.filter_by(doctor_id=doctor_id).delete()
+    db.session.add_all(DoctorAvailability(doctor_id=doctor_id, available_date=d, slot_type=slot) for d, slot in after)
+    db.session.flush()
+    # The bulk delete skips the flush hook
+    free_slots.refresh(db.session.connection(), {(doctor_id, d) for d, _ in before | after})
+    db.session.commit()
+
+def availability_sweep(accounts, count):
+    """`count` saves of the 7-day availability form: availability.save_window vs delete-all and reinsert."""
+    days = [date.today() + timedelta(days=i) for i in range(7)]
+    results = {}
+    with app.app_context():
+        for name, save in (('diff', availability.save_window), ('reinsert', reinsert_window)):
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(count):
+                doctor_id = random.choice(accounts['doctors'])
+                # The form as the doctor sees it, with a few boxes flipped
+                current = availability.current_slots(doctor_id, days)
+                flipped = {(d, slot) for d in days for slot in availability.SLOT_TYPES if random.random() < 0.2}
+                db.session.commit()
+                t = time.perf_counter()
+                save(doctor_id, days, current ^ flipped)
+                latencies.append(time.perf_counter() - t)
+            results[f'availability_save[{name}]'] = summarize(latencies, time.perf_counter() - started, 0)
+    return results
+
+# Run in a fresh interpreter per sample: argv = route groups, path of the first request
+COLD_START_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(blueprints=[name for name in sys.argv[1].split(',') if name])
+created = time.perf_counter()
+status = application.test_client().get(sys.argv[2]).status_code
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': time.perf_counter() - created, 'status': status}))
+'''
+
+# name -> (route groups, first request, template cache on)
+COLD_START_CASES = {
+    'all': ('auth,admin,doctor,patient,api', '/login', True),
+    'all-no-template-cache': ('auth,admin,doctor,patient,api', '/login', False),
+    'api': ('api', '/api/departments/1/free_slots', True),
+}
+
+def cold_start_sweep(count):
+    """'cold_start[<case>]:<phase>' -> summary over `count` fresh processes per case."""
+    precompile_templates(app)
+    results = {}
+    for case, (groups, path, template_cache) in COLD_START_CASES.items():
+        env = dict(os.environ, HMS_TEMPLATE_CACHE=str(template_cache).lower())
+        phases, errors = {}, 0
+        for _ in range(count):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', COLD_START_PROBE, groups, path],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            timings = json.loads(output.splitlines()[-1])
+            timings['process'] = time.perf_counter() - started
+            errors += timings.pop('status') >= 500
+            for phase, seconds in timings.items():
+                phases.setdefault(phase, []).append(seconds)
+        for phase, latencies in phases.items():
+            results[f'cold_start[{case}]:{phase}'] = summarize(latencies, 0, errors)
+    return results
+
+
+# Run against the scratch database: argv = samples per lookup
+INDEX_PROBE = '''
+import json, sys, time
+from sqlalchemy import text
+from app import create_app
+from models import db, Appointment, DoctorAvailability
+import migrate
+count = int(sys.argv[1])
+timings = {}
+with create_app(blueprints=()).app_context():
+    for phase in ('without', 'with'):
+        if phase == 'without':
+            for model in (Appointment, DoctorAvailability):
+                for index in model.__table__.indexes:
+                    index.drop(db.engine, checkfirst=True)
+        else:
+            migrate.create_missing_indexes()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        for name, build in migrate.HOT_LOOKUPS.items():
+            samples = []
+            for _ in range(count):
+                started = time.perf_counter()
+                build().all()
+                samples.append(time.perf_counter() - started)
+            timings[f'{name}:{phase}'] = samples
+print(json.dumps(timings))
+'''
+
+def index_sweep(rows, count):
+    """'indexes[<lookup>]:<without|with>' -> summary of `count` runs, on a scratch database of `rows` appointments."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    scratch = tempfile.mkdtemp(prefix='hms-index-bench-')
+    env = dict(os.environ, HMS_DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+    try:
+        subprocess.run([sys.executable, 'seed_data.py', '--appointments', str(rows), '--patients', str(max(rows // 100, 1000))],
+                       cwd=here, env=env, check=True, stdout=subprocess.DEVNULL)
+        output = subprocess.run([sys.executable, '-c', INDEX_PROBE, str(count)],
+                                cwd=here, env=env, check=True, capture_output=True, text=True).stdout
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    results = {}
+    for key, latencies in json.loads(output.splitlines()[-1]).items():
+        lookup, _, phase = key.rpartition(':')
+        results[f'indexes[{lookup}]:{phase}'] = summarize(latencies, 0, 0)
+    return results
+
+def run_http(url, names, plan, accounts, processes, count):
+    """Scenario name -> summary, each driven by `processes` HTTP client processes."""
+    results = {}
+    for name in names:
+        email = accounts_email(accounts, plan[name][0])
+        jobs = [(url, email, name, accounts, count, i) for i in range(processes)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            parts = pool.map(_http_worker, jobs)
+        wall = time.perf_counter() - started
+        results[name] = summarize([x for part in parts for x in part[0]], wall, sum(part[2] for part in parts))
+    return results
+
+def start_server(name, port, workers):
+    command = [part.format(port=port, workers=workers) for part in SERVERS[name]]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and server.poll() is None:
+        # Ready once a worker answers, not just when the port is bound
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=2) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'{name} did not start: {" ".join(command)}')
+
+def compare_servers(names, plan, accounts, servers, workers, processes, count, port=8765):
+    """'<server>:<scenario>' -> summary for every server model in `servers`."""
+    results = {}
+    for server_name in servers:
+        package = SERVER_PACKAGES.get(server_name)
+        if package and find_spec(package) is None:
+            print(f'{server_name}: skipped, {package} is not installed (pip install -r requirements-optional.txt)')
+            continue
+        server = start_server(server_name, port, workers)
+        try:
+            for name, r in run_http(f'http://127.0.0.1:{port}', names, plan, accounts, processes, count).items():
+                results[f'{server_name}:{name}'] = r
+                show(f'{server_name}:{name}', r)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+# --- REPORTING ---
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies, wall, errors):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(values) * 1000, 3) if values else 0.0,
+        'throughput_rps': round(len(values) / wall, 1) if wall else 0.0,
+    }
+
+def show(name, r):
+    print(f"{name:<18} p50 {r['p50_ms']:>8.3f}  p95 {r['p95_ms']:>8.3f}  p99 {r['p99_ms']:>8.3f} ms"
+          f"  {r['throughput_rps']:>8.1f} req/s  errors {r['errors']}")
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['scenarios']
+    print(f'\nvs {baseline_path}:')
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        flag = '  <-- REGRESSION' if change > REGRESSION_PCT else ''
+        print(f"  {name:<18} p95 {before['p95_ms']:>8.3f} -> {current['p95_ms']:>8.3f} ms ({change:+.0f}%){flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario (per process with --url)')
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--url', help='benchmark a running server over HTTP instead of the test client')
+    parser.add_argument('--processes', type=int, default=4, help='HTTP driver processes (with --url) / login clients (with --password-methods)')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', help='earlier results file to compare p95 against')
+    parser.add_argument('--servers', nargs='*', choices=sorted(SERVERS), help='compare these server worker models over HTTP')
+    parser.add_argument('--workers', type=int, default=4, help='server worker processes (with --servers)')
+    parser.add_argument('--password-methods', nargs='*', help='only benchmark login, once per password hashing method')
+    parser.add_argument('--conflict-checks', action='store_true', help='only time slot conflict checks: SQL vs. schedule grid')
+    parser.add_argument('--cold-start', action='store_true', help='only time import, create_app() and first request in fresh processes')
+    parser.add_argument('--availability', action='store_true', help="only time saving a doctor's availability: diff vs. delete-all and reinsert")
+    parser.add_argument('--indexes', type=int, nargs='?', const=1000000, metavar='ROWS',
+                        help="only time migrate.py's hot lookups without and with the indexes, on a scratch database of ROWS appointments")
+    parser.add_argument('--batch', type=int, metavar='N', help='only time booking N slots per round: one call each vs. one batch')
+    args = parser.parse_args()
+
+    accounts = pick_accounts()
+    plan = scenarios(accounts)
+    names = args.only or list(plan)
+    results = {}
+
+    if args.password_methods or args.conflict_checks or args.cold_start or args.batch or args.availability or args.indexes:
+        names = []
+        if args.password_methods:
+            results = password_sweep(accounts, args.password_methods, args.processes, args.requests)
+        elif args.conflict_checks:
+            results = conflict_sweep(accounts, args.requests)
+        elif args.batch:
+            results = batch_sweep(accounts, args.batch, args.requests)
+        elif args.availability:
+            results = availability_sweep(accounts, args.requests)
+        elif args.indexes:
+            results = index_sweep(args.indexes, args.requests)
+        else:
+            results = cold_start_sweep(args.requests)
+        for name, r in results.items():
+            show(name, r)
+    elif args.servers:
+        results = compare_servers(names, plan, accounts, args.servers, args.workers, args.processes, args.requests)
+        names = []
+
+    for name in names:
+        role, build = plan[name]
+        email = accounts_email(accounts, role)
+        if args.url:
+            results.update(run_http(args.url, [name], plan, accounts, args.processes, args.requests))
+        else:
+            results[name] = summarize(*run_scenario(lambda: TestClientSession(email), build, args.requests))
+        show(name, results[name])
+
+    with open(args.out, 'w') as f:
+        json.dump({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'driver': args.url or ','.join(args.servers or []) or 'test_client',
+                   'processes': args.processes if args.url or args.servers or args.password_methods else 1, 'scenarios': results}, f, indent=2)
+    print(f'\nSaved {args.out}')
+    if args.baseline:
+        compare(results, args.baseline)
@@ -0,0 +1,80 @@
+"""
+Slot reservation shared by the booking/reschedule routes and AppointmentAPI.
+
+A doctor's slot is claimed by the write itself: the partial UNIQUE index
+uq_appointments_scheduled_slot allows at most one 'Scheduled' appointment per
+(doctor_id, appointment_date, appointment_time). Two concurrent requests can
+both pass any SELECT, but only one COMMIT succeeds - the other gets SlotTaken.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from models import db, Appointment, SLOT_TIMES
+import schedule
+
+class SlotTaken(Exception):
+    """The doctor already has a Scheduled appointment at that date and time."""
+
+def slot_time(slot_type):
+    # Anything that is not 'Morning' has always meant the evening slot
+    return SLOT_TIMES['Morning'] if slot_type == 'Morning' else SLOT_TIMES['Evening']
+
+def is_taken(doctor_id, appt_date, appt_time, exclude_id=None):
+    query = Appointment.query.filter_by(doctor_id=doctor_id, appointment_date=appt_date,
+                                        appointment_time=appt_time, status='Scheduled')
+    if exclude_id:
+        query = query.filter(Appointment.id != exclude_id)
+    return db.session.query(query.exists()).scalar()
+
+def _claims_slot(appt):
+    """True if committing `appt` makes it hold a slot it does not hold already."""
+    if appt.status != 'Scheduled':
+        return False
+    state = inspect(appt)
+    if state.transient or state.pending:
+        return True
+    def before(name):
+        history = state.attrs[name].history
+        return history.deleted[0] if history.deleted else getattr(appt, name)
+    return before('status') != 'Scheduled' or \
+        (before('doctor_id'), before('appointment_date'), before('appointment_time')) != \
+        (appt.doctor_id, appt.appointment_date, appt.appointment_time)
+
+def commit_slot(appt):
+    """
+    Commits the pending change to `appt`. If the slot is held by another
+    Scheduled appointment - per the schedule grid, or the database rejecting
+    the write - rolls back and raises SlotTaken.
+    """
+    # Read before COMMIT: a rollback expires the object
+    appt_id, doctor_id = appt.id, appt.doctor_id
+    appt_date, appt_time = appt.appointment_date, appt.appointment_time
+    # Known clashes are refused without a write; unknown ones are left to the unique index
+    if _claims_slot(appt) and schedule.is_taken(doctor_id, appt_date, appt_time):
+        db.session.rollback()
+        raise SlotTaken()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # Same error class covers NOT NULL etc. - only translate real slot clashes
+        if is_taken(doctor_id, appt_date, appt_time, exclude_id=appt_id):
+            raise SlotTaken()
+        raise
+
+def book(patient_id, doctor_id, appt_date, appt_time):
+    appt = Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_date=appt_date,
+        appointment_time=appt_time,
+        status='Scheduled'
+    )
+    db.session.add(appt)
+    commit_slot(appt)
+    return appt
+
+def reschedule(appt, new_date, new_time):
+    appt.appointment_date = new_date
+    appt.appointment_time = new_time
+    commit_slot(appt)
+    return appt
@@ -0,0 +1,218 @@
+"""
+Page and fragment caching for read-mostly pages.
+
+Fragments: fragment(name, deps, render) returns cached HTML for the
+data-driven part of a page (department cards, a department's doctor list,
+a doctor profile), so a hit costs no SQL and no template rendering. The
+layout around it (navbar, flashed messages) is still rendered per user.
+
+Conditional GET: @conditional(*deps) gives a page an ETag built from the URL,
+the viewer's identity and the versions of its dependencies, and answers a
+matching If-None-Match with 304 before the view runs.
+
+Invalidation is by version: every dependency ('departments', 'doctors') has
+a version stamp that is part of every key and ETag built on it, so bumping it
+retires them all at once. Writes to Department rows, or to doctor rows,
+bump on commit. The stamps are file mtimes under CACHE_DIR, so all worker
+processes see a bump immediately (one stat per dependency, no SQL).
+
+Backends: 'memory' (per-process LRU, CACHE_SIZE entries) or 'disk' (files
+under CACHE_DIR, shared by all worker processes). Entries live CACHE_TTL
+seconds either way.
+"""
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import User, Department
+import replicas
+
+# Doctor columns that show up on cached pages (not password, phone, ...)
+DOCTOR_FIELDS = ('username', 'email', 'role', 'department_id', 'is_active_user')
+
+_settings = {'backend': 'memory', 'dir': None, 'size': 1000, 'ttl': 300, 'build': ''}
+_lock = threading.Lock()
+_memory = OrderedDict()  # key -> (expires, value)
+_writes = 0
+
+
+def init_app(app):
+    _settings['backend'] = app.config['CACHE_BACKEND']
+    _settings['size'] = app.config['CACHE_SIZE']
+    _settings['ttl'] = app.config['CACHE_TTL']
+    _settings['dir'] = app.config['CACHE_DIR'] or os.path.join(app.instance_path, 'cache')
+    os.makedirs(os.path.join(_settings['dir'], 'versions'), exist_ok=True)
+    # Templates are part of every ETag, so a deploy with new templates never gets a stale 304
+    stamps = [os.stat(os.path.join(root, name)).st_mtime_ns
+              for root, _, files in os.walk(app.jinja_loader.searchpath[0]) for name in files]
+    _settings['build'] = str(max(stamps, default=0))
+
+
+# --- VERSIONS ---
+
+def _version_path(name):
+    return os.path.join(_settings['dir'], 'versions', name)
+
+def version(*deps):
+    stamps = []
+    for name in deps:
+        try:
+            stamps.append(str(os.stat(_version_path(name)).st_mtime_ns))
+        except FileNotFoundError:
+            stamps.append('0')
+    return '.'.join(stamps)
+
+def bump(*deps):
+    for name in deps:
+        path = _version_path(name)
+        with open(path, 'a'):
+            pass
+        # Strictly increasing even when two bumps land in the same clock tick
+        stamp = max(time.time_ns(), os.stat(path).st_mtime_ns + 1)
+        os.utime(path, ns=(stamp, stamp))
+
+
+# --- BACKENDS ---
+
+def load(key):
+    now = time.time()
+    if _settings['backend'] == 'disk':
+        try:
+            with open(_disk_path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if expires > now else None
+    with _lock:
+        entry = _memory.get(key)
+        if not entry or entry[0] <= now:
+            return None
+        _memory.move_to_end(key)
+        return entry[1]
+
+def store(key, value):
+    global _writes
+    expires = time.time() + _settings['ttl']
+    if _settings['backend'] == 'disk':
+        # Write-then-rename so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=_settings['dir'])
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires, value), f)
+        os.replace(tmp, _disk_path(key))
+        _writes += 1
+        if _writes % 100 == 0:
+            _prune_disk()
+        return
+    with _lock:
+        _memory[key] = (expires, value)
+        _memory.move_to_end(key)
+        while len(_memory) > _settings['size']:
+            _memory.popitem(last=False)
+
+def clear():
+    with _lock:
+        _memory.clear()
+
+def _disk_path(key):
+    return os.path.join(_settings['dir'], hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+def _prune_disk():
+    """Removes expired files; keys under old versions are never read again."""
+    cutoff = time.time() - _settings['ttl']
+    for entry in os.scandir(_settings['dir']):
+        if entry.name.endswith('.cache') and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+# --- FRAGMENTS / CONDITIONAL GET ---
+
+def fragment(name, deps, render):
+    """Cached HTML of render() for `name` (e.g. 'doctor_profile:4'), rebuilt when a dep changes."""
+    key = f'fragment:{name}:{version(*deps)}'
+    html = load(key)
+    if html is None:
+        # From the primary: a lagging replica's page would be cached under the new version
+        with replicas.primary():
+            html = render()
+        store(key, html)
+    return Markup(html)
+
+def conditional(*deps):
+    """ETag / If-None-Match for a page whose data comes from `deps`. Goes below @login_required."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message makes the page one-off: render it, no validator
+            if '_flashes' in session:
+                return view(*args, **kwargs)
+            viewer = f'{current_user.id}:{current_user.role}:{current_user.username}' if current_user.is_authenticated else '-'
+            seed = f'{request.full_path}|{viewer}|{_settings["build"]}|{version(*deps)}'
+            tag = hashlib.sha1(seed.encode()).hexdigest()
+            if request.if_none_match.contains(tag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(tag)
+            # Per-user navbar: browsers may keep it, shared proxies may not
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+# --- INVALIDATION ---
+
+def bump_on_commit(session, *deps):
+    """Bumps `deps` once `session` commits; nothing if it rolls back."""
+    session.info.setdefault('cache_bumps', set()).update(deps)
+
+def _changed_deps(obj, added_or_deleted):
+    if isinstance(obj, Department):
+        return {'departments'}
+    if isinstance(obj, User):
+        state = inspect(obj)
+        roles = {obj.role, *(state.attrs.role.history.deleted or ())}
+        if 'doctor' in roles and (added_or_deleted or
+                                  any(state.attrs[f].history.has_changes() for f in DOCTOR_FIELDS)):
+            return {'doctors'}
+    return set()
+
+@event.listens_for(Session, 'after_flush')
+def _collect_on_flush(session, flush_context):
+    # Still the pre-flush new/dirty/deleted lists and attribute history here
+    changes = [(obj, True) for obj in list(session.new) + list(session.deleted)] + [(obj, False) for obj in session.dirty]
+    for obj, added_or_deleted in changes:
+        deps = _changed_deps(obj, added_or_deleted)
+        if deps:
+            bump_on_commit(session, *deps)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_on_bulk(orm_execute_state):
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (User, Department):
+        bump_on_commit(orm_execute_state.session, 'doctors' if mapper.class_ is User else 'departments')
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    # Only committed data may be cached again under the new version
+    bumps = session.info.pop('cache_bumps', None)
+    if bumps and _settings['dir']:
+        bump(*bumps)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('cache_bumps', None)
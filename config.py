@@ -0,0 +1,165 @@
+"""
+App and database configuration.
+
+Every setting can be overridden with an environment variable of the same
+name prefixed with HMS_ (e.g. HMS_DATABASE_URL), or from a Python config
+file named by HMS_CONFIG, which is loaded last.
+
+    HMS_DATABASE_URL=postgresql+psycopg2://hms:secret@db/hms python app.py
+"""
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Bind keys of the read replicas: replica-1, replica-2, ... (see replicas.py)
+REPLICA_BIND_PREFIX = 'replica-'
+
+def env(name, default, cast=str):
+    value = os.environ.get(f'HMS_{name}')
+    if value is None:
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+class Config:
+    SECRET_KEY = env('SECRET_KEY', 'Hari')
+    SQLALCHEMY_DATABASE_URI = env('DATABASE_URL', 'sqlite:///site.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Read replicas (see replicas.py): comma-separated URLs, empty = primary only
+    DATABASE_REPLICA_URLS = env('DATABASE_REPLICA_URLS', '')
+    REPLICA_STICKY_SECONDS = env('REPLICA_STICKY_SECONDS', 10, int)  # after a user's write, their reads stay on the primary
+    STATS_CACHE_TTL = env('STATS_CACHE_TTL', 30, int)  # seconds the dashboard aggregates are reused
+
+    # Application factory (see app.py)
+    BLUEPRINTS = env('BLUEPRINTS', 'auth,admin,doctor,patient,api')  # route groups create_app() registers
+    TEMPLATE_CACHE = env('TEMPLATE_CACHE', True, bool)  # compiled templates kept on disk across restarts
+    TEMPLATE_CACHE_DIR = env('TEMPLATE_CACHE_DIR', None)  # default: <instance>/templates
+
+    # Requests over either limit are logged to 'hms.slow' (see metrics.py)
+    SLOW_REQUEST_MS = env('SLOW_REQUEST_MS', 500, int)
+    SLOW_REQUEST_QUERIES = env('SLOW_REQUEST_QUERIES', 25, int)
+
+    # Session user cache (see identity.py)
+    SESSION_CACHE_SIZE = env('SESSION_CACHE_SIZE', 10000, int)
+    SESSION_CACHE_TTL = env('SESSION_CACHE_TTL', 60, int)  # seconds
+    SESSION_CACHE_SHARED = env('SESSION_CACHE_SHARED', True, bool)  # invalidations reach other worker processes
+
+    # Page / fragment cache (see cache.py)
+    CACHE_BACKEND = env('CACHE_BACKEND', 'memory')  # 'memory' (per process) or 'disk' (shared)
+    CACHE_DIR = env('CACHE_DIR', None)  # default: <instance>/cache; also holds the version stamps
+    CACHE_SIZE = env('CACHE_SIZE', 1000, int)  # entries, memory backend
+    CACHE_TTL = env('CACHE_TTL', 300, int)  # seconds
+
+    # Password hashing (see passwords.py). Cost is part of the method string:
+    # scrypt:N:r:p (memory N*r*128 bytes per hash) or pbkdf2:sha256:iterations
+    PASSWORD_METHOD = env('PASSWORD_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_WORKERS = env('PASSWORD_WORKERS', os.cpu_count() or 2, int)
+    PASSWORD_MAX_PENDING = env('PASSWORD_MAX_PENDING', 32, int)  # running + queued; more is refused
+
+    # Stored patient timelines (see timeline.py)
+    TIMELINE_TTL = env('TIMELINE_TTL', 24 * 3600, int)  # seconds; rebuilt from the tables after this
+
+    # In-process schedule grid for slot checks (see schedule.py)
+    SCHEDULE_GRID = env('SCHEDULE_GRID', True, bool)
+    SCHEDULE_HORIZON_DAYS = env('SCHEDULE_HORIZON_DAYS', 90, int)  # beyond this, checks go to the database
+    SCHEDULE_TTL = env('SCHEDULE_TTL', 300, int)  # seconds; bounds staleness from writes outside the ORM
+
+    # Automatic doctor assignment (see assign.py)
+    ASSIGN_WINDOW_DAYS = env('ASSIGN_WINDOW_DAYS', 14, int)  # default window, from its first day
+    ASSIGN_TTL = env('ASSIGN_TTL', 60, int)  # seconds a department's queue is reused; bounds missed cancellations
+    ASSIGN_ATTEMPTS = env('ASSIGN_ATTEMPTS', 5, int)  # slots tried while other workers win the race
+
+    # Background jobs (see jobs.py)
+    JOB_WORKERS = env('JOB_WORKERS', 2, int)  # processes started by `python jobs.py`
+    JOB_POLL_SECONDS = env('JOB_POLL_SECONDS', 1.0, float)  # idle wait between queue checks
+    JOB_BATCH = env('JOB_BATCH', 10, int)  # jobs claimed per round trip
+    JOB_MAX_ATTEMPTS = env('JOB_MAX_ATTEMPTS', 5, int)
+    JOB_BACKOFF_SECONDS = env('JOB_BACKOFF_SECONDS', 30, int)  # first retry; doubles per attempt
+    JOB_BACKOFF_MAX = env('JOB_BACKOFF_MAX', 3600, int)
+    JOB_LEASE_SECONDS = env('JOB_LEASE_SECONDS', 300, int)  # 'running' longer than this: worker died, requeue
+    JOB_KEEP_DAYS = env('JOB_KEEP_DAYS', 7, int)  # finished jobs are pruned after this
+    REMINDER_HOURS = env('REMINDER_HOURS', 24, int)  # appointment reminder lead time
+    NIGHTLY_REPORT_HOUR = env('NIGHTLY_REPORT_HOUR', 2, int)  # local time
+    REPORTS_DIR = env('REPORTS_DIR', None)  # default: <instance>/reports
+
+    # Archive of old appointments (see archive.py). Default: instance/archive.db
+    # with SQLite, otherwise archive tables in DATABASE_URL itself
+    ARCHIVE_DATABASE_URL = env('ARCHIVE_DATABASE_URL', None)
+    ARCHIVE_AFTER_DAYS = env('ARCHIVE_AFTER_DAYS', 365, int)  # Completed/Cancelled visits older than this
+    ARCHIVE_BATCH = env('ARCHIVE_BATCH', 1000, int)  # appointments moved per transaction
+    ARCHIVE_HOUR = env('ARCHIVE_HOUR', 3, int)  # local time of the nightly archive job
+
+    # asgi.py only: async driver URL. Default: DATABASE_URL with aiosqlite / asyncpg
+    ASYNC_DATABASE_URL = env('ASYNC_DATABASE_URL', None)
+
+    # Connection pool
+    DB_POOL_SIZE = env('DB_POOL_SIZE', 10, int)
+    DB_MAX_OVERFLOW = env('DB_MAX_OVERFLOW', 20, int)
+    DB_POOL_RECYCLE = env('DB_POOL_RECYCLE', 1800, int)  # seconds; stay under server idle timeouts
+    DB_POOL_PRE_PING = env('DB_POOL_PRE_PING', True, bool)
+
+    # SQLite only - applied to every new connection
+    SQLITE_WAL = env('SQLITE_WAL', True, bool)
+    SQLITE_SYNCHRONOUS = env('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = env('SQLITE_BUSY_TIMEOUT_MS', 5000, int)
+    SQLITE_MMAP_SIZE = env('SQLITE_MMAP_SIZE', 256 * 1024 * 1024, int)  # bytes, 0 disables
+    SQLITE_CACHE_SIZE_KB = env('SQLITE_CACHE_SIZE_KB', 64 * 1024, int)
+
+def load(app):
+    app.config.from_object(Config)
+    app.config.from_envvar('HMS_CONFIG', silent=True)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    archive_url = app.config['ARCHIVE_DATABASE_URL'] or default_archive_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault('archive', {'url': archive_url, **engine_options(app.config, archive_url)})
+    urls = [url.strip() for url in app.config['DATABASE_REPLICA_URLS'].split(',') if url.strip()]
+    for number, url in enumerate(urls, 1):
+        binds.setdefault(f'{REPLICA_BIND_PREFIX}{number}', {'url': url, **engine_options(app.config, url)})
+
+def default_archive_url(database_url):
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        # Next to the live file (relative paths resolve against instance/ as well)
+        return url.set(database=os.path.join(os.path.dirname(url.database), 'archive.db')).render_as_string(hide_password=False)
+    return database_url
+
+def engine_options(config, url=None):
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        # In-memory SQLite is one connection shared by the pool - no sizing
+        if not url.database or url.database == ':memory:':
+            return {}
+        # SQLite waits on its own busy timeout, so a recycle/pre-ping adds nothing
+        return {'pool_size': config['DB_POOL_SIZE'], 'max_overflow': config['DB_MAX_OVERFLOW'],
+                'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+def init_engine(app, engine):
+    """Registers the SQLite PRAGMAs on `engine`; a no-op for other backends."""
+    if engine.dialect.name != 'sqlite':
+        return
+    config = app.config
+    synchronous = str(config['SQLITE_SYNCHRONOUS']).upper()
+
+    @event.listens_for(engine, 'connect')
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # pysqlite, or the aiosqlite adapter of the async engine (asgi.py)
+        if not isinstance(dbapi_connection, sqlite3.Connection) and engine.dialect.driver != 'aiosqlite':
+            return
+        cursor = dbapi_connection.cursor()
+        if config['SQLITE_WAL']:
+            # Readers no longer block the writer (and vice versa)
+            cursor.execute('PRAGMA journal_mode=WAL')
+        if synchronous in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+        cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")
+        cursor.close()
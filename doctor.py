@@ -0,0 +1,127 @@
+"""
+Doctor routes: dashboard, availability, treatments (blueprint 'doctor', see app.create_app).
+"""
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from models import db, Appointment, Treatment
+from queries import DATE_FMT
+import queries
+import availability
+
+bp = Blueprint('doctor', __name__)
+
+@bp.route('/doctor_dashboard')
+@login_required
+def doctor_dashboard():
+    if current_user.role != 'doctor': return redirect(url_for('index'))
+
+    appointments = queries.doctor_appointments(current_user.id).all()
+    # Patient roster: one aggregated query per page
+    cursor = request.args.get('cursor')
+    try:
+        patients, next_cursor = queries.roster_page(current_user.id, cursor)
+    except ValueError:
+        cursor = None
+        patients, next_cursor = queries.roster_page(current_user.id)
+
+    return render_template('doctor_dashboard.html', appointments=appointments, patients=patients,
+                           cursor=cursor, next_cursor=next_cursor)
+
+@bp.route('/doctor/availability', methods=['GET', 'POST'])
+@login_required
+def doctor_availability():
+    if current_user.role != 'doctor':
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        try:
+            # The days shown on the form; only these dates are edited, never past ones
+            days = [datetime.strptime(d, DATE_FMT).date() for d in request.form.getlist('days')]
+            days = [d for d in days if d >= datetime.today().date()]
+            selected = set()
+            for item in request.form.getlist('slots'):
+                # We expect format: "2025-11-29_Morning"
+                date_str, slot_type = item.split('_')
+                selected.add((datetime.strptime(date_str, DATE_FMT).date(), slot_type.capitalize()))
+        except ValueError:
+            flash('Invalid availability form.', 'warning')
+            return redirect(url_for('doctor.doctor_availability'))
+
+        availability.save_window(current_user.id, days, selected)
+        flash('Availability schedule updated successfully!', 'success')
+        return redirect(url_for('doctor.doctor_dashboard'))
+
+    today = datetime.today()
+
+    # Output format to %Y-%m-%d (e.g., 2025-11-29 x7)
+    days = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+    # Slots already open, as "2025-11-29_morning" to match the checkbox values
+    current = availability.current_slots(current_user.id, [datetime.strptime(d, DATE_FMT).date() for d in days])
+    current = {f"{d.strftime(DATE_FMT)}_{slot.lower()}" for d, slot in current}
+
+    return render_template('doctor_availability.html', days=days, current=current)
+
+@bp.route('/doctor/availability/recurring', methods=['POST'])
+@login_required
+def doctor_availability_recurring():
+    if current_user.role != 'doctor':
+        return redirect(url_for('index'))
+
+    # e.g. Mondays (0) + Thursdays (3), Morning, for 12 weeks
+    try:
+        weekdays = {int(d) for d in request.form.getlist('weekdays')}
+    except ValueError:
+        weekdays = None
+    slot_types = {s for s in request.form.getlist('slot_types') if s in availability.SLOT_TYPES}
+    weeks = request.form.get('weeks', type=int) or 0
+
+    if weekdays is None or not weekdays <= set(range(7)):
+        flash('Weekdays go from 0 (Monday) to 6 (Sunday).', 'warning')
+        return redirect(url_for('doctor.doctor_availability'))
+    if not weekdays or not slot_types or weeks < 1:
+        flash('Pick at least one weekday, one slot and a number of weeks.', 'warning')
+        return redirect(url_for('doctor.doctor_availability'))
+
+    added = availability.expand_weekly(current_user.id, weekdays, slot_types, datetime.today().date(), weeks)
+    flash(f'Recurring schedule applied: {added} new slots opened.', 'success')
+    return redirect(url_for('doctor.doctor_dashboard'))
+
+@bp.route('/appointment/<int:appointment_id>/update', methods=['GET', 'POST'])
+@login_required
+def update_treatment(appointment_id):
+    if current_user.role != 'doctor': return redirect(url_for('index'))
+
+    appt = db.session.get(Appointment, appointment_id)
+    if not appt or appt.doctor_id != current_user.id: return redirect(url_for('doctor.doctor_dashboard'))
+
+    if request.method == 'POST':
+        diag = request.form.get('diagnosis')
+        pres = request.form.get('prescription')
+        notes = f"Tests: {request.form.get('tests_done')}" if request.form.get('tests_done') else ""
+
+        if appt.treatment:
+            appt.treatment.diagnosis = diag
+            appt.treatment.prescription = pres
+            appt.treatment.doctor_notes = notes
+        else:
+            db.session.add(Treatment(appointment_id=appt.id, diagnosis=diag, prescription=pres, doctor_notes=notes))
+
+        db.session.commit()
+        return redirect(url_for('doctor.doctor_dashboard'))
+
+    return render_template('update_treatment.html', appointment=appt, treatment=appt.treatment)
+
+@bp.route('/appointment/<int:appointment_id>/complete')
+@login_required
+def complete_appointment(appointment_id):
+    if current_user.role != 'doctor': return redirect(url_for('index'))
+
+    appt = db.session.get(Appointment, appointment_id)
+    if not appt or appt.doctor_id != current_user.id: return redirect(url_for('doctor.doctor_dashboard'))
+
+    if appt.status == 'Scheduled':
+        appt.status = 'Completed'
+        db.session.commit()
+        flash('Appointment marked as completed.', 'success')
+    return redirect(url_for('doctor.doctor_dashboard'))
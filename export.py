@@ -0,0 +1,201 @@
+"""
+Streaming export of appointments joined with patient, doctor, department
+and treatment.
+
+Rows are read with a streaming cursor (server-side on PostgreSQL) in
+batches of BATCH_SIZE and written out as each batch arrives, so memory
+stays flat whether the export is 1k or 50M rows.
+
+Formats: csv, ndjson, parquet (columnar; needs the optional pyarrow package).
+
+Incremental exports: every export is pinned to the highest appointment id
+that existed when it started (the "watermark", sent in the
+X-Export-Watermark header). Pass it back as since_id to get only newer rows.
+
+Archived appointments (archive.py) are part of the export unless
+include_archived is off. The archive may be another database, so its rows
+are streamed separately, given their patient / doctor / department names
+one batch at a time, and merged with the live rows in id order. An id
+found in both stores (an interrupted archive run) is exported once, live.
+"""
+import csv
+import io
+import json
+import heapq
+from collections import namedtuple
+from importlib.util import find_spec
+from datetime import date, datetime, time
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from models import db, User, Department, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment
+
+BATCH_SIZE = 5000
+
+Patient = aliased(User)
+Doctor = aliased(User)
+
+COLUMNS = [
+    ('appointment_id', Appointment.id),
+    ('appointment_date', Appointment.appointment_date),
+    ('appointment_time', Appointment.appointment_time),
+    ('status', Appointment.status),
+    ('created_at', Appointment.created_at),
+    ('patient_id', Patient.id),
+    ('patient_name', Patient.username),
+    ('patient_email', Patient.email),
+    ('doctor_id', Doctor.id),
+    ('doctor_name', Doctor.username),
+    ('department', Department.name),
+    ('diagnosis', Treatment.diagnosis),
+    ('prescription', Treatment.prescription),
+    ('doctor_notes', Treatment.doctor_notes),
+    ('treatment_recorded', Treatment.date_recorded),
+]
+FIELDS = [name for name, _ in COLUMNS]
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+# The live rows, and the archived rows (names are looked up per batch)
+ExportQuery = namedtuple('ExportQuery', 'live archived')
+
+
+def watermark():
+    live = db.session.query(func.max(Appointment.id)).scalar() or 0
+    return max(live, db.session.query(func.max(ArchivedAppointment.id)).scalar() or 0)
+
+def _filtered(stmt, model, upto_id, since_id, date_from, date_to):
+    stmt = stmt.where(model.id <= upto_id)
+    if since_id:
+        stmt = stmt.where(model.id > since_id)
+    if date_from:
+        stmt = stmt.where(model.appointment_date >= date_from)
+    if date_to:
+        stmt = stmt.where(model.appointment_date <= date_to)
+    # id order keeps the export resumable from any watermark
+    return stmt.order_by(model.id)
+
+def statement(upto_id, since_id=None, date_from=None, date_to=None, include_archived=True):
+    live = select(*[col.label(name) for name, col in COLUMNS]) \
+        .select_from(Appointment) \
+        .join(Patient, Patient.id == Appointment.patient_id) \
+        .join(Doctor, Doctor.id == Appointment.doctor_id) \
+        .outerjoin(Department, Department.id == Doctor.department_id) \
+        .outerjoin(Treatment, Treatment.appointment_id == Appointment.id)
+    archived = select(ArchivedAppointment.id, ArchivedAppointment.appointment_date, ArchivedAppointment.appointment_time,
+                      ArchivedAppointment.status, ArchivedAppointment.created_at, ArchivedAppointment.patient_id,
+                      ArchivedAppointment.doctor_id, ArchivedTreatment.diagnosis, ArchivedTreatment.prescription,
+                      ArchivedTreatment.doctor_notes, ArchivedTreatment.date_recorded) \
+        .outerjoin(ArchivedTreatment, ArchivedTreatment.appointment_id == ArchivedAppointment.id)
+    filters = (upto_id, since_id, date_from, date_to)
+    return ExportQuery(_filtered(live, Appointment, *filters),
+                       _filtered(archived, ArchivedAppointment, *filters) if include_archived else None)
+
+def _partitions(stmt):
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=BATCH_SIZE))
+    yield from result.partitions()
+
+def _archived_batches(stmt):
+    """Archived rows in COLUMNS order; users come from the main database, one lookup per batch."""
+    for rows in _partitions(stmt):
+        user_ids = {row.patient_id for row in rows} | {row.doctor_id for row in rows}
+        users = {user_id: (name, email, department) for user_id, name, email, department in db.session.execute(
+            select(User.id, User.username, User.email, Department.name)
+            .outerjoin(Department, Department.id == User.department_id).where(User.id.in_(user_ids)))}
+        batch = []
+        for row in rows:
+            patient_name, patient_email, _ = users.get(row.patient_id, (None, None, None))
+            doctor_name, _, department = users.get(row.doctor_id, (None, None, None))
+            batch.append((row.id, row.appointment_date, row.appointment_time, row.status, row.created_at,
+                          row.patient_id, patient_name, patient_email, row.doctor_id, doctor_name, department,
+                          row.diagnosis, row.prescription, row.doctor_notes, row.date_recorded))
+        yield batch
+
+def batches(query):
+    """Yields lists of row tuples, BATCH_SIZE at a time, from streaming cursors."""
+    if query.archived is None:
+        yield from _partitions(query.live)
+        return
+    live = (row for rows in _partitions(query.live) for row in rows)
+    archived = (row for rows in _archived_batches(query.archived) for row in rows)
+    batch, last_id = [], None
+    # On equal ids merge() yields the live row first
+    for row in heapq.merge(live, archived, key=lambda row: row[0]):
+        if row[0] == last_id:
+            continue
+        last_id = row[0]
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _text(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+# --- WRITERS ---
+
+def stream_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for rows in batches(query):
+        writer.writerows([[_text(v) for v in row] for row in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_ndjson(query):
+    for rows in batches(query):
+        yield ''.join(json.dumps(dict(zip(FIELDS, map(_text, row)))) + '\n' for row in rows)
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator."""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+def stream_parquet(query):
+    # Optional and slow to import: loaded by the first parquet export, not at startup
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    # One row group per batch; the footer goes out when the writer closes
+    schema = pa.schema([
+        ('appointment_id', pa.int64()), ('appointment_date', pa.date32()), ('appointment_time', pa.time64('us')),
+        ('status', pa.string()), ('created_at', pa.timestamp('us')),
+        ('patient_id', pa.int64()), ('patient_name', pa.string()), ('patient_email', pa.string()),
+        ('doctor_id', pa.int64()), ('doctor_name', pa.string()), ('department', pa.string()),
+        ('diagnosis', pa.string()), ('prescription', pa.string()), ('doctor_notes', pa.string()),
+        ('treatment_recorded', pa.timestamp('us')),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in batches(query):
+            columns = list(zip(*rows))
+            writer.write_table(pa.table({name: list(col) for name, col in zip(FIELDS, columns)}, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+WRITERS = {'csv': stream_csv, 'ndjson': stream_ndjson, 'parquet': stream_parquet}
+
+def available(fmt):
+    return fmt in WRITERS and (fmt != 'parquet' or find_spec('pyarrow') is not None)
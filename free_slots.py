@@ -0,0 +1,95 @@
+"""
+Free-slot index.
+free_slots holds every (doctor, date, slot_type) that is open in
+DoctorAvailability and not taken by a 'Scheduled' appointment, so "what can
+I book" is a plain indexed read instead of availability-minus-appointments.
+
+The table is kept in step inside the same transaction as the write that
+changes it: after each flush, only the (doctor, date) pairs touched by that
+flush are recomputed.
+"""
+from datetime import date
+from sqlalchemy import and_, case, event, exists, inspect, literal, select, tuple_
+from sqlalchemy.orm import Session
+from models import db, User, Appointment, DoctorAvailability, FreeSlot, SLOT_TIMES
+
+SLOT_ORDER = case((FreeSlot.slot_type == 'Morning', 0), else_=1)
+
+
+# --- MAINTENANCE ---
+
+def _open_slots(*conditions):
+    """SELECT of availability rows whose slot has no Scheduled appointment."""
+    slot_time = case(
+        (DoctorAvailability.slot_type == 'Morning', literal(SLOT_TIMES['Morning'], db.Time)),
+        else_=literal(SLOT_TIMES['Evening'], db.Time))
+    booked = exists().where(and_(
+        Appointment.doctor_id == DoctorAvailability.doctor_id,
+        Appointment.appointment_date == DoctorAvailability.available_date,
+        Appointment.appointment_time == slot_time,
+        Appointment.status == 'Scheduled'))
+    return select(DoctorAvailability.doctor_id, DoctorAvailability.available_date, DoctorAvailability.slot_type) \
+        .where(*conditions).where(~booked).distinct()
+
+def _insert_open_slots(conn, *conditions):
+    columns = [FreeSlot.doctor_id, FreeSlot.available_date, FreeSlot.slot_type]
+    conn.execute(FreeSlot.__table__.insert().from_select([c.name for c in columns], _open_slots(*conditions)))
+
+def refresh(conn, keys):
+    """Recomputes the free slots of every (doctor_id, date) in `keys` - one DELETE, one INSERT."""
+    if not keys:
+        return
+    keys = sorted(keys)
+    conn.execute(FreeSlot.__table__.delete().where(
+        tuple_(FreeSlot.doctor_id, FreeSlot.available_date).in_(keys)))
+    _insert_open_slots(conn, tuple_(DoctorAvailability.doctor_id, DoctorAvailability.available_date).in_(keys))
+
+def rebuild():
+    """Full rebuild of upcoming slots (startup / migration)."""
+    conn = db.session.connection()
+    conn.execute(FreeSlot.__table__.delete())
+    _insert_open_slots(conn, DoctorAvailability.available_date >= date.today())
+    db.session.commit()
+
+
+# --- FLUSH HOOK ---
+
+def _keys(obj):
+    """(doctor_id, date) pairs an Appointment/DoctorAvailability change affects, old and new."""
+    if isinstance(obj, Appointment):
+        date_attr = 'appointment_date'
+    elif isinstance(obj, DoctorAvailability):
+        date_attr = 'available_date'
+    else:
+        return set()
+    state = inspect(obj)
+    doctors = {obj.doctor_id} | set(state.attrs.doctor_id.history.deleted)
+    days = {getattr(obj, date_attr)} | set(getattr(state.attrs, date_attr).history.deleted)
+    return {(d, day) for d in doctors for day in days if d is not None and day is not None}
+
+@event.listens_for(Session, 'after_flush')
+def _sync_free_slots(session, flush_context):
+    keys = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys |= _keys(obj)
+    if keys:
+        refresh(session.connection(), keys)
+
+
+# --- LOOKUPS ---
+
+def for_doctor(doctor_id, date_from=None, date_to=None):
+    query = FreeSlot.query.filter(FreeSlot.doctor_id == doctor_id,
+                                  FreeSlot.available_date >= (date_from or date.today()))
+    if date_to:
+        query = query.filter(FreeSlot.available_date <= date_to)
+    return query.order_by(FreeSlot.available_date, SLOT_ORDER)
+
+def for_department(department_id, date_from=None, date_to=None):
+    """Free slots of the department's active doctors, earliest first."""
+    query = FreeSlot.query.join(User, User.id == FreeSlot.doctor_id) \
+        .filter(User.department_id == department_id, User.role == 'doctor', User.is_active_user == True,
+                FreeSlot.available_date >= (date_from or date.today()))
+    if date_to:
+        query = query.filter(FreeSlot.available_date <= date_to)
+    return query.order_by(FreeSlot.available_date, SLOT_ORDER, FreeSlot.doctor_id)
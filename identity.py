@@ -0,0 +1,101 @@
+"""
+Session identity cache behind Flask-Login's user_loader.
+
+Routes only read current_user.id / role / username, so instead of loading the
+full User row on every request, load_user() returns a SessionUser snapshot
+(id, username, email, role, active flag, department) kept in an in-process
+LRU for SESSION_CACHE_TTL seconds.
+
+Changes to a user must call invalidate(user_id) after the commit. That drops
+the entry in this process and, with SESSION_CACHE_SHARED, touches
+<instance>/session_invalidations/<user_id>, which every other worker process
+checks (one stat, no SQL) before trusting its own entry. Blacklisted users
+are refused by load_user, so deactivation logs them out on their next request.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from flask_login import UserMixin
+from models import db, User
+import replicas
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # user_id -> (loaded_at, SessionUser)
+_invalidated = {}         # user_id -> time of the last local invalidate()
+_settings = {'size': 10000, 'ttl': 60, 'shared_dir': None}
+
+class SessionUser(UserMixin):
+    """Detached copy of the User columns routes read from current_user."""
+    def __init__(self, id, username, email, role, is_active_user, department_id):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.is_active_user = is_active_user
+        self.department_id = department_id
+
+
+def init_app(app):
+    _settings['size'] = app.config['SESSION_CACHE_SIZE']
+    _settings['ttl'] = app.config['SESSION_CACHE_TTL']
+    if app.config['SESSION_CACHE_SHARED']:
+        _settings['shared_dir'] = os.path.join(app.instance_path, 'session_invalidations')
+        os.makedirs(_settings['shared_dir'], exist_ok=True)
+
+def _invalidated_at(user_id):
+    stamp = _invalidated.get(user_id, 0)
+    if _settings['shared_dir']:
+        try:
+            stamp = max(stamp, os.stat(os.path.join(_settings['shared_dir'], str(user_id))).st_mtime)
+        except FileNotFoundError:
+            pass
+    return stamp
+
+def _fetch(user_id):
+    # Primary: a replica could still show a just-blacklisted user as active
+    with replicas.primary():
+        row = db.session.query(User.id, User.username, User.email, User.role, User.is_active_user, User.department_id) \
+            .filter(User.id == user_id).first()
+    return SessionUser(*row) if row else None
+
+
+# --- LOOKUP ---
+
+def load(user_id):
+    """SessionUser for an active user, or None (unknown or blacklisted -> logged out)."""
+    now = time.time()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry:
+            _entries.move_to_end(user_id)
+    if entry and now - entry[0] < _settings['ttl'] and entry[0] > _invalidated_at(user_id):
+        user = entry[1]
+    else:
+        # Stamped before the SELECT: an invalidation racing with it wins
+        user = _fetch(user_id)
+        with _lock:
+            _entries[user_id] = (now, user)
+            _entries.move_to_end(user_id)
+            while len(_entries) > _settings['size']:
+                _entries.popitem(last=False)
+    return user if user and user.is_active_user else None
+
+def invalidate(user_id):
+    """Call after committing a change to the user (role, status, profile, deletion)."""
+    now = time.time()
+    with _lock:
+        _entries.pop(user_id, None)
+        _invalidated[user_id] = now
+        # Older stamps cannot be newer than any live entry
+        for stale in [uid for uid, t in _invalidated.items() if now - t > _settings['ttl']]:
+            del _invalidated[stale]
+    if _settings['shared_dir']:
+        path = os.path.join(_settings['shared_dir'], str(user_id))
+        with open(path, 'a'):
+            os.utime(path)
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _invalidated.clear()
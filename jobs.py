@@ -0,0 +1,315 @@
+"""
+Background jobs: a queue table (models.Job) in the application database and
+a pool of worker processes.
+
+    python jobs.py --workers 4     # alongside the web server
+    python jobs.py --once          # run whatever is due, then exit (cron)
+
+Enqueueing is one INSERT inside the request's own transaction: a job exists
+exactly when the change that caused it was committed, and the request never
+waits for the work. A flush hook queues
+  - a confirmation, plus a reminder REMINDER_HOURS before the visit, when an
+    appointment is booked, moved or re-activated
+  - a cancellation notice when one is cancelled
+  - a summary for the patient when a treatment is recorded
+so every ORM write path is covered; batch.py's bulk statements queue theirs
+with appointment_jobs().
+
+Workers claim due jobs with a conditional UPDATE (queued -> running), so a
+job never runs twice at once. A failing job is retried after
+JOB_BACKOFF_SECONDS * 2^(attempt - 1), capped at JOB_BACKOFF_MAX, and marked
+'failed' after max_attempts. A job left 'running' for JOB_LEASE_SECONDS (its
+worker died) goes back to the queue. RECURRING jobs get one row per
+occurrence under a unique key, so any number of workers schedule each run once.
+"""
+import os
+import json
+import time
+import random
+import signal
+import socket
+import logging
+import argparse
+import traceback
+import multiprocessing
+from datetime import date, datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import case, event, inspect, select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, User, Appointment, Treatment, Job
+import export
+import stats
+import archive
+
+log = logging.getLogger('hms.jobs')
+notifications = logging.getLogger('hms.notifications')
+
+HANDLERS = {}  # kind -> function(payload)
+
+# kind -> config key holding the local hour it runs at every day
+RECURRING = {'nightly_report': 'NIGHTLY_REPORT_HOUR', 'archive_appointments': 'ARCHIVE_HOUR'}
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+def utc(local):
+    """Naive local time -> naive UTC, the convention of every DateTime column."""
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# --- ENQUEUE ---
+
+def job_row(kind, payload, run_at=None, key=None):
+    now = datetime.utcnow()
+    return {'kind': kind, 'payload': json.dumps(payload), 'status': 'queued', 'run_at': run_at or now,
+            'attempts': 0, 'max_attempts': current_app.config['JOB_MAX_ATTEMPTS'], 'key': key, 'created_at': now}
+
+def insert(conn, rows):
+    if rows:
+        conn.execute(Job.__table__.insert(), rows)
+
+def enqueue(kind, payload, run_at=None, key=None):
+    """Queues a job in the current transaction; workers see it once that commits."""
+    insert(db.session.connection(), [job_row(kind, payload, run_at, key)])
+
+def appointment_jobs(appointment_id, appt_date, appt_time, change):
+    """Job rows for an appointment that was 'booked', 'rescheduled' or 'cancelled'."""
+    payload = {'appointment_id': appointment_id, 'date': appt_date.isoformat(), 'time': appt_time.strftime('%H:%M')}
+    if change == 'cancelled':
+        return [job_row('appointment_cancelled', payload)]
+    rows = [job_row('appointment_confirmation', dict(payload, rescheduled=change == 'rescheduled'))]
+    starts = utc(datetime.combine(appt_date, appt_time))
+    now = datetime.utcnow()
+    if starts > now:
+        remind_at = max(now, starts - timedelta(hours=current_app.config['REMINDER_HOURS']))
+        rows.append(job_row('appointment_reminder', payload, run_at=remind_at))
+    return rows
+
+@event.listens_for(Session, 'after_flush')
+def _enqueue_on_flush(session, flush_context):
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, Appointment) and obj.status == 'Scheduled':
+            rows += appointment_jobs(obj.id, obj.appointment_date, obj.appointment_time, 'booked')
+        elif isinstance(obj, Treatment):
+            rows.append(job_row('treatment_summary', {'treatment_id': obj.id}))
+    for obj in session.dirty:
+        if not isinstance(obj, Appointment):
+            continue
+        attrs = inspect(obj).attrs
+        status_changed = attrs.status.history.has_changes()
+        moved = attrs.appointment_date.history.has_changes() or attrs.appointment_time.history.has_changes()
+        if obj.status == 'Cancelled' and status_changed:
+            rows += appointment_jobs(obj.id, obj.appointment_date, obj.appointment_time, 'cancelled')
+        elif obj.status == 'Scheduled' and (status_changed or moved):
+            rows += appointment_jobs(obj.id, obj.appointment_date, obj.appointment_time, 'rescheduled')
+    # Same connection, same transaction as the write itself
+    insert(session.connection(), rows)
+
+
+# --- HANDLERS ---
+
+def deliver(user, subject, body):
+    """Sends a notification. Logged for now; an email/SMS gateway plugs in here."""
+    notifications.info('to=%s subject=%r body=%r', user.email, subject, body)
+
+def _current(payload):
+    """The appointment if it is still Scheduled at the date/time the job was queued for."""
+    appt = db.session.get(Appointment, payload['appointment_id'])
+    if appt and appt.status == 'Scheduled' and appt.appointment_date.isoformat() == payload['date'] \
+            and appt.appointment_time.strftime('%H:%M') == payload['time']:
+        return appt
+    return None
+
+@handler('appointment_confirmation')
+def appointment_confirmation(payload):
+    appt = _current(payload)
+    if appt:
+        verb = 'rescheduled' if payload.get('rescheduled') else 'confirmed'
+        deliver(appt.patient_ref, f'Appointment {verb}',
+                f"Dr. {appt.doctor_ref.username} on {payload['date']} at {payload['time']}")
+
+@handler('appointment_reminder')
+def appointment_reminder(payload):
+    # Moved or cancelled since: a newer job covers it, or there is nothing to remind
+    appt = _current(payload)
+    if appt:
+        deliver(appt.patient_ref, 'Appointment reminder',
+                f"Dr. {appt.doctor_ref.username} on {payload['date']} at {payload['time']}")
+
+@handler('appointment_cancelled')
+def appointment_cancelled(payload):
+    appt = db.session.get(Appointment, payload['appointment_id'])
+    if appt and appt.status == 'Cancelled':
+        deliver(appt.patient_ref, 'Appointment cancelled',
+                f"Dr. {appt.doctor_ref.username} on {payload['date']} at {payload['time']}")
+
+@handler('treatment_summary')
+def treatment_summary(payload):
+    treatment = db.session.get(Treatment, payload['treatment_id'])
+    if treatment:
+        deliver(treatment.appointment.patient_ref, 'Your visit summary',
+                f'Diagnosis: {treatment.diagnosis}. Prescription: {treatment.prescription}')
+
+@handler('nightly_report')
+def nightly_report(payload):
+    """Previous day's appointments as CSV plus the dashboard figures, under REPORTS_DIR."""
+    day = date.fromisoformat(payload['date'])
+    directory = current_app.config['REPORTS_DIR'] or os.path.join(current_app.instance_path, 'reports')
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, f'appointments-{day}.csv')
+    with open(path + '.tmp', 'w', newline='') as f:
+        for chunk in export.stream_csv(export.statement(export.watermark(), date_from=day, date_to=day)):
+            f.write(chunk)
+    os.replace(path + '.tmp', path)
+
+    rows = {name: db.session.execute(stmt).all() for name, stmt in stats.statements().items()}
+    with open(os.path.join(directory, f'summary-{day}.json'), 'w') as f:
+        json.dump(stats.assemble(rows), f, indent=2)
+
+    # Finished jobs are only kept for a while
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['JOB_KEEP_DAYS'])
+    db.session.execute(delete(Job).where(Job.status == 'done', Job.run_at < cutoff)
+                       .execution_options(synchronize_session=False))
+
+@handler('archive_appointments')
+def archive_appointments(payload):
+    moved = archive.run()
+    log.info('archived %d appointments', moved)
+
+
+# --- WORKER ---
+
+def backoff(attempts):
+    config = current_app.config
+    delay = min(config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1), config['JOB_BACKOFF_MAX'])
+    return timedelta(seconds=delay * random.uniform(0.9, 1.1))  # jitter: failed jobs do not retry in lockstep
+
+def claim(worker, limit):
+    """Ids of up to `limit` due jobs, now 'running' under `worker`."""
+    now = datetime.utcnow()
+    candidates = db.session.scalars(select(Job.id).where(Job.status == 'queued', Job.run_at <= now)
+                                    .order_by(Job.run_at).limit(limit)).all()
+    claimed = []
+    for job_id in candidates:
+        # Loses cleanly to another worker that got there first
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', locked_by=worker, locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False))
+        if result.rowcount:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+def run(job_id):
+    job = db.session.get(Job, job_id)
+    kind = job.kind
+    try:
+        if kind not in HANDLERS:
+            raise LookupError(f'No handler for job kind {kind!r}')
+        HANDLERS[kind](json.loads(job.payload))
+        job.status, job.locked_by, job.locked_at, job.last_error = 'done', None, None, None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = traceback.format_exc(limit=5)
+        job.locked_by = job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            log.error('job %s (%s) failed for good after %d attempts', job_id, kind, job.attempts)
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + backoff(job.attempts)
+            log.warning('job %s (%s) failed, attempt %d of %d, retrying at %s',
+                        job_id, kind, job.attempts, job.max_attempts, job.run_at)
+        db.session.commit()
+
+def requeue_stale():
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+    db.session.execute(
+        update(Job).where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status=case((Job.attempts >= Job.max_attempts, 'failed'), else_='queued'), locked_by=None, locked_at=None)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+
+def schedule_recurring():
+    """Makes sure the next run of every RECURRING job is queued."""
+    now = datetime.now()
+    for kind, hour_key in RECURRING.items():
+        next_run = now.replace(hour=current_app.config[hour_key], minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        key = f'{kind}:{next_run.date().isoformat()}'
+        if db.session.scalar(select(Job.id).where(Job.key == key)):
+            continue
+        try:
+            enqueue(kind, {'date': (next_run.date() - timedelta(days=1)).isoformat()}, run_at=utc(next_run), key=key)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker queued it first
+            db.session.rollback()
+
+def drain(worker, stop=None):
+    """Runs due jobs until none are left (or `stop` is set); returns how many ran."""
+    done = 0
+    while not (stop and stop.is_set()):
+        claimed = claim(worker, current_app.config['JOB_BATCH'])
+        if not claimed:
+            break
+        for job_id in claimed:
+            run(job_id)
+        done += len(claimed)
+    return done
+
+def work(worker, stop):
+    from app import create_app
+    app = create_app(blueprints=())
+    with app.app_context():
+        # Connections inherited from the parent process must not be shared
+        db.engine.dispose(close=False)
+        housekeeping = 0
+        while not stop.is_set():
+            if time.monotonic() - housekeeping > 60:
+                requeue_stale()
+                schedule_recurring()
+                housekeeping = time.monotonic()
+            if not drain(worker, stop):
+                stop.wait(app.config['JOB_POLL_SECONDS'])
+
+
+if __name__ == '__main__':
+    from app import create_app
+    parser = argparse.ArgumentParser(description='Background job workers.')
+    parser.add_argument('--workers', type=int, help='worker processes (default JOB_WORKERS)')
+    parser.add_argument('--once', action='store_true', help='run the jobs that are due now and exit')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    app = create_app(blueprints=())
+    name = f'{socket.gethostname()}:{os.getpid()}'
+
+    if args.once:
+        with app.app_context():
+            requeue_stale()
+            schedule_recurring()
+            print(f'ran {drain(name)} jobs')
+    else:
+        stop = multiprocessing.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        processes = [multiprocessing.Process(target=work, args=(f'{name}/{i}', stop), daemon=True)
+                     for i in range(args.workers or app.config['JOB_WORKERS'])]
+        for p in processes:
+            p.start()
+        try:
+            for p in processes:
+                p.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for p in processes:
+                p.join()
@@ -0,0 +1,116 @@
+"""
+Request and SQL instrumentation.
+
+For every request: wall time, number of SQL statements and time spent in
+them, aggregated per endpoint and served in Prometheus text format at
+/metrics. Requests over SLOW_REQUEST_MS or SLOW_REQUEST_QUERIES are logged
+to the 'hms.slow' logger.
+"""
+import time
+import logging
+import threading
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger('hms.slow')
+
+_lock = threading.Lock()
+_endpoints = {}  # (endpoint, method) -> counters
+
+
+def _new_counters():
+    return {'count': 0, 'seconds': 0.0, 'buckets': [0] * len(BUCKETS),
+            'sql_count': 0, 'sql_seconds': 0.0, 'errors': 0}
+
+def record(endpoint, method, status, seconds, sql_count, sql_seconds):
+    with _lock:
+        c = _endpoints.setdefault((endpoint, method), _new_counters())
+        c['count'] += 1
+        c['seconds'] += seconds
+        c['sql_count'] += sql_count
+        c['sql_seconds'] += sql_seconds
+        if status >= 500:
+            c['errors'] += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                c['buckets'][i] += 1
+                break
+
+def snapshot():
+    with _lock:
+        return {key: dict(c, buckets=list(c['buckets'])) for key, c in _endpoints.items()}
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+
+
+# --- HOOKS ---
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+
+def init_app(app, *engines):
+    # The primary and any read replicas: a request's SQL counts wherever it ran
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor)
+        event.listen(engine, 'after_cursor_execute', _after_cursor)
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        if 'request_start' not in g:
+            return response
+        seconds = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or 'unmatched'
+        record(endpoint, request.method, response.status_code, seconds, g.sql_count, g.sql_seconds)
+
+        if seconds * 1000 > app.config['SLOW_REQUEST_MS'] or g.sql_count > app.config['SLOW_REQUEST_QUERIES']:
+            slow_log.warning('slow request %s %s -> %s: %.1f ms, %d SQL statements (%.1f ms in SQL)',
+                             request.method, request.full_path.rstrip('?'), response.status_code,
+                             seconds * 1000, g.sql_count, g.sql_seconds * 1000)
+        return response
+
+
+# --- EXPORT ---
+
+def prometheus_text():
+    lines = [
+        '# HELP hms_request_duration_seconds Request wall time per endpoint.',
+        '# TYPE hms_request_duration_seconds histogram',
+    ]
+    data = sorted(snapshot().items())
+    for (endpoint, method), c in data:
+        labels = f'endpoint="{endpoint}",method="{method}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS, c['buckets']):
+            cumulative += n
+            lines.append(f'hms_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'hms_request_duration_seconds_bucket{{{labels},le="+Inf"}} {c["count"]}')
+        lines.append(f'hms_request_duration_seconds_sum{{{labels}}} {c["seconds"]:.6f}')
+        lines.append(f'hms_request_duration_seconds_count{{{labels}}} {c["count"]}')
+
+    for name, key, kind, help_text in (
+            ('hms_sql_statements_total', 'sql_count', 'counter', 'SQL statements executed per endpoint.'),
+            ('hms_sql_duration_seconds_total', 'sql_seconds', 'counter', 'Time spent in SQL per endpoint.'),
+            ('hms_request_errors_total', 'errors', 'counter', 'Responses with a 5xx status per endpoint.')):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (endpoint, method), c in data:
+            value = f'{c[key]:.6f}' if isinstance(c[key], float) else c[key]
+            lines.append(f'{name}{{endpoint="{endpoint}",method="{method}"}} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,115 @@
+"""
+Brings an existing database (e.g. instance/site.db) up to the schema in models.py.
+
+    python migrate.py            # create missing tables and indexes
+    python migrate.py --explain  # also print the query plan of each hot lookup
+
+db.create_all() only creates missing *tables*, so indexes added to a table
+that already exists are created here one by one (CREATE INDEX IF NOT EXISTS).
+Passwords still stored in plaintext are hashed with PASSWORD_METHOD, and the
+templates are compiled into the template cache for the workers.
+"""
+import sys
+from datetime import date, time
+from sqlalchemy import inspect, text
+from app import create_app, precompile_templates
+from models import db, User, Appointment, DoctorAvailability, FreeSlot
+import free_slots
+import search
+import passwords
+
+# Indexes replaced by a differently named one; dropped if still present
+DROPPED_INDEXES = {
+    'appointments': ['ix_appointments_scheduled_slot'],  # now uq_appointments_scheduled_slot
+}
+
+def find_double_bookings():
+    """Slots holding more than one Scheduled appointment - these block the UNIQUE index."""
+    return db.session.execute(text(
+        "SELECT doctor_id, appointment_date, appointment_time, COUNT(*) FROM appointments "
+        "WHERE status = 'Scheduled' GROUP BY doctor_id, appointment_date, appointment_time "
+        "HAVING COUNT(*) > 1")).fetchall()
+
+def hash_plaintext_passwords():
+    """Replaces passwords stored before hashing; returns how many were converted."""
+    converted = 0
+    for user in User.query.filter(~User.password.like('scrypt:%'), ~User.password.like('pbkdf2:%')):
+        if not passwords.is_hashed(user.password):
+            user.password = passwords.hash_password(user.password)
+            converted += 1
+    db.session.commit()
+    return converted
+
+def drop_replaced_indexes():
+    inspector = inspect(db.engine)
+    dropped = []
+    for table, names in DROPPED_INDEXES.items():
+        existing = {ix['name'] for ix in inspector.get_indexes(table)}
+        for name in names:
+            if name in existing:
+                db.session.execute(text(f'DROP INDEX {name}'))
+                dropped.append(name)
+    db.session.commit()
+    return dropped
+
+def create_missing_indexes():
+    created = []
+    # The live database and the archive bind
+    for bind_key, metadata in db.metadatas.items():
+        engine = db.engines[bind_key]
+        inspector = inspect(engine)
+        for table in metadata.sorted_tables:
+            existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(engine, checkfirst=True)
+                    created.append(index.name)
+    return created
+
+# Hot-path lookups, in the same shape the routes issue them
+HOT_LOOKUPS = {
+    'collision check': lambda: Appointment.query.filter_by(
+        doctor_id=1, appointment_date=date.today(), appointment_time=time(9, 0), status='Scheduled'),
+    'availability': lambda: DoctorAvailability.query.filter(
+        DoctorAvailability.doctor_id == 1, DoctorAvailability.available_date >= date.today()),
+    'patient dashboard': lambda: Appointment.query.filter_by(patient_id=1),
+    'doctor dashboard': lambda: Appointment.query.filter_by(doctor_id=1, status='Scheduled'),
+}
+
+def explain():
+    """
+    Prints the plan of each lookup. SQLite: 'SCAN' is a full table scan,
+    'SEARCH ... USING INDEX' a seek. PostgreSQL: 'Seq Scan' vs 'Index Scan'.
+    """
+    prefix = 'EXPLAIN QUERY PLAN' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN'
+    for name, build in HOT_LOOKUPS.items():
+        stmt = build().statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = db.session.execute(text(f'{prefix} {stmt}')).fetchall()
+        print(f'{name}:')
+        for row in plan:
+            print(f'    {row[-1]}')
+
+if __name__ == '__main__':
+    app = create_app(blueprints=())
+    with app.app_context():
+        db.create_all()
+        clashes = find_double_bookings()
+        if clashes:
+            print('Cannot add uq_appointments_scheduled_slot, these slots are double booked:')
+            for doctor_id, appt_date, appt_time, count in clashes:
+                print(f'    doctor {doctor_id} on {appt_date} at {appt_time}: {count} Scheduled')
+            print('Cancel or move the extra appointments and run again.')
+            sys.exit(1)
+        dropped = drop_replaced_indexes()
+        if dropped:
+            print(f"Dropped indexes: {', '.join(dropped)}")
+        created = create_missing_indexes()
+        print(f"Created indexes: {', '.join(created) if created else 'none (already up to date)'}")
+        print(f'Hashed plaintext passwords: {hash_plaintext_passwords()}')
+        free_slots.rebuild()
+        print(f'Rebuilt free slot index: {FreeSlot.query.count()} open slots')
+        search.install()
+        print(f"Search index: {'ready' if search.is_installed() else 'not supported on ' + db.engine.dialect.name}")
+        if '--explain' in sys.argv:
+            explain()
+    print(f'Compiled templates: {precompile_templates(app)}')
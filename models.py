@@ -1,8 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, time
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Reads of GET requests may go to a read replica (replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Appointment time of each DoctorAvailability.slot_type
+SLOT_TIMES = {'Morning': time(9, 0), 'Evening': time(16, 0)}
 
 class User(db.Model, UserMixin):
     """
@@ -23,6 +28,11 @@ class User(db.Model, UserMixin):
     
     # Specific for Doctors (Foreign Key to Department)
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
+
+    # Doctors per department / role listings
+    __table_args__ = (
+        db.Index('ix_users_role_department', 'role', 'department_id'),
+    )
     
     # Relationships
     doctor_appointments = db.relationship('Appointment', foreign_keys='Appointment.doctor_id', backref='doctor_ref', lazy=True)
@@ -58,6 +68,20 @@ class Appointment(db.Model):
     treatment = db.relationship('Treatment', backref='appointment', uselist=False, lazy=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Collision check: doctor + date + time + status
+        db.Index('ix_appointments_doctor_slot', 'doctor_id', 'appointment_date', 'appointment_time', 'status'),
+        # At most one 'Scheduled' appointment per doctor slot (see booking.py)
+        db.Index('uq_appointments_scheduled_slot', 'doctor_id', 'appointment_date', 'appointment_time',
+                 unique=True,
+                 sqlite_where=db.text("status = 'Scheduled'"),
+                 postgresql_where=db.text("status = 'Scheduled'")),
+        # Patient dashboard / history
+        db.Index('ix_appointments_patient_date', 'patient_id', 'appointment_date'),
+        # Keyset pagination order
+        db.Index('ix_appointments_date_time_id', 'appointment_date', 'appointment_time', 'id'),
+    )
+
 class Treatment(db.Model):
     """
     Treatment Table: Stores medical records for a completed appointment.
@@ -65,7 +89,7 @@ class Treatment(db.Model):
     __tablename__ = 'treatments'
     
     id = db.Column(db.Integer, primary_key=True)
-    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, index=True)
     
     diagnosis = db.Column(db.Text, nullable=False)
     prescription = db.Column(db.Text, nullable=False)
@@ -84,3 +108,102 @@ class DoctorAvailability(db.Model):
     doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     available_date = db.Column(db.Date, nullable=False)
     slot_type = db.Column(db.String(20), nullable=False) # 'Morning' or 'Evening'
+
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_date', 'doctor_id', 'available_date'),
+    )
+
+class FreeSlot(db.Model):
+    """
+    Materialized view of bookable slots: a DoctorAvailability row with no
+    'Scheduled' appointment at that slot's time. Maintained by free_slots.py.
+    """
+    __tablename__ = 'free_slots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    available_date = db.Column(db.Date, nullable=False)
+    slot_type = db.Column(db.String(20), nullable=False) # 'Morning' or 'Evening'
+
+    doctor = db.relationship('User', lazy=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'available_date', 'slot_type', name='uq_free_slots_doctor_slot'),
+        # "Next free slot" across doctors
+        db.Index('ix_free_slots_date', 'available_date', 'slot_type'),
+    )
+
+class Job(db.Model):
+    """
+    Background job queue (see jobs.py). A row is 'queued' until run_at, then
+    'running' while a worker holds it, then 'done' or - after max_attempts
+    failures - 'failed'.
+    """
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    # Scheduled jobs: at most one row per key (e.g. 'nightly_report:2025-01-31')
+    key = db.Column(db.String(100), unique=True, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Workers: "next due queued job"
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+
+class PatientTimeline(db.Model):
+    """
+    A patient's visit timeline as one serialized document (see timeline.py),
+    kept up to date by the writes that change it.
+    """
+    __tablename__ = 'patient_timelines'
+
+    patient_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.String(100), nullable=False)  # doctor/department stamps it was built under
+    document = db.Column(db.Text, nullable=False)  # JSON: {"built", "fields", "visits": [[...], ...]}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# --- ARCHIVE ---
+# Old Completed/Cancelled appointments and their treatments, moved out of the
+# live tables by archive.py. Same columns and ids as the live rows. The
+# 'archive' bind may be a separate database, so there are no foreign keys to users.
+
+class ArchivedAppointment(db.Model):
+    __bind_key__ = 'archive'
+    __tablename__ = 'appointments_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    treatment = db.relationship('ArchivedTreatment', uselist=False, lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_appointments_archive_patient_date', 'patient_id', 'appointment_date'),
+    )
+
+class ArchivedTreatment(db.Model):
+    __bind_key__ = 'archive'
+    __tablename__ = 'treatments_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments_archive.id'), nullable=False, index=True)
+    diagnosis = db.Column(db.Text, nullable=False)
+    prescription = db.Column(db.Text, nullable=False)
+    doctor_notes = db.Column(db.Text, nullable=True)
+    date_recorded = db.Column(db.DateTime)
@@ -0,0 +1,98 @@
+"""
+Password hashing and verification.
+
+Hashes are Werkzeug's self-describing strings, e.g.
+
+    scrypt:32768:8:1$<salt>$<hash>        pbkdf2:sha256:600000$<salt>$<hash>
+
+so the method and its cost travel with every hash. PASSWORD_METHOD sets the
+method for new hashes. A stored hash made with any other method (or a
+plaintext password from before hashing) still verifies, and is replaced
+with a PASSWORD_METHOD hash on the user's next successful login.
+
+Key derivation is deliberately slow, so it runs on a pool of
+PASSWORD_WORKERS threads (hashlib releases the GIL, so they use real
+cores). At most PASSWORD_MAX_PENDING hashes may be running or queued; past
+that, Busy is raised at once instead of piling up request threads behind
+the pool and starving every other page.
+"""
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+_pool = None
+_slots = None  # BoundedSemaphore: running + queued hashes
+
+class Busy(Exception):
+    """Every hashing worker is taken and the queue is full."""
+
+# Retry-After (seconds) of the 503 answered on Busy
+RETRY_AFTER_SECONDS = 1
+
+def busy_headers():
+    return {'Retry-After': str(RETRY_AFTER_SECONDS)}
+
+
+# --- POOL ---
+
+def init_app(app):
+    global _pool, _slots
+    workers = app.config['PASSWORD_WORKERS']
+    _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hms-password')
+    _slots = threading.BoundedSemaphore(max(workers, app.config['PASSWORD_MAX_PENDING']))
+
+def _run(fn, *args):
+    """Runs fn(*args) on the pool and waits for it; raises Busy when the pool is saturated."""
+    if _pool is None:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        raise Busy()
+    try:
+        return _pool.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+# --- HASHES ---
+
+@lru_cache(maxsize=None)
+def _prefix(method):
+    """'scrypt' -> 'scrypt:32768:8:1': the method string as it appears in a stored hash."""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES) and stored.count('$') == 2
+
+def needs_rehash(stored, method=None):
+    method = method or current_app.config['PASSWORD_METHOD']
+    return not is_hashed(stored) or stored.split('$', 1)[0] != _prefix(method)
+
+def hash_password(password, method=None):
+    """Hash for storing in User.password (on the worker pool)."""
+    return _run(generate_password_hash, password, method or current_app.config['PASSWORD_METHOD'])
+
+def _verify(stored, password):
+    if is_hashed(stored):
+        return check_password_hash(stored, password)
+    # Plaintext from before hashing; constant-time like the real check
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+def check(user, password):
+    """
+    True if `password` is the user's password. On success an outdated hash is
+    replaced on `user` - the caller commits it. When the pool is full the old
+    hash is kept until the next login rather than failing a correct password.
+    """
+    if not password or not _run(_verify, user.password, password):
+        return False
+    if needs_rehash(user.password):
+        try:
+            user.password = hash_password(password)
+        except Busy:
+            pass
+    return True
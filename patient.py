@@ -0,0 +1,176 @@
+"""
+Patient routes: dashboard, history, browsing departments and doctors,
+booking / rescheduling / cancelling (blueprint 'patient', see app.create_app).
+"""
+from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from models import db, User, Department, Appointment
+from queries import DATE_FMT
+import queries
+import booking
+import free_slots
+import cache
+import schedule
+import timeline
+import assign
+
+bp = Blueprint('patient', __name__)
+
+@bp.route('/patient_dashboard')
+@login_required
+def patient_dashboard():
+    if current_user.role != 'patient': return redirect(url_for('index'))
+
+    my_appts = queries.patient_appointments(current_user.id).all()
+    return render_template('patient_dashboard.html', department_list=department_list_fragment('department_list'), appointments=my_appts)
+
+@bp.route('/patient_history/<int:patient_id>')
+@login_required
+def patient_history(patient_id):
+    if current_user.role not in ['admin', 'doctor'] and current_user.id != patient_id:
+        return redirect(url_for('index'))
+    return render_template('patient_history.html', patient=db.session.get(User, patient_id), history=timeline.visits(patient_id))
+
+
+# --- DEPARTMENTS AND DOCTORS ---
+
+def department_list_fragment(template):
+    return cache.fragment(template, ('departments',),
+                          lambda: render_template(f'fragments/{template}.html', departments=Department.query.all()))
+
+@bp.route('/departments')
+@login_required
+@cache.conditional('departments')
+def departments():
+    return render_template('departments.html', cards=department_list_fragment('department_cards'))
+
+@bp.route('/department/<int:department_id>')
+@login_required
+@cache.conditional('departments', 'doctors')
+def department_details(department_id):
+    def render():
+        dept = db.session.get(Department, department_id)
+        doctors = User.query.filter_by(role='doctor', department_id=department_id).all()
+        return render_template('fragments/department_details.html', department=dept, doctors=doctors)
+    body = cache.fragment(f'department_details:{department_id}', ('departments', 'doctors'), render)
+    return render_template('department_details.html', body=body, department_id=department_id)
+
+@bp.route('/doctor/<int:doctor_id>/details')
+@login_required
+@cache.conditional('departments', 'doctors')
+def doctor_profile(doctor_id):
+    body = cache.fragment(f'doctor_profile:{doctor_id}', ('departments', 'doctors'),
+                          lambda: render_template('fragments/doctor_profile.html', doctor=db.session.get(User, doctor_id)))
+    return render_template('doctor_profile.html', body=body)
+
+
+# --- APPOINTMENT OPERATIONS ---
+
+def doctor_slots(doctor_id):
+    """Upcoming free slots from the schedule grid, or the free slot index when the grid cannot tell."""
+    slots = schedule.open_slots(doctor_id)
+    return slots if slots is not None else free_slots.for_doctor(doctor_id).all()
+
+@bp.route('/book_appointment/<int:doctor_id>', methods=['GET', 'POST'])
+@login_required
+def book_appointment(doctor_id):
+    doctor = db.session.get(User, doctor_id)
+
+    if request.method == 'POST':
+        # 1. Parse Data
+        date_str = request.form.get('date')
+        slot_type = request.form.get('slot')
+
+        appt_date = datetime.strptime(date_str, DATE_FMT).date()
+        appt_time = booking.slot_time(slot_type)
+
+        # 2. Claim the slot - the DB rejects a second Scheduled booking for it
+        try:
+            booking.book(current_user.id, doctor_id, appt_date, appt_time)
+        except booking.SlotTaken:
+            flash('Sorry, that slot was just booked by someone else.', 'danger')
+            return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
+
+        flash('Appointment booked successfully!', 'success')
+        return redirect(url_for('patient.patient_dashboard'))
+
+    # GET: Show slots that are open and not yet booked
+    availabilities = doctor_slots(doctor_id)
+
+    return render_template('book_appointment.html', doctor=doctor, availabilities=availabilities)
+
+@bp.route('/department/<int:department_id>/assign', methods=['POST'])
+@login_required
+def assign_appointment(department_id):
+    if current_user.role != 'patient': return redirect(url_for('index'))
+
+    # Optional window; assign.assign() defaults to the next ASSIGN_WINDOW_DAYS
+    try:
+        date_from = datetime.strptime(request.form['date_from'], DATE_FMT).date() if request.form.get('date_from') else None
+        date_to = datetime.strptime(request.form['date_to'], DATE_FMT).date() if request.form.get('date_to') else None
+    except ValueError:
+        flash('Invalid date.', 'warning')
+        return redirect(url_for('patient.department_details', department_id=department_id))
+
+    try:
+        appt = assign.assign(current_user.id, department_id, date_from, date_to)
+    except assign.NoSlot:
+        flash('No doctor in this department has a free slot in those dates.', 'warning')
+        return redirect(url_for('patient.department_details', department_id=department_id))
+    except booking.SlotTaken:
+        flash('Those slots were just taken. Please try again.', 'danger')
+        return redirect(url_for('patient.department_details', department_id=department_id))
+
+    flash(f"Booked with Dr. {appt.doctor_ref.username} on {appt.appointment_date.strftime(DATE_FMT)} "
+          f"at {appt.appointment_time.strftime('%H:%M')}.", 'success')
+    return redirect(url_for('patient.patient_dashboard'))
+
+@bp.route('/appointment/<int:appointment_id>/cancel')
+@login_required
+def cancel_appointment(appointment_id):
+    appt = db.session.get(Appointment, appointment_id)
+    if not appt: return redirect(url_for('index'))
+
+    # Check permission (Owner or Doctor)
+    if (current_user.role == 'patient' and appt.patient_id == current_user.id) or \
+       (current_user.role == 'doctor' and appt.doctor_id == current_user.id):
+        appt.status = 'Cancelled'
+        db.session.commit()
+        flash('Cancelled.', 'info')
+
+    return redirect(url_for('doctor.doctor_dashboard') if current_user.role == 'doctor' else url_for('patient.patient_dashboard'))
+
+@bp.route('/appointment/<int:appointment_id>/reschedule', methods=['GET', 'POST'])
+@login_required
+def reschedule_appointment(appointment_id):
+    # 1. Fetch Appointment & Verify Owner
+    appt = db.session.get(Appointment, appointment_id)
+    if not appt or appt.patient_id != current_user.id:
+        flash('Access denied.', 'danger')
+        return redirect(url_for('patient.patient_dashboard'))
+
+    doctor = db.session.get(User, appt.doctor_id)
+
+    if request.method == 'POST':
+        # 2. Parse New Date & Time
+        new_date_str = request.form.get('date')
+        new_slot = request.form.get('slot')
+
+        new_date = datetime.strptime(new_date_str, DATE_FMT).date()
+        new_time = booking.slot_time(new_slot)
+
+        # 3. Move the Appointment - fails if *another* appointment holds the slot
+        try:
+            booking.reschedule(appt, new_date, new_time)
+        except booking.SlotTaken:
+            flash('That slot is already booked. Please choose another.', 'danger')
+            return redirect(url_for('patient.reschedule_appointment', appointment_id=appointment_id))
+
+        flash('Appointment rescheduled successfully!', 'success')
+        return redirect(url_for('patient.patient_dashboard'))
+
+    # GET: Show free slots so user knows what to pick
+    availabilities = doctor_slots(doctor.id)
+
+    return render_template('reschedule_appointment.html', appointment=appt, doctor=doctor, availabilities=availabilities)
@@ -0,0 +1,183 @@
+"""
+Shared query layer.
+Each view gets its rows together with the relationships its template touches,
+so rendering does not fire one lazy SELECT per row.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, case, func, or_, select, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, User, Appointment, Treatment
+
+DATE_FMT = '%Y-%m-%d'
+TIME_FMT = '%H:%M:%S'
+
+# --- LOADER STRATEGIES ---
+
+# The refs are backrefs declared on User, so they only exist on Appointment
+# once the mappers are configured - build the options lazily.
+
+def doctor_with_department():
+    # Many-to-one refs are joined into the main SELECT.
+    return joinedload(Appointment.doctor_ref).joinedload(User.department)
+
+def patient():
+    return joinedload(Appointment.patient_ref)
+
+def treatment():
+    # One-to-one treatment is fetched in one extra IN (...) query for the whole page.
+    return selectinload(Appointment.treatment)
+
+
+# --- PER-VIEW QUERIES ---
+
+def admin_appointments():
+    """Admin dashboard: patient, doctor and doctor's department per row."""
+    return Appointment.query.options(patient(), doctor_with_department())
+
+def admin_users(role):
+    """Admin dashboard doctor cards / patient table."""
+    return User.query.filter_by(role=role).options(joinedload(User.department))
+
+def doctor_appointments(doctor_id):
+    """Doctor dashboard: upcoming appointments with the patient name."""
+    return Appointment.query.filter_by(doctor_id=doctor_id, status='Scheduled').options(patient())
+
+def patient_appointments(patient_id):
+    """Patient dashboard: own appointments with doctor and department."""
+    return Appointment.query.filter_by(patient_id=patient_id).options(doctor_with_department())
+
+def patient_history(patient_id):
+    """Medical history: doctor, department and treatment for every visit."""
+    return Appointment.query.filter_by(patient_id=patient_id).options(doctor_with_department(), treatment())
+
+def api_appointments():
+    """AppointmentAPI.get: doctor and patient names are marshalled per row."""
+    return Appointment.query.options(patient(), joinedload(Appointment.doctor_ref))
+
+
+# --- KEYSET PAGINATION ---
+# Appointments are listed in (appointment_date, appointment_time, id) order.
+# A page is fetched with "WHERE (date, time, id) > last_seen LIMIT n", so
+# page 1000 costs the same as page 1 (no OFFSET scan).
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(appt):
+    raw = f"{appt.appointment_date.strftime(DATE_FMT)}|{appt.appointment_time.strftime(TIME_FMT)}|{appt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Raises ValueError for anything that is not a cursor we handed out."""
+    try:
+        date_str, time_str, appt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return (datetime.strptime(date_str, DATE_FMT).date(),
+                datetime.strptime(time_str, TIME_FMT).time(),
+                int(appt_id))
+    except (TypeError, UnicodeDecodeError, binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+
+def page_size(limit):
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def filter_appointments(query, status=None, doctor_id=None, patient_id=None, date_from=None, date_to=None):
+    if status:
+        query = query.filter(Appointment.status == status)
+    if doctor_id:
+        query = query.filter(Appointment.doctor_id == doctor_id)
+    if patient_id:
+        query = query.filter(Appointment.patient_id == patient_id)
+    if date_from:
+        query = query.filter(Appointment.appointment_date >= date_from)
+    if date_to:
+        query = query.filter(Appointment.appointment_date <= date_to)
+    return query
+
+def appointment_filters(args):
+    """Reads the filter_appointments() arguments from query args (admin dashboard, API, export)."""
+    def to_date(key):
+        return datetime.strptime(args[key], DATE_FMT).date() if args.get(key) else None
+
+    return {
+        'status': args.get('status') or None,
+        'doctor_id': args.get('doctor_id', type=int),
+        'patient_id': args.get('patient_id', type=int),
+        'date_from': to_date('date_from'),
+        'date_to': to_date('date_to'),
+    }
+
+def page_query(query, cursor=None, size=DEFAULT_PAGE_SIZE):
+    """`query` narrowed to the page after `cursor`, plus one row to detect a next page."""
+    key = tuple_(Appointment.appointment_date, Appointment.appointment_time, Appointment.id)
+    if cursor:
+        query = query.filter(key > tuple_(*decode_cursor(cursor)))
+    return query.order_by(Appointment.appointment_date, Appointment.appointment_time, Appointment.id).limit(size + 1)
+
+def split_page(rows, size):
+    """(rows, next_cursor) from the size + 1 rows page_query returned."""
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+def appointment_page(query, cursor=None, limit=None):
+    """
+    Returns (rows, next_cursor). next_cursor is None on the last page.
+    One extra row is fetched to know whether another page exists.
+    """
+    size = page_size(limit)
+    return split_page(page_query(query, cursor, size).all(), size)
+
+
+# --- DOCTOR'S PATIENT ROSTER ---
+# Every patient who has an appointment with the doctor, with their number of
+# visits, last visit and latest diagnosis, by name. A visit is a Completed
+# appointment, or any other past one that was not cancelled (appointments
+# booked before doctors could mark them completed stay Scheduled). One statement
+# per page: the doctor's appointments are grouped by patient (index range on
+# doctor_id), and the latest diagnosis is looked up only for the page's rows.
+# Archived visits (archive.py) are not counted.
+
+def encode_roster_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps([row.username, row.id]).encode()).decode()
+
+def decode_roster_cursor(cursor):
+    try:
+        username, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(username), int(patient_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+
+def roster_query(doctor_id, cursor=None, size=DEFAULT_PAGE_SIZE):
+    """SELECT of size + 1 roster rows after `cursor`: id, username, email, visits, last_visit, latest_diagnosis."""
+    visited = or_(Appointment.status == 'Completed',
+                  and_(Appointment.status != 'Cancelled', Appointment.appointment_date < date.today()))
+    grouped = select(
+        Appointment.patient_id,
+        func.sum(case((visited, 1), else_=0)).label('visits'),
+        func.max(case((visited, Appointment.appointment_date))).label('last_visit'),
+    ).where(Appointment.doctor_id == doctor_id).group_by(Appointment.patient_id).subquery()
+
+    page = select(User.id, User.username, User.email, grouped.c.visits, grouped.c.last_visit) \
+        .join(grouped, grouped.c.patient_id == User.id)
+    if cursor:
+        page = page.where(tuple_(User.username, User.id) > tuple_(*decode_roster_cursor(cursor)))
+    page = page.order_by(User.username, User.id).limit(size + 1).subquery()
+
+    latest_diagnosis = select(Treatment.diagnosis) \
+        .join(Appointment, Appointment.id == Treatment.appointment_id) \
+        .where(Appointment.doctor_id == doctor_id, Appointment.patient_id == page.c.id) \
+        .order_by(Appointment.appointment_date.desc(), Appointment.id.desc()).limit(1).scalar_subquery()
+    return select(page, latest_diagnosis.label('latest_diagnosis')).order_by(page.c.username, page.c.id)
+
+def roster_page(doctor_id, cursor=None, limit=None):
+    """(rows, next_cursor) of the doctor's patient roster; next_cursor is None on the last page."""
+    size = page_size(limit)
+    rows = db.session.execute(roster_query(doctor_id, cursor, size)).all()
+    if len(rows) > size:
+        return rows[:size], encode_roster_cursor(rows[size - 1])
+    return rows, None
@@ -0,0 +1,120 @@
+"""
+Read replicas: the reads of GET requests go to a replica, everything else to the primary.
+
+DATABASE_REPLICA_URLS lists the replicas, comma-separated; config.load()
+registers them as the binds 'replica-1', 'replica-2', ... db.session
+(RoutingSession, see models.py) sends a statement to a replica when
+  - it is a SELECT on the primary's tables (the archive bind stays put)
+  - it runs in a GET or HEAD request
+  - the request has not written yet: from its first flush or UPDATE /
+    DELETE on, the rest of the request reads the primary
+  - the user has not written in the last REPLICA_STICKY_SECONDS. A commit
+    that wrote stamps the user's session cookie, so the pages they load
+    next read the primary while the replicas catch up (read-your-writes,
+    across worker processes). Clients that drop cookies don't get this.
+Everything else - POSTs, CLI tools, job workers - uses the primary. One
+replica is picked at random per request, so a page reads one snapshot.
+
+Code that fills a cache shared with other users (identity.py, page
+fragments, dashboard stats, stored timelines) reads inside
+`with replicas.primary():`, since an entry built from a lagging replica
+would outlive the lag.
+
+SQLite file copies of the primary work as replicas for local testing:
+
+    export HMS_DATABASE_REPLICA_URLS=sqlite:///replica1.db,sqlite:///replica2.db
+    python replicas.py --copy   # (re)copy the primary into every SQLite replica
+"""
+import sys
+import time
+import random
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from flask import current_app, has_request_context, request, session as cookie
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+import config
+
+READ_METHODS = ('GET', 'HEAD')
+WROTE_AT = '_wrote_at'  # session cookie: time of the user's last committed write
+
+_pinned = ContextVar('replicas_pinned', default=False)
+
+
+def engines(all_engines):
+    """The replica engines among db.engines."""
+    return [engine for key, engine in all_engines.items() if key and key.startswith(config.REPLICA_BIND_PREFIX)]
+
+@contextmanager
+def primary():
+    """Reads inside the block go to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+def _sticky():
+    wrote_at = cookie.get(WROTE_AT)
+    return wrote_at is not None and time.time() - wrote_at < current_app.config['REPLICA_STICKY_SECONDS']
+
+def _may_read_replica(session):
+    return has_request_context() and request.method in READ_METHODS and not _pinned.get() \
+        and not session.info.get('wrote') and not _sticky()
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy's session, with the SELECTs of read-only requests sent to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+        elif bind is None and getattr(clause, 'is_select', False) and engine is self._db.engines.get(None):
+            replicas = engines(self._db.engines)
+            if replicas and _may_read_replica(self):
+                if 'replica' not in self.info:
+                    self.info['replica'] = random.choice(replicas)
+                return self.info['replica']
+        return engine
+
+
+# --- WRITE TRACKING ---
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _mark_write(session, flush_context, instances):
+    # Before the flush's own statements: nothing after it reads a replica
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if session.info.get('wrote') and has_request_context() and engines(session._db.engines):
+        cookie[WROTE_AT] = time.time()
+
+
+# --- LOCAL REPLICAS ---
+
+def copy(db):
+    """Copies the primary into every SQLite replica (a consistent snapshot); returns their paths."""
+    copied = []
+    with closing(db.engine.raw_connection()) as source:
+        for engine in engines(db.engines):
+            if engine.dialect.name != 'sqlite':
+                continue
+            with closing(engine.raw_connection()) as target:
+                source.driver_connection.backup(target.driver_connection)
+            copied.append(engine.url.database)
+    return copied
+
+
+if __name__ == '__main__':
+    from app import create_app
+    from models import db
+    if '--copy' not in sys.argv:
+        sys.exit(__doc__)
+    with create_app(blueprints=()).app_context():
+        copied = copy(db)
+        for path in copied:
+            print(f'Copied the primary to {path}')
+        if not copied:
+            sys.exit('No SQLite replicas in HMS_DATABASE_REPLICA_URLS')
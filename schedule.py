@@ -0,0 +1,246 @@
+"""
+In-process schedule grid: every doctor's upcoming slots as two bitmaps.
+
+Bit 2*d + s stands for day d of the horizon (0 = the day the grid was
+loaded) and slot s (0 = Morning 09:00, 1 = Evening 16:00). `open` holds the
+slots the doctor made available, `booked` those held by a Scheduled
+appointment, so "is this slot taken" is a shift and a mask, and a doctor's
+free slots are open & ~booked - no database round trip.
+
+A doctor's grid covers SCHEDULE_HORIZON_DAYS and is reloaded (two indexed
+SELECTs on a connection of its own, so it only ever holds committed data) when
+  - a committed ORM write touched the doctor's appointments or availability:
+    the version stamp schedule-<doctor_id> is bumped on commit (cache.py), so
+    every worker process notices with one stat, no SQL. Bulk statements bump
+    'schedule', which retires every grid
+  - it is older than SCHEDULE_TTL seconds (writes made outside the ORM)
+  - the date has rolled over
+warm() loads all doctors at startup.
+
+Lookups outside the horizon return None and the caller asks the database.
+The database stays the authority either way: the unique slot index still
+decides every booking, the grid only refuses known clashes early.
+
+    python schedule.py --check   # compare the grids with appointments and the free slot index
+"""
+import sys
+import time
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from models import db, User, Appointment, DoctorAvailability, FreeSlot, SLOT_TIMES
+import cache
+
+SLOT_BITS = {'Morning': 0, 'Evening': 1}
+SLOT_NAMES = {bit: name for name, bit in SLOT_BITS.items()}
+TIME_BITS = {SLOT_TIMES[name]: bit for name, bit in SLOT_BITS.items()}
+
+# Same attributes the slot templates read from a FreeSlot row
+Slot = namedtuple('Slot', 'doctor_id available_date slot_type')
+
+_settings = {'enabled': True, 'horizon': 90, 'ttl': 300}
+_lock = threading.Lock()
+_grids = {}  # doctor_id -> Grid
+
+
+class Grid:
+    """One doctor's slots for `days` days from `origin`."""
+    __slots__ = ('origin', 'days', 'open', 'booked', 'beyond', 'version', 'loaded_at')
+
+    def __init__(self, origin, days, version):
+        self.origin, self.days, self.version = origin, days, version
+        self.open = self.booked = 0
+        self.beyond = False  # availability after the horizon exists
+        self.loaded_at = time.monotonic()
+
+    def bit(self, day, slot):
+        """Mask of (day, slot), or None outside the horizon."""
+        offset = (day - self.origin).days
+        return 1 << (2 * offset + slot) if 0 <= offset < self.days else None
+
+    def free(self, date_from, date_to):
+        """Free (date, slot bit) pairs in the range, earliest first."""
+        # Shifted so the first bit is date_from: no walk over the days before it
+        start = 2 * max(0, (date_from - self.origin).days)
+        bits = (self.open & ~self.booked) >> start
+        while bits:
+            low = bits & -bits
+            index = start + low.bit_length() - 1
+            bits ^= low
+            day = self.origin + timedelta(days=index // 2)
+            if day > date_to:
+                return
+            yield day, index % 2
+
+
+def init_app(app):
+    _settings['enabled'] = app.config['SCHEDULE_GRID']
+    _settings['horizon'] = app.config['SCHEDULE_HORIZON_DAYS']
+    _settings['ttl'] = app.config['SCHEDULE_TTL']
+
+def _version(doctor_id):
+    return cache.version('schedule', f'schedule-{doctor_id}')
+
+def _load(doctor_ids):
+    """Fresh grids for `doctor_ids`: one SELECT of availability, one of bookings."""
+    # Versions first: a write committed while we read makes the result stale at once
+    versions = {doctor_id: _version(doctor_id) for doctor_id in doctor_ids}
+    origin, days = date.today(), _settings['horizon']
+    end = origin + timedelta(days=days)
+    grids = {doctor_id: Grid(origin, days, versions[doctor_id]) for doctor_id in doctor_ids}
+    with db.engine.connect() as conn:
+        for doctor_id, day, slot_type in conn.execute(
+                select(DoctorAvailability.doctor_id, DoctorAvailability.available_date, DoctorAvailability.slot_type)
+                .where(DoctorAvailability.doctor_id.in_(doctor_ids), DoctorAvailability.available_date >= origin)):
+            grid = grids[doctor_id]
+            if day >= end:
+                grid.beyond = True
+            else:
+                # Anything that is not 'Morning' is the evening slot (booking.slot_time)
+                grid.open |= grid.bit(day, SLOT_BITS['Morning'] if slot_type == 'Morning' else SLOT_BITS['Evening'])
+        for doctor_id, day, appt_time in conn.execute(
+                select(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time)
+                .where(Appointment.doctor_id.in_(doctor_ids), Appointment.status == 'Scheduled',
+                       Appointment.appointment_date >= origin, Appointment.appointment_date < end)):
+            if appt_time in TIME_BITS:
+                grids[doctor_id].booked |= grids[doctor_id].bit(day, TIME_BITS[appt_time])
+    return grids
+
+def _grid(doctor_id):
+    with _lock:
+        grid = _grids.get(doctor_id)
+    if grid is None or grid.origin != date.today() or time.monotonic() - grid.loaded_at > _settings['ttl'] \
+            or grid.version != _version(doctor_id):
+        grid = _load([doctor_id])[doctor_id]
+        with _lock:
+            _grids[doctor_id] = grid
+    return grid
+
+def warm():
+    """Loads every doctor's grid (startup)."""
+    if not _settings['enabled']:
+        return 0
+    doctor_ids = db.session.scalars(select(User.id).where(User.role == 'doctor')).all()
+    grids = _load(doctor_ids) if doctor_ids else {}
+    with _lock:
+        _grids.update(grids)
+    return len(grids)
+
+def clear():
+    with _lock:
+        _grids.clear()
+
+
+# --- LOOKUPS ---
+# None means "not known here" (grid disabled, outside the horizon): ask the database.
+
+def is_taken(doctor_id, day, appt_time):
+    """Whether a Scheduled appointment holds the slot."""
+    if not _settings['enabled'] or appt_time not in TIME_BITS:
+        return None
+    grid = _grid(doctor_id)
+    mask = grid.bit(day, TIME_BITS[appt_time])
+    return None if mask is None else bool(grid.booked & mask)
+
+def is_free(doctor_id, day, slot_type):
+    """Whether the doctor opened the slot and nobody holds it."""
+    if not _settings['enabled'] or slot_type not in SLOT_BITS:
+        return None
+    grid = _grid(doctor_id)
+    mask = grid.bit(day, SLOT_BITS[slot_type])
+    return None if mask is None else bool(grid.open & ~grid.booked & mask)
+
+def open_slots(doctor_id, date_from=None, date_to=None):
+    """Free Slots of the doctor in the range (default: from today on), like free_slots.for_doctor()."""
+    if not _settings['enabled']:
+        return None
+    grid = _grid(doctor_id)
+    date_from = date_from or grid.origin
+    last = grid.origin + timedelta(days=grid.days - 1)
+    if date_from < grid.origin or ((date_to is None or date_to > last) and grid.beyond):
+        return None
+    return [Slot(doctor_id, day, SLOT_NAMES[bit]) for day, bit in grid.free(date_from, min(date_to or last, last))]
+
+def free_and_booked(doctor_id, date_from, date_to):
+    """
+    (the doctor's free (date, slot_type) in the range, earliest first, as an
+    iterator; their number of Scheduled appointments in the horizon), for assign.py.
+    """
+    if not _settings['enabled']:
+        return None
+    grid = _grid(doctor_id)
+    last = grid.origin + timedelta(days=grid.days - 1)
+    if date_from < grid.origin or (date_to > last and grid.beyond):
+        return None
+    free = ((day, SLOT_NAMES[bit]) for day, bit in grid.free(date_from, min(date_to, last)))
+    return free, bin(grid.booked).count('1')
+
+
+# --- INVALIDATION ---
+
+SLOT_FIELDS = {Appointment: ('doctor_id', 'appointment_date', 'appointment_time', 'status'),
+               DoctorAvailability: ('doctor_id', 'available_date', 'slot_type')}
+
+@event.listens_for(Session, 'after_flush')
+def _touch_on_flush(session, flush_context):
+    changes = [(obj, True) for obj in list(session.new) + list(session.deleted)] + [(obj, False) for obj in session.dirty]
+    deps = set()
+    for obj, added_or_deleted in changes:
+        fields = SLOT_FIELDS.get(type(obj))
+        if not fields:
+            continue
+        state = inspect(obj)
+        if added_or_deleted or any(state.attrs[f].history.has_changes() for f in fields):
+            deps.update(f'schedule-{doctor_id}' for doctor_id in {obj.doctor_id, *state.attrs.doctor_id.history.deleted})
+    if deps:
+        cache.bump_on_commit(session, *deps)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _touch_on_bulk(orm_execute_state):
+    # Bulk statements do not say which doctors they touch
+    mapper = orm_execute_state.bind_mapper
+    if not orm_execute_state.is_select and mapper is not None and mapper.class_ in SLOT_FIELDS:
+        cache.bump_on_commit(orm_execute_state.session, 'schedule')
+
+
+# --- CONSISTENCY CHECK ---
+
+def check():
+    """
+    Compares every doctor's current grid with a fresh one from the database and
+    its free slots with the free slot index. Returns a list of problems.
+    """
+    doctor_ids = db.session.scalars(select(User.id).where(User.role == 'doctor')).all()
+    fresh = _load(doctor_ids) if doctor_ids else {}
+    indexed = {}
+    for doctor_id, day, slot_type in db.session.execute(
+            select(FreeSlot.doctor_id, FreeSlot.available_date, FreeSlot.slot_type).where(FreeSlot.available_date >= date.today())):
+        indexed.setdefault(doctor_id, set()).add((day, slot_type))
+    problems = []
+    for doctor_id in doctor_ids:
+        grid, expected = _grid(doctor_id), fresh[doctor_id]
+        if (grid.open, grid.booked) != (expected.open, expected.booked):
+            problems.append(f'doctor {doctor_id}: grid differs from the database')
+        last = expected.origin + timedelta(days=expected.days - 1)
+        free = {(day, SLOT_NAMES[bit]) for day, bit in expected.free(expected.origin, last)}
+        in_index = {(day, slot) for day, slot in indexed.get(doctor_id, ()) if day <= last}
+        if free != in_index:
+            problems.append(f'doctor {doctor_id}: {len(free - in_index)} free slots missing from free_slots, '
+                            f'{len(in_index - free)} there but not free')
+    return problems
+
+
+if __name__ == '__main__':
+    from app import create_app
+    if '--check' not in sys.argv:
+        sys.exit(__doc__)
+    with create_app(blueprints=()).app_context():
+        print(f'Loaded {warm()} doctor grids')
+        problems = check()
+        for problem in problems:
+            print(problem)
+        print('Grid consistent with the database' if not problems else f'{len(problems)} problems')
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,162 @@
+"""
+Indexed search over users (username, email) and treatment records
+(diagnosis, prescription, doctor_notes).
+
+SQLite:     FTS5 tables users_fts / treatments_fts, external-content over the
+            real tables and kept in sync by AFTER INSERT/UPDATE/DELETE triggers,
+            so every write path (ORM, bulk, raw SQL) is covered. Ranked by bm25.
+PostgreSQL: pg_trgm GIN indexes on the same columns; ILIKE uses them and
+            results are ranked by similarity(). Unverified: this path has
+            not been run against a PostgreSQL server yet (no tests or
+            benchmark cover it), only the SQLite one has.
+
+install() creates the index (migrate.py / startup). Until it has run, the
+lookups fall back to plain ILIKE so search never breaks, it is only slower.
+"""
+import re
+from sqlalchemy import func, or_, text, inspect, select, literal_column
+from sqlalchemy.orm import joinedload
+from models import db, User, Appointment, Treatment
+
+_installed = {}  # engine url -> bool
+
+SQLITE_DDL = [
+    # prefix='2 3': 2- and 3-character prefix indexes make "car*" style queries cheap
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        username, email, content='users', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, username, email) VALUES (new.id, new.username, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, email ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email);
+        INSERT INTO users_fts(rowid, username, email) VALUES (new.id, new.username, new.email);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS treatments_fts USING fts5(
+        diagnosis, prescription, doctor_notes, content='treatments', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS treatments_fts_ai AFTER INSERT ON treatments BEGIN
+        INSERT INTO treatments_fts(rowid, diagnosis, prescription, doctor_notes)
+        VALUES (new.id, new.diagnosis, new.prescription, new.doctor_notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS treatments_fts_ad AFTER DELETE ON treatments BEGIN
+        INSERT INTO treatments_fts(treatments_fts, rowid, diagnosis, prescription, doctor_notes)
+        VALUES ('delete', old.id, old.diagnosis, old.prescription, old.doctor_notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS treatments_fts_au AFTER UPDATE OF diagnosis, prescription, doctor_notes ON treatments BEGIN
+        INSERT INTO treatments_fts(treatments_fts, rowid, diagnosis, prescription, doctor_notes)
+        VALUES ('delete', old.id, old.diagnosis, old.prescription, old.doctor_notes);
+        INSERT INTO treatments_fts(rowid, diagnosis, prescription, doctor_notes)
+        VALUES (new.id, new.diagnosis, new.prescription, new.doctor_notes);
+    END""",
+]
+
+POSTGRES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_treatments_diagnosis_trgm ON treatments USING gin (diagnosis gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_treatments_prescription_trgm ON treatments USING gin (prescription gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_treatments_notes_trgm ON treatments USING gin (doctor_notes gin_trgm_ops)',
+]
+
+
+# --- SETUP ---
+
+def install():
+    """Creates the search index for the current backend and (re)fills it."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        for ddl in SQLITE_DDL:
+            db.session.execute(text(ddl))
+        # Index rows that existed before the triggers
+        db.session.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+        db.session.execute(text("INSERT INTO treatments_fts(treatments_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for ddl in POSTGRES_DDL:
+            db.session.execute(text(ddl))
+    db.session.commit()
+    _installed[str(db.engine.url)] = dialect in ('sqlite', 'postgresql')
+
+def is_installed():
+    key = str(db.engine.url)
+    if key not in _installed:
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            _installed[key] = inspect(db.engine).has_table('users_fts')
+        elif dialect == 'postgresql':
+            _installed[key] = 'ix_users_username_trgm' in {ix['name'] for ix in inspect(db.engine).get_indexes('users')}
+        else:
+            _installed[key] = False
+    return _installed[key]
+
+def fts_query(q):
+    """'card hyper' -> '"card"* "hyper"*' : every word must match, as a prefix."""
+    words = re.findall(r'\w+', q or '')
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+# --- USERS ---
+
+def _user_match(q):
+    """(join/filter clause, rank expression, FTS subquery or None) for users matching `q`."""
+    if is_installed() and db.engine.dialect.name == 'sqlite':
+        # Join on the FTS rowid; bm25 is lower-is-better, username weighted over email
+        match = text('users_fts MATCH :q').bindparams(q=fts_query(q))
+        ranked = select(literal_column('rowid').label('user_id'), literal_column('bm25(users_fts, 2.0, 1.0)').label('rank')) \
+            .select_from(text('users_fts')).where(match).subquery()
+        return User.id == ranked.c.user_id, ranked.c.rank, ranked
+    like = f'%{q}%'
+    clause = or_(User.username.ilike(like), User.email.ilike(like))
+    if is_installed():
+        # PostgreSQL trigram: higher similarity first
+        return clause, -func.greatest(func.similarity(User.username, q), func.similarity(User.email, q)), None
+    return clause, User.id, None
+
+def users_query(q, base=None):
+    """Users matching `q`, best match first. `base` narrows it (e.g. a role filter)."""
+    query = base if base is not None else User.query
+    if not fts_query(q):
+        return query.filter(db.false())
+    clause, rank, ranked = _user_match(q)
+    if ranked is not None:
+        query = query.join(ranked, clause)
+    else:
+        query = query.filter(clause)
+    return query.order_by(rank)
+
+
+# --- TREATMENT RECORDS ---
+
+def treatments_query(q):
+    """Treatment records matching `q`, best match first, with appointment/patient/doctor loaded."""
+    query = Treatment.query.options(
+        joinedload(Treatment.appointment).joinedload(Appointment.patient_ref),
+        joinedload(Treatment.appointment).joinedload(Appointment.doctor_ref))
+    if not fts_query(q):
+        return query.filter(db.false())
+    if is_installed() and db.engine.dialect.name == 'sqlite':
+        # Diagnosis matters most, notes least
+        ranked = select(literal_column('rowid').label('treatment_id'), literal_column('bm25(treatments_fts, 3.0, 2.0, 1.0)').label('rank')) \
+            .select_from(text('treatments_fts')) \
+            .where(text('treatments_fts MATCH :q').bindparams(q=fts_query(q))).subquery()
+        return query.join(ranked, Treatment.id == ranked.c.treatment_id).order_by(ranked.c.rank)
+    like = f'%{q}%'
+    clause = or_(Treatment.diagnosis.ilike(like), Treatment.prescription.ilike(like), Treatment.doctor_notes.ilike(like))
+    if is_installed():
+        return query.filter(clause).order_by(-func.greatest(
+            func.similarity(Treatment.diagnosis, q), func.similarity(Treatment.prescription, q),
+            func.similarity(func.coalesce(Treatment.doctor_notes, ''), q)))
+    return query.filter(clause).order_by(Treatment.id.desc())
+
+
+# --- PAGINATION ---
+
+def page(query, page_number, limit):
+    """Offset page of a ranked query: (rows, has_more). Ranked results have no stable seek key."""
+    page_number = max(1, page_number or 1)
+    rows = query.offset((page_number - 1) * limit).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,214 @@
+"""
+Synthetic hospital data for load testing.
+
+    python seed_data.py --doctors 500 --patients 1000000 --appointments 10000000
+
+Rows go in through bulk INSERTs of --batch rows with explicit ids, so
+Treatment rows can point at their Appointment without reading it back.
+Distributions:
+  - doctor popularity is heavy-tailed (a few doctors get most visits)
+  - past appointments are Completed (85%) or Cancelled (15%); Completed ones get a Treatment
+  - the next --days-ahead days are filled slot by slot, so Scheduled slots never collide
+  - doctors open a Morning slot on ~70% of days and an Evening slot on ~40%
+
+Every generated account uses the password PASSWORD (stored hashed). Emails are
+doctor<n>@hms.test and patient<n>@hms.test, plus admin@hms.test if the
+database has no admin yet.
+"""
+import argparse
+import itertools
+import random
+import time as timer
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from app import create_app
+from models import db, User, Department, Appointment, Treatment, DoctorAvailability, FreeSlot, SLOT_TIMES
+import free_slots
+import passwords
+
+PASSWORD = '123'
+DEPARTMENTS = ['Cardiology', 'Neurology', 'Orthopedics', 'Pediatrics', 'Dermatology', 'Oncology',
+               'Gastroenterology', 'Psychiatry', 'Radiology', 'Urology', 'Nephrology', 'ENT']
+DIAGNOSES = ['Hypertension', 'Migraine', 'Type 2 diabetes', 'Seasonal influenza', 'Lower back pain',
+             'Atopic dermatitis', 'Gastritis', 'Anxiety disorder', 'Fractured wrist', 'Otitis media']
+PRESCRIPTIONS = ['Paracetamol 500mg (2 times a day)', 'Amlodipine 5mg (1 time a day)',
+                 'Metformin 500mg (2 times a day)', 'Ibuprofen 400mg (as needed)', 'Rest and fluids']
+
+
+def next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+def insert_batches(model, rows, batch):
+    """Inserts an iterable of dicts `batch` rows at a time; returns the row count."""
+    table, chunk, total = model.__table__, [], 0
+    conn = db.session.connection()
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch:
+            conn.execute(table.insert(), chunk)
+            total += len(chunk)
+            chunk = []
+            db.session.commit()
+            conn = db.session.connection()
+    if chunk:
+        conn.execute(table.insert(), chunk)
+        total += len(chunk)
+    db.session.commit()
+    return total
+
+def seed_admin():
+    if not User.query.filter_by(role='admin').first():
+        db.session.add(User(username='admin', email='admin@hms.test', password=passwords.hash_password(PASSWORD), role='admin'))
+        db.session.commit()
+    return User.query.filter_by(role='admin').count()
+
+def seed_departments():
+    existing = {d.name: d.id for d in Department.query.all()}
+    for name in DEPARTMENTS:
+        if name not in existing:
+            db.session.add(Department(name=name, description=f'Department of {name}'))
+    db.session.commit()
+    return [d.id for d in Department.query.all()]
+
+def seed_users(role, count, batch, department_ids=None):
+    """Returns the list of new user ids."""
+    start = next_id(User)
+    # Continue numbering after earlier runs so usernames/emails stay unique
+    offset = User.query.filter(User.email.like(f'{role}%@hms.test')).count()
+    # One hash shared by every generated account: hashing a million times would dominate the run
+    password = passwords.hash_password(PASSWORD)
+
+    def rows():
+        for i in range(count):
+            n = offset + i + 1
+            yield {
+                'id': start + i,
+                'username': f'{role}{n}',
+                'email': f'{role}{n}@hms.test',
+                'password': password,
+                'role': role,
+                'phone_number': f'9{random.randrange(10**8, 10**9)}',
+                'is_active_user': random.random() > 0.02,
+                'department_id': random.choice(department_ids) if department_ids else None,
+            }
+    insert_batches(User, rows(), batch)
+    return list(range(start, start + count))
+
+def seed_appointments(doctors, patients, count, days_back, days_ahead, fill_rate, batch):
+    """Past visits (count) plus slot-by-slot Scheduled visits for the next days_ahead days."""
+    today = date.today()
+    # Heavy-tailed popularity: Pareto weights, cumulative for fast random.choices
+    cum_weights = list(itertools.accumulate(random.paretovariate(1.2) for _ in doctors))
+    slots = list(SLOT_TIMES.values())
+    appt_start = next_id(Appointment)
+    treat_start = next_id(Treatment)
+    treatments = []
+
+    def past():
+        next_treatment = treat_start
+        for i in range(count):
+            appt_id = appt_start + i
+            day = today - timedelta(days=random.randint(1, days_back))
+            status = 'Completed' if random.random() < 0.85 else 'Cancelled'
+            created = datetime.combine(day, SLOT_TIMES['Morning']) - timedelta(days=random.randint(1, 30))
+            if status == 'Completed':
+                treatments.append({
+                    'id': next_treatment, 'appointment_id': appt_id,
+                    'diagnosis': random.choice(DIAGNOSES), 'prescription': random.choice(PRESCRIPTIONS),
+                    'doctor_notes': 'Tests: routine' if random.random() < 0.3 else '',
+                    'date_recorded': datetime.combine(day, SLOT_TIMES['Evening']),
+                })
+                next_treatment += 1
+            yield {
+                'id': appt_id,
+                'patient_id': random.choice(patients),
+                'doctor_id': random.choices(doctors, cum_weights=cum_weights)[0],
+                'appointment_date': day,
+                'appointment_time': random.choice(slots),
+                'status': status,
+                'created_at': created,
+            }
+
+    def upcoming():
+        appt_id = appt_start + count
+        for doctor_id in doctors:
+            for d in range(days_ahead):
+                for slot in slots:
+                    if random.random() < fill_rate:
+                        yield {
+                            'id': appt_id,
+                            'patient_id': random.choice(patients),
+                            'doctor_id': doctor_id,
+                            'appointment_date': today + timedelta(days=d),
+                            'appointment_time': slot,
+                            'status': 'Scheduled' if random.random() < 0.9 else 'Cancelled',
+                            'created_at': datetime.utcnow() - timedelta(days=random.randint(0, 14)),
+                        }
+                        appt_id += 1
+
+    total = 0
+    # Treatments are flushed alongside each appointment batch to bound memory
+    for source in (past(), upcoming()):
+        chunk = []
+        for row in source:
+            chunk.append(row)
+            if len(chunk) >= batch:
+                total += insert_batches(Appointment, chunk, batch)
+                insert_batches(Treatment, treatments, batch)
+                chunk, treatments[:] = [], []
+        total += insert_batches(Appointment, chunk, batch)
+        insert_batches(Treatment, treatments, batch)
+        treatments[:] = []
+    return total
+
+def seed_availability(doctors, days_back, days_ahead, batch):
+    today = date.today()
+
+    def rows():
+        for doctor_id in doctors:
+            for d in range(-days_back, days_ahead):
+                day = today + timedelta(days=d)
+                if random.random() < 0.7:
+                    yield {'doctor_id': doctor_id, 'available_date': day, 'slot_type': 'Morning'}
+                if random.random() < 0.4:
+                    yield {'doctor_id': doctor_id, 'available_date': day, 'slot_type': 'Evening'}
+    return insert_batches(DoctorAvailability, rows(), batch)
+
+def seed_free_slots():
+    free_slots.rebuild()
+    return FreeSlot.query.count()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--appointments', type=int, default=100000, help='past appointments')
+    parser.add_argument('--days-back', type=int, default=3 * 365)
+    parser.add_argument('--days-ahead', type=int, default=30)
+    parser.add_argument('--fill-rate', type=float, default=0.6, help='share of upcoming slots already booked')
+    parser.add_argument('--batch', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with create_app(blueprints=()).app_context():
+        db.create_all()
+        started = timer.perf_counter()
+
+        def step(label, fn, *fn_args):
+            t = timer.perf_counter()
+            result = fn(*fn_args)
+            n = len(result) if isinstance(result, list) else result
+            print(f'{label:<14} {n:>10,} rows  {timer.perf_counter() - t:7.1f}s')
+            return result
+
+        step('admins', seed_admin)
+        departments = step('departments', seed_departments)
+        doctors = step('doctors', seed_users, 'doctor', args.doctors, args.batch, departments)
+        patients = step('patients', seed_users, 'patient', args.patients, args.batch)
+        step('appointments', seed_appointments, doctors, patients, args.appointments,
+             args.days_back, args.days_ahead, args.fill_rate, args.batch)
+        step('availability', seed_availability, doctors, 30, args.days_ahead, args.batch)
+        step('free slots', seed_free_slots)
+        print(f'done in {timer.perf_counter() - started:.1f}s')
@@ -0,0 +1,129 @@
+"""
+Dashboard statistics.
+Every aggregate is one GROUP BY query; the combined result is cached for
+STATS_CACHE_TTL seconds and dropped as soon as a write to a User, Department
+or Appointment commits. A result read while such a commit happened is
+returned but not cached.
+"""
+import time
+import threading
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from models import db, User, Department, Appointment
+import replicas
+
+DEFAULT_TTL = 30  # seconds
+VOLUME_DAYS = 30  # per-day volume window, each side of today
+
+_cache = {'value': None, 'expires': 0, 'generation': 0}  # generation: bumped by invalidate()
+_lock = threading.Lock()
+
+
+# --- AGGREGATES ---
+# Every aggregate is a plain SELECT plus a function shaping its rows, so the
+# same queries run on the Flask-SQLAlchemy session and on the async engine
+# (asgi.py).
+
+def statements():
+    today = date.today()
+    return {
+        'doctors_per_department': select(Department.name, func.count(User.id))
+            .join(User, (User.department_id == Department.id) & (User.role == 'doctor'))
+            .group_by(Department.id, Department.name)
+            .order_by(Department.id),
+        'users_by_role': select(User.role, func.count(User.id)).group_by(User.role),
+        'appointments_by_status': select(Appointment.status, func.count(Appointment.id)).group_by(Appointment.status),
+        'daily_volume': select(Appointment.appointment_date, func.count(Appointment.id))
+            .where(Appointment.appointment_date.between(today - timedelta(days=VOLUME_DAYS), today + timedelta(days=VOLUME_DAYS)))
+            .group_by(Appointment.appointment_date)
+            .order_by(Appointment.appointment_date),
+        # Scheduled appointments per doctor, busiest first
+        'doctor_load': select(User.id, User.username, func.count(Appointment.id))
+            .join(Appointment, Appointment.doctor_id == User.id)
+            .where(Appointment.status == 'Scheduled')
+            .group_by(User.id, User.username)
+            .order_by(func.count(Appointment.id).desc()),
+    }
+
+def assemble(rows):
+    """Dashboard dict from {name: result rows} of statements()."""
+    by_status = {status or 'Pending': count for status, count in rows['appointments_by_status']}
+    return {
+        'users_by_role': {role: count for role, count in rows['users_by_role']},
+        'doctors_per_department': [{'department': name, 'doctors': count} for name, count in rows['doctors_per_department']],
+        'appointments_by_status': by_status,
+        'total_appointments': sum(by_status.values()),
+        'daily_volume': [{'date': d.strftime('%Y-%m-%d'), 'appointments': count} for d, count in rows['daily_volume']],
+        'doctor_load': [{'doctor_id': i, 'doctor': name, 'scheduled': count} for i, name, count in rows['doctor_load']],
+    }
+
+
+# --- CACHE ---
+
+def cached():
+    """The cached dashboard dict, or None when missing or expired."""
+    with _lock:
+        if _cache['value'] is not None and time.monotonic() < _cache['expires']:
+            return _cache['value']
+    return None
+
+def generation():
+    """Pass to remember() when the reads start."""
+    with _lock:
+        return _cache['generation']
+
+def remember(value, ttl, since=None):
+    """Caches `value` unless invalidate() ran after generation() returned `since`."""
+    with _lock:
+        if since is None or since == _cache['generation']:
+            _cache['value'] = value
+            _cache['expires'] = time.monotonic() + ttl
+    return value
+
+def dashboard_stats():
+    """All dashboard aggregates, served from cache while fresh."""
+    value = cached()
+    if value is not None:
+        return value
+    since = generation()
+    with replicas.primary():
+        rows = {name: db.session.execute(stmt).all() for name, stmt in statements().items()}
+    return remember(assemble(rows), current_app.config.get('STATS_CACHE_TTL', DEFAULT_TTL), since)
+
+def invalidate():
+    with _lock:
+        _cache['value'] = None
+        _cache['generation'] += 1
+
+STATS_MODELS = (User, Appointment, Department)
+
+# Writes are noted on the session and invalidate once they commit: until
+# then other requests still read the old numbers, and a rollback changes nothing.
+
+@event.listens_for(Session, 'after_flush')
+def _note_flush(session, flush_context):
+    # Object writes: add / change / delete through the session
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, STATS_MODELS):
+            session.info['stats_changed'] = True
+            return
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk(orm_execute_state):
+    # Bulk writes: query.update() / query.delete() / insert() statements
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, STATS_MODELS):
+        orm_execute_state.session.info['stats_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('stats_changed', None):
+        invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('stats_changed', None)
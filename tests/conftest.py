@@ -0,0 +1,59 @@
+"""
+Shared fixtures: one app per test session on a throwaway SQLite file.
+
+Settings are read from HMS_* variables when config.py is imported, so they
+are set here before anything imports the app.
+"""
+import os
+import sys
+import random
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix='hms-tests-')
+
+os.environ.update({
+    'HMS_DATABASE_URL': f"sqlite:///{os.path.join(TMP, 'hms.db')}",
+    'HMS_CACHE_DIR': os.path.join(TMP, 'cache'),
+    'HMS_TEMPLATE_CACHE_DIR': os.path.join(TMP, 'templates'),
+    'HMS_REPORTS_DIR': os.path.join(TMP, 'reports'),
+    # Hashing cost is not under test here
+    'HMS_PASSWORD_METHOD': 'pbkdf2:sha256:1000',
+})
+sys.path.insert(0, ROOT)
+
+from app import create_app, prepare_database
+from models import db
+import seed_data
+
+
+@pytest.fixture(scope='session')
+def app():
+    random.seed(42)
+    # As app.py does: tables first, since an app with routes loads the schedule grid
+    setup = create_app(blueprints=())
+    prepare_database(setup)
+    with setup.app_context():
+        seed_data.seed_admin()
+        departments = seed_data.seed_departments()
+        doctors = seed_data.seed_users('doctor', 20, 1000, departments)
+        patients = seed_data.seed_users('patient', 50, 1000)
+        seed_data.seed_appointments(doctors, patients, 500, 365, 14, 0.5, 1000)
+        seed_data.seed_availability(doctors, 7, 30, 1000)
+        seed_data.seed_free_slots()
+        db.session.remove()
+    app = create_app()
+    app.config['SEEDED'] = {'doctors': doctors, 'patients': patients}
+    return app
+
+
+@pytest.fixture
+def login(app):
+    """login(email) -> a test client signed in as that user."""
+    def sign_in(email):
+        client = app.test_client()
+        response = client.post('/login', data={'email': email, 'password': seed_data.PASSWORD})
+        assert response.status_code == 302, response.status_code
+        return client
+    return sign_in
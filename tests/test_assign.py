@@ -0,0 +1,54 @@
+"""
+assign.assign() from many threads at once: every call gets its own slot,
+from the schedule grids or from the SQL fallback.
+"""
+import threading
+from collections import Counter
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import func
+from models import db, User, Appointment
+import assign
+import booking
+import schedule
+
+THREADS = 24
+
+
+@pytest.mark.parametrize('source', ['grid', 'database'])
+def test_concurrent_assign_never_gives_a_slot_twice(app, monkeypatch, source):
+    if source == 'database':
+        monkeypatch.setitem(schedule._settings, 'enabled', False)
+    seeded = app.config['SEEDED']
+    date_from, date_to = date.today() + timedelta(days=1), date.today() + timedelta(days=29)
+    with app.app_context():
+        department_id = db.session.query(User.department_id).filter(User.role == 'doctor') \
+            .group_by(User.department_id).order_by(func.count().desc(), User.department_id).limit(1).scalar()
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def run(n):
+        with app.app_context():
+            barrier.wait()
+            try:
+                appt = assign.assign(seeded['patients'][n], department_id, date_from, date_to)
+                results[n] = (appt.doctor_id, appt.appointment_date, appt.appointment_time)
+            except (assign.NoSlot, booking.SlotTaken) as e:
+                results[n] = type(e).__name__
+            except Exception as e:
+                results[n] = e
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    slots = [r for r in results if isinstance(r, tuple)]
+    assert all(isinstance(r, tuple) or r in ('NoSlot', 'SlotTaken') for r in results), results
+    assert slots and len(set(slots)) == len(slots), Counter(slots).most_common(3)
+    with app.app_context():
+        doubled = db.session.query(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time) \
+            .filter(Appointment.status == 'Scheduled') \
+            .group_by(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time) \
+            .having(func.count() > 1).all()
+        assert doubled == []
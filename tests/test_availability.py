@@ -0,0 +1,64 @@
+"""
+Doctor availability forms: only the dates on the form are edited, and bad
+input is a warning, not a 500.
+"""
+from datetime import date, timedelta
+import pytest
+from models import db, User, DoctorAvailability
+
+
+@pytest.fixture
+def doctor(app, login):
+    doctor_id = app.config['SEEDED']['doctors'][6]
+    with app.app_context():
+        email = db.session.get(User, doctor_id).email
+    return doctor_id, login(email)
+
+def slots_on(app, doctor_id, day):
+    with app.app_context():
+        return sorted(a.slot_type for a in DoctorAvailability.query.filter_by(doctor_id=doctor_id, available_date=day))
+
+
+def test_save_only_touches_the_days_on_the_form(app, doctor):
+    doctor_id, client = doctor
+    today, past = date.today(), date(2020, 1, 1)
+    form = {'days': [today.isoformat()], 'slots': [f'{past.isoformat()}_morning', f'{today.isoformat()}_evening']}
+    for _ in range(2):
+        assert client.post('/doctor/availability', data=form).status_code == 302
+    assert slots_on(app, doctor_id, past) == []
+    assert slots_on(app, doctor_id, today) == ['Evening']
+
+def test_past_days_are_not_edited(app, doctor):
+    doctor_id, client = doctor
+    past = date(2020, 1, 2)
+    client.post('/doctor/availability', data={'days': [past.isoformat()], 'slots': [f'{past.isoformat()}_morning']})
+    assert slots_on(app, doctor_id, past) == []
+
+@pytest.mark.parametrize('form', [
+    {'days': ['tomorrow'], 'slots': []},
+    {'days': [date.today().isoformat()], 'slots': ['2025-13-01_morning']},
+    {'days': [date.today().isoformat()], 'slots': ['morning']},
+])
+def test_malformed_form_is_a_warning(doctor, form):
+    _, client = doctor
+    response = client.post('/doctor/availability', data=form)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/doctor/availability')
+
+@pytest.mark.parametrize('weekdays', [['x'], ['9'], ['-1']])
+def test_recurring_rejects_bad_weekdays(app, doctor, weekdays):
+    doctor_id, client = doctor
+    with app.app_context():
+        before = DoctorAvailability.query.filter_by(doctor_id=doctor_id).count()
+    response = client.post('/doctor/availability/recurring',
+                           data={'weekdays': weekdays, 'slot_types': ['Morning'], 'weeks': 2})
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/doctor/availability')
+    with app.app_context():
+        assert DoctorAvailability.query.filter_by(doctor_id=doctor_id).count() == before
+
+def test_recurring_opens_the_weekdays(app, doctor):
+    doctor_id, client = doctor
+    monday = date.today() + timedelta(days=(7 - date.today().weekday()) % 7 or 7)
+    client.post('/doctor/availability/recurring', data={'weekdays': ['0'], 'slot_types': ['Evening'], 'weeks': 2})
+    assert 'Evening' in slots_on(app, doctor_id, monday)
@@ -0,0 +1,139 @@
+"""
+/api/appointments/batch and batch.apply_batch: slot checks in batch order,
+appointments trading slots, and what a concurrent booking does to a batch.
+"""
+import threading
+from datetime import date, timedelta
+import pytest
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Appointment
+import batch
+import booking
+import jobs
+
+MORNING, EVENING = booking.slot_time('Morning'), booking.slot_time('Evening')
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield app.config['SEEDED']
+        db.session.remove()
+
+def day(offset):
+    # Past the seeded upcoming window; each test uses its own days
+    return date.today() + timedelta(days=offset)
+
+def book(seeded, n, doctor_id, when, appt_time):
+    return booking.book(seeded['patients'][n], doctor_id, when, appt_time).id
+
+def slot_of(appt_id):
+    db.session.expire_all()
+    appt = db.session.get(Appointment, appt_id)
+    return appt.appointment_date, appt.appointment_time, appt.status
+
+def op(kind, **fields):
+    return dict(fields, op=kind, **({'date': fields['date'].isoformat()} if 'date' in fields else {}))
+
+def statuses(results):
+    return [r['status'] for r in results]
+
+
+def test_swap(ctx):
+    doctor_id = ctx['doctors'][3]
+    a, b = book(ctx, 0, doctor_id, day(700), MORNING), book(ctx, 1, doctor_id, day(700), EVENING)
+    results = batch.apply_batch([op('reschedule', id=a, date=day(700), slot='Evening'),
+                                 op('reschedule', id=b, date=day(700), slot='Morning')])
+    assert statuses(results) == [200, 200]
+    assert slot_of(a) == (day(700), EVENING, 'Scheduled')
+    assert slot_of(b) == (day(700), MORNING, 'Scheduled')
+    assert Appointment.query.filter_by(status=batch.PARKED_STATUS).count() == 0
+
+def test_rotation(ctx):
+    doctor_id = ctx['doctors'][3]
+    slots = [(day(710), MORNING), (day(710), EVENING), (day(711), MORNING)]
+    ids = [book(ctx, n, doctor_id, *slot) for n, slot in enumerate(slots)]
+    names = {MORNING: 'Morning', EVENING: 'Evening'}
+    # Each appointment moves into the next one's slot
+    results = batch.apply_batch([op('reschedule', id=appt_id, date=slots[(n + 1) % 3][0], slot=names[slots[(n + 1) % 3][1]])
+                                 for n, appt_id in enumerate(ids)])
+    assert statuses(results) == [200, 200, 200]
+    assert [slot_of(appt_id)[:2] for appt_id in ids] == slots[1:] + slots[:1]
+
+def test_swap_with_a_holder_that_stays_is_refused(ctx):
+    doctor_id = ctx['doctors'][3]
+    a, b = book(ctx, 0, doctor_id, day(720), MORNING), book(ctx, 1, doctor_id, day(720), EVENING)
+    # b is referenced (re-confirmed in place) but never leaves: a's move is refused, the walk reruns without it
+    results = batch.apply_batch([op('reschedule', id=a, date=day(720), slot='Evening'),
+                                 op('reschedule', id=b, date=day(720), slot='Evening')])
+    assert statuses(results) == [409, 200]
+    assert slot_of(a)[:2] == (day(720), MORNING)
+    assert slot_of(b)[:2] == (day(720), EVENING)
+
+def test_cancel_then_book(ctx):
+    doctor_id = ctx['doctors'][3]
+    a = book(ctx, 0, doctor_id, day(730), MORNING)
+    results = batch.apply_batch([op('cancel', id=a),
+                                 op('book', doctor_id=doctor_id, patient_id=ctx['patients'][1], date=day(730), slot='Morning')])
+    assert statuses(results) == [200, 201]
+    assert slot_of(a)[2] == 'Cancelled'
+    assert slot_of(results[1]['id']) == (day(730), MORNING, 'Scheduled')
+
+def test_duplicate_booking(ctx):
+    doctor_id = ctx['doctors'][3]
+    booking_op = op('book', doctor_id=doctor_id, patient_id=ctx['patients'][0], date=day(740), slot='Evening')
+    results = batch.apply_batch([booking_op, dict(booking_op, patient_id=ctx['patients'][1])])
+    assert statuses(results) == [201, 409]
+    assert Appointment.query.filter_by(doctor_id=doctor_id, appointment_date=day(740), status='Scheduled').count() == 1
+
+def test_book_needs_a_doctor_and_a_patient(ctx):
+    doctor_id, patient_id = ctx['doctors'][3], ctx['patients'][0]
+    results = batch.apply_batch([op('book', doctor_id=99999999, patient_id=patient_id, date=day(750), slot='Morning'),
+                                 op('book', doctor_id=patient_id, patient_id=doctor_id, date=day(750), slot='Morning')])
+    assert statuses(results) == [400, 400]
+    assert Appointment.query.filter_by(appointment_date=day(750)).count() == 0
+
+def test_concurrent_clash_writes_nothing(ctx, app, monkeypatch):
+    doctor_id = ctx['doctors'][4]
+    a = book(ctx, 0, doctor_id, day(760), MORNING)
+    walk = batch._walk
+
+    def walk_then_lose_the_race(*args):
+        # Another request books the slot after the batch read who holds it
+        def rival():
+            with app.app_context():
+                book(ctx, 2, doctor_id, day(760), EVENING)
+        if not args[-1]:
+            thread = threading.Thread(target=rival)
+            thread.start()
+            thread.join()
+        return walk(*args)
+    monkeypatch.setattr(batch, '_walk', walk_then_lose_the_race)
+
+    with pytest.raises(booking.SlotTaken):
+        batch.apply_batch([op('cancel', id=a),
+                           op('book', doctor_id=doctor_id, patient_id=ctx['patients'][1], date=day(760), slot='Evening')])
+    # The whole batch was rolled back, the cancel included
+    assert slot_of(a)[2] == 'Scheduled'
+    assert Appointment.query.filter_by(doctor_id=doctor_id, appointment_date=day(760), status='Scheduled').count() == 2
+
+def test_other_integrity_errors_are_not_slot_clashes(ctx, monkeypatch):
+    def broken_insert(conn, queued):
+        raise IntegrityError('INSERT INTO jobs ...', {}, Exception('NOT NULL constraint failed: jobs.kind'))
+    monkeypatch.setattr(jobs, 'insert', broken_insert)
+    with pytest.raises(IntegrityError):
+        batch.apply_batch([op('book', doctor_id=ctx['doctors'][4], patient_id=ctx['patients'][0], date=day(770), slot='Morning')])
+    assert Appointment.query.filter_by(appointment_date=day(770)).count() == 0
+
+
+def test_endpoint_is_admin_only(app, login):
+    seeded = app.config['SEEDED']
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first().email
+        patient = db.session.get(User, seeded['patients'][0]).email
+    body = {'operations': [op('book', doctor_id=seeded['doctors'][4], patient_id=seeded['patients'][0], date=day(780), slot='Morning')]}
+    assert app.test_client().post('/api/appointments/batch', json=body).status_code == 403
+    assert login(patient).post('/api/appointments/batch', json=body).status_code == 403
+    response = login(admin).post('/api/appointments/batch', json=body)
+    assert response.status_code == 200
+    assert statuses(response.get_json()['results']) == [201]
@@ -0,0 +1,76 @@
+"""
+Concurrent booking of one slot on file-backed SQLite: exactly one Scheduled
+appointment, and every other caller gets SlotTaken (a flash and redirect
+through the route), never a 500.
+"""
+import threading
+from datetime import date, timedelta
+from models import db, User, Appointment
+import booking
+
+THREADS = 16
+
+
+def race(count, attempt):
+    """Runs attempt(n) for n in range(count) in threads released together; returns their results in order."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(n):
+        barrier.wait()
+        try:
+            results[n] = attempt(n)
+        except Exception as e:
+            results[n] = e
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def scheduled_at(doctor_id, day, appt_time):
+    return Appointment.query.filter_by(doctor_id=doctor_id, appointment_date=day,
+                                       appointment_time=appt_time, status='Scheduled').count()
+
+
+def test_concurrent_book_has_one_winner(app):
+    seeded = app.config['SEEDED']
+    doctor_id = seeded['doctors'][1]
+    for round_ in range(5):
+        day, appt_time = date.today() + timedelta(days=400 + round_), booking.slot_time('Morning')
+
+        def attempt(n):
+            with app.app_context():
+                try:
+                    return booking.book(seeded['patients'][n], doctor_id, day, appt_time).id
+                except booking.SlotTaken:
+                    return 'taken'
+
+        results = race(THREADS, attempt)
+        winners = [r for r in results if isinstance(r, int)]
+        assert len(winners) == 1, results
+        assert results.count('taken') == THREADS - 1, results
+        with app.app_context():
+            assert scheduled_at(doctor_id, day, appt_time) == 1
+
+
+def test_concurrent_book_route_answers_slot_taken(app, login):
+    seeded = app.config['SEEDED']
+    doctor_id = seeded['doctors'][2]
+    day = date.today() + timedelta(days=420)
+    with app.app_context():
+        emails = [db.session.get(User, patient_id).email for patient_id in seeded['patients'][:THREADS]]
+    clients = [login(email) for email in emails]
+
+    def attempt(n):
+        response = clients[n].post(f'/book_appointment/{doctor_id}', data={'date': day.isoformat(), 'slot': 'Evening'})
+        return response.status_code, response.headers.get('Location', '')
+
+    results = race(THREADS, attempt)
+    assert all(not isinstance(r, Exception) and r[0] == 302 for r in results), results
+    booked = [location for _, location in results if location.endswith('/patient_dashboard')]
+    taken = [location for _, location in results if location.endswith(f'/book_appointment/{doctor_id}')]
+    assert (len(booked), len(taken)) == (1, THREADS - 1), results
+    with app.app_context():
+        assert scheduled_at(doctor_id, day, booking.slot_time('Evening')) == 1
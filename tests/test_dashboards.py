@@ -0,0 +1,106 @@
+"""
+SQL statements per dashboard render: bounded, and the same however many rows
+the dashboard lists (no query per appointment, patient or doctor).
+"""
+from datetime import date, datetime, timedelta
+import pytest
+from models import db, User, Appointment, Treatment, SLOT_TIMES
+import cache
+import identity
+import metrics
+import stats
+
+# Statements for one cold render (empty caches), session user load included
+MAX_STATEMENTS = 12
+
+DASHBOARDS = {
+    'admin': '/admin_dashboard',
+    'doctor': '/doctor_dashboard',
+    'patient': '/patient_dashboard',
+}
+
+
+def statements(client, path):
+    """Statements one GET of `path` runs with every cache empty."""
+    cache.clear()
+    stats.invalidate()
+    identity.clear()
+    metrics.reset()
+    response = client.get(path)
+    assert response.status_code == 200, response.status_code
+    return sum(c['sql_count'] for (endpoint, method), c in metrics.snapshot().items() if method == 'GET')
+
+def add_visits(doctor_id, patient_id, others, count, first_day):
+    """`count` past visits with treatments and `count` upcoming ones for both users, each with a different counterpart."""
+    for i in range(count):
+        other_doctor, other_patient = others['doctors'][i % len(others['doctors'])], others['patients'][i % len(others['patients'])]
+        for offset, status in ((-first_day - i, 'Completed'), (first_day + i, 'Scheduled')):
+            day = date.today() + timedelta(days=offset)
+            pair = (Appointment(patient_id=other_patient, doctor_id=doctor_id, appointment_date=day,
+                                appointment_time=SLOT_TIMES['Morning'], status=status),
+                    Appointment(patient_id=patient_id, doctor_id=other_doctor, appointment_date=day,
+                                appointment_time=SLOT_TIMES['Evening'], status=status))
+            db.session.add_all(pair)
+            if status == 'Completed':
+                db.session.add_all(Treatment(appointment=appt, diagnosis='Checkup', prescription='Rest',
+                                             date_recorded=datetime.combine(day, SLOT_TIMES['Evening'])) for appt in pair)
+    db.session.commit()
+
+
+@pytest.mark.parametrize('role', sorted(DASHBOARDS))
+def test_dashboard_statements_do_not_grow_with_rows(app, login, role):
+    seeded = app.config['SEEDED']
+    with app.app_context():
+        doctor, patient = db.session.get(User, seeded['doctors'][0]), db.session.get(User, seeded['patients'][0])
+        email = {'admin': User.query.filter_by(role='admin').first().email,
+                 'doctor': doctor.email, 'patient': patient.email}[role]
+        doctor_id, patient_id = doctor.id, patient.id
+    client = login(email)
+
+    before = statements(client, DASHBOARDS[role])
+    with app.app_context():
+        # Far from the seeded window, so no slot is taken twice
+        first_day = 100 + 50 * sorted(DASHBOARDS).index(role)
+        add_visits(doctor_id, patient_id, seeded, 40, first_day)
+    after = statements(client, DASHBOARDS[role])
+
+    assert before <= MAX_STATEMENTS
+    assert after == before
+
+def test_roster_counts_past_and_completed_visits(app, login):
+    seeded = app.config['SEEDED']
+    doctor_id = seeded['doctors'][7]
+    with app.app_context():
+        email = db.session.get(User, doctor_id).email
+        # A new patient: only the visits below count
+        patient = User(username='roster-patient', email='roster-patient@hms.test', password='-', role='patient')
+        db.session.add(patient)
+        db.session.flush()
+        patient_id = patient.id
+        today = date.today()
+        past, cancelled, upcoming = (Appointment(patient_id=patient_id, doctor_id=doctor_id, appointment_date=today + timedelta(days=offset),
+                                                 appointment_time=SLOT_TIMES['Morning'], status=status)
+                                     for offset, status in ((-900, 'Scheduled'), (-901, 'Cancelled'), (900, 'Scheduled')))
+        db.session.add_all([past, cancelled, upcoming])
+        db.session.commit()
+        upcoming_id = upcoming.id
+
+    def roster_row(client):
+        rows, cursor = [], None
+        while True:
+            page = client.get(f'/api/doctors/{doctor_id}/patients', query_string={'cursor': cursor} if cursor else {}).get_json()
+            rows += page['patients']
+            cursor = page['next_cursor']
+            if not cursor:
+                return next(row for row in rows if row['id'] == patient_id)
+
+    client = login(email)
+    before = roster_row(client)
+    # The doctor marks the upcoming one completed (e.g. seen early)
+    assert client.get(f'/appointment/{upcoming_id}/complete').status_code == 302
+    with app.app_context():
+        assert db.session.get(Appointment, upcoming_id).status == 'Completed'
+    after = roster_row(client)
+    # The past Scheduled one counts, the cancelled and the upcoming one do not - until it is completed
+    assert (before['visits'], before['last_visit']) == (1, (date.today() - timedelta(days=900)).isoformat())
+    assert (after['visits'], after['last_visit']) == (2, (date.today() + timedelta(days=900)).isoformat())
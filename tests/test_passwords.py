@@ -0,0 +1,23 @@
+"""
+passwords.check: a correct password still logs in when the pool has no
+slot left for the rehash.
+"""
+from types import SimpleNamespace
+import passwords
+
+
+def test_rehash_on_a_full_pool_keeps_the_old_hash(app, monkeypatch):
+    run = passwords._run
+    calls = []
+
+    def one_slot(fn, *args):
+        calls.append(fn)
+        if len(calls) > 1:
+            raise passwords.Busy()
+        return run(fn, *args)
+    monkeypatch.setattr(passwords, '_run', one_slot)
+    user = SimpleNamespace(password='plaintext-secret')
+    with app.app_context():
+        assert passwords.check(user, 'plaintext-secret')
+    assert user.password == 'plaintext-secret'
+    assert len(calls) == 2
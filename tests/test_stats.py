@@ -0,0 +1,45 @@
+"""
+Dashboard stats: admin-only over the API, and the cache is dropped only
+when a write commits.
+"""
+from datetime import date, timedelta
+from models import db, User, Appointment, SLOT_TIMES
+import stats
+
+
+def test_api_stats_is_admin_only(app, login):
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first().email
+        patient = db.session.get(User, app.config['SEEDED']['patients'][0]).email
+    assert app.test_client().get('/api/stats').status_code == 403
+    assert login(patient).get('/api/stats').status_code == 403
+    assert login(admin).get('/api/stats').status_code == 200
+
+def test_cache_is_dropped_on_commit_only(app):
+    seeded = app.config['SEEDED']
+    with app.app_context():
+        stats.invalidate()
+        stats.dashboard_stats()
+
+        def add():
+            db.session.add(Appointment(patient_id=seeded['patients'][0], doctor_id=seeded['doctors'][5],
+                                       appointment_date=date.today() + timedelta(days=800),
+                                       appointment_time=SLOT_TIMES['Morning'], status='Scheduled'))
+            db.session.flush()
+
+        add()
+        assert stats.cached() is not None  # flushed, not committed: others still see the old numbers
+        db.session.rollback()
+        assert stats.cached() is not None
+
+        add()
+        db.session.commit()
+        assert stats.cached() is None
+
+def test_result_read_across_a_commit_is_not_cached(app):
+    with app.app_context():
+        stats.invalidate()
+        since = stats.generation()
+        stats.invalidate()  # a write committed while the aggregates were read
+        stats.remember({'stale': True}, 30, since)
+        assert stats.cached() is None
@@ -0,0 +1,60 @@
+"""
+Stored patient timelines: after patches and renames, a read returns what a
+rebuild from the tables would.
+"""
+import json
+from datetime import date, timedelta
+from sqlalchemy import delete, select
+from models import db, User, Appointment, Treatment, SLOT_TIMES
+import timeline
+
+
+def stored_build_time(patient_id):
+    raw = db.session.execute(select(timeline.table.c.document).where(timeline.table.c.patient_id == patient_id)).scalar()
+    return json.loads(raw)['built']
+
+def rebuilt(patient_id):
+    db.session.execute(delete(timeline.table).where(timeline.table.c.patient_id == patient_id))
+    db.session.commit()
+    return timeline.load(patient_id)
+
+
+def test_patched_timeline_equals_a_rebuild(app):
+    seeded = app.config['SEEDED']
+    doctor_id, other_id = seeded['doctors'][7], seeded['doctors'][8]
+    with app.app_context():
+        patient = User(username='timeline-patient', email='timeline-patient@hms.test', password='-', role='patient')
+        db.session.add(patient)
+        db.session.flush()
+        patient_id = patient.id
+        day = date.today() + timedelta(days=950)
+        kept, cancelled, moved = (Appointment(patient_id=patient_id, doctor_id=doctor_id, appointment_date=day + timedelta(days=n),
+                                              appointment_time=SLOT_TIMES['Morning'], status='Scheduled') for n in range(3))
+        db.session.add_all([kept, cancelled, moved])
+        db.session.commit()
+        assert len(timeline.load(patient_id)) == 3
+        built = stored_build_time(patient_id)
+
+        # Patched in by the flush hook
+        db.session.add(Treatment(appointment_id=kept.id, diagnosis='Flu', prescription='Rest'))
+        kept.status = 'Completed'
+        cancelled.status = 'Cancelled'
+        moved.doctor_id, moved.appointment_date = other_id, day + timedelta(days=10)
+        db.session.add(Appointment(patient_id=patient_id, doctor_id=other_id, appointment_date=day + timedelta(days=11),
+                                   appointment_time=SLOT_TIMES['Evening'], status='Scheduled'))
+        db.session.commit()
+
+        # Overlaid on read: no rebuild
+        doctor, department = db.session.get(User, doctor_id), db.session.get(User, other_id).department
+        names = doctor.username, department.name
+        try:
+            doctor.username, department.name = 'Dr. Timeline Renamed', 'Timeline Renamed'
+            db.session.commit()
+            patched = timeline.load(patient_id)
+            assert stored_build_time(patient_id) == built
+            assert patched == rebuilt(patient_id)
+            assert {v[5] for v in patched if v[4] == doctor_id} == {'Dr. Timeline Renamed'}
+            assert {v[6] for v in patched if v[4] == other_id} == {'Timeline Renamed'}
+        finally:
+            doctor.username, department.name = names
+            db.session.commit()
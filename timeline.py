@@ -0,0 +1,203 @@
+"""
+Per-patient visit timeline, stored precomputed.
+
+A patient's timeline (every visit, live and archived, with doctor,
+department and treatment) is one compact JSON document in
+patient_timelines, so opening a long history is one primary-key read and a
+slice instead of a four-table join:
+
+    {"built": <epoch>, "fields": ["id", "date", ...], "visits": [[...], ...]}
+
+The document is built on the first read. After that, a flush hook patches
+it in the same transaction as every ORM write to the patient's appointments
+or treatments (update_treatment, cancelling, rescheduling, booking): only
+the changed visits are re-read and spliced in. The document is rebuilt
+instead when
+  - a bulk statement wrote appointments or treatments (cache.py's
+    'timelines' version stamp is the document's version)
+  - it is older than TIMELINE_TTL seconds
+Doctor and department names are not trusted from the document: every read
+overlays the current ones by doctor_id, from one id -> names map cached
+under the 'doctors' / 'departments' stamps. Renaming a doctor therefore
+retires nothing, and a GET never has to rebuild because of it.
+No write for the patient can commit between a build's read and its store:
+on SQLite the build takes the write lock before reading; on PostgreSQL
+builds and patches take a per-patient advisory lock. The store is an
+upsert, so two first reads racing for one patient both succeed.
+"""
+import json
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, User, Department, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, PatientTimeline
+import cache
+import replicas
+
+FIELDS = ('id', 'date', 'time', 'status', 'doctor_id', 'doctor', 'department', 'diagnosis', 'prescription', 'doctor_notes')
+DEPS = ('timelines',)
+DOCTOR_DEPS = ('doctors', 'departments')
+
+table = PatientTimeline.__table__
+
+# INSERT ... ON CONFLICT per dialect; others fall back to a plain INSERT
+UPSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+LOCK_NAMESPACE = 7101  # first key of the PostgreSQL advisory locks taken here
+
+
+def _version():
+    return cache.version(*DEPS)
+
+def _visit(row, doctors=None):
+    """Serialized visit from an appointment row (doctor columns inline, or looked up in `doctors`)."""
+    doctor, department = (row.doctor, row.department) if doctors is None else doctors.get(row.doctor_id, (None, None))
+    return [row.id, row.appointment_date.isoformat(), row.appointment_time.strftime('%H:%M'), row.status,
+            row.doctor_id, doctor, department, row.diagnosis, row.prescription, row.doctor_notes]
+
+def _live_visits():
+    """SELECT of live visits with doctor, department and treatment; add a WHERE."""
+    return select(Appointment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.appointment_date,
+                  Appointment.appointment_time, Appointment.status, User.username.label('doctor'),
+                  Department.name.label('department'), Treatment.diagnosis, Treatment.prescription, Treatment.doctor_notes) \
+        .join(User, User.id == Appointment.doctor_id) \
+        .outerjoin(Department, Department.id == User.department_id) \
+        .outerjoin(Treatment, Treatment.appointment_id == Appointment.id)
+
+def _archived_visits(conn, patient_id, skip):
+    rows = [row for row in db.session.execute(
+        select(ArchivedAppointment.id, ArchivedAppointment.doctor_id, ArchivedAppointment.appointment_date,
+               ArchivedAppointment.appointment_time, ArchivedAppointment.status, ArchivedTreatment.diagnosis,
+               ArchivedTreatment.prescription, ArchivedTreatment.doctor_notes)
+        .outerjoin(ArchivedTreatment, ArchivedTreatment.appointment_id == ArchivedAppointment.id)
+        .where(ArchivedAppointment.patient_id == patient_id)) if row.id not in skip]
+    if not rows:
+        return []
+    # The doctors live in the main database: one lookup for all of them
+    doctors = {doctor_id: (name, department) for doctor_id, name, department in conn.execute(
+        select(User.id, User.username, Department.name).outerjoin(Department, Department.id == User.department_id)
+        .where(User.id.in_({row.doctor_id for row in rows})))}
+    return [_visit(row, doctors) for row in rows]
+
+def _doctor_names():
+    """doctor id -> (name, department) of every doctor, cached until a doctor or department changes."""
+    key = f'timeline_doctors:{cache.version(*DOCTOR_DEPS)}'  # before reading, as in cache.fragment()
+    names = cache.load(key)
+    if names is None:
+        names = {doctor_id: (name, department) for doctor_id, name, department in db.session.execute(
+            select(User.id, User.username, Department.name).outerjoin(Department, Department.id == User.department_id)
+            .where(User.role == 'doctor'))}
+        cache.store(key, names)
+    return names
+
+def _rename(visits):
+    """Overlays the current doctor and department names; visits of a former doctor keep the stored ones."""
+    names = _doctor_names()
+    for visit in visits:
+        visit[5:7] = names.get(visit[4], visit[5:7])
+    return visits
+
+def _sort(visits):
+    visits.sort(key=lambda v: (v[1], v[2], v[0]))
+    return visits
+
+def _dump(visits, built):
+    return json.dumps({'built': built, 'fields': FIELDS, 'visits': visits}, separators=(',', ':'))
+
+def _lock(conn, patient_ids):
+    """PostgreSQL: serializes builds and patches per patient until COMMIT (SQLite's write lock does it there)."""
+    if conn.dialect.name == 'postgresql':
+        for patient_id in sorted(patient_ids):  # one order everywhere: no deadlocks
+            conn.execute(select(func.pg_advisory_xact_lock(LOCK_NAMESPACE, patient_id)))
+
+def _store(conn, patient_id, version, document):
+    upsert = UPSERTS.get(conn.dialect.name)
+    if upsert is None:
+        conn.execute(insert(table).values(patient_id=patient_id, version=version, document=document))
+        return
+    stmt = upsert(table).values(patient_id=patient_id, version=version, document=document, updated_at=datetime.utcnow())
+    conn.execute(stmt.on_conflict_do_update(index_elements=[table.c.patient_id], set_={
+        'version': stmt.excluded.version, 'document': stmt.excluded.document, 'updated_at': stmt.excluded.updated_at}))
+
+
+# --- READ ---
+
+def _build(patient_id):
+    version = _version()  # before reading: a bump while we build retires the result
+    conn = db.session.connection()
+    # Locking first: a write to this patient's visits now waits for our
+    # COMMIT and then patches the stored document
+    _lock(conn, [patient_id])
+    conn.execute(delete(table).where(table.c.patient_id == patient_id))
+    live = [_visit(row) for row in conn.execute(_live_visits().where(Appointment.patient_id == patient_id))]
+    visits = _sort(live + _archived_visits(conn, patient_id, {v[0] for v in live}))
+    try:
+        _store(conn, patient_id, version, _dump(visits, time.time()))
+        db.session.commit()
+    except IntegrityError:
+        # No upsert on this database and a concurrent read stored it first: already built
+        db.session.rollback()
+    return visits
+
+def load(patient_id):
+    """All visits of the patient, oldest first, as lists in FIELDS order."""
+    # The stored document is patched on the primary; a replica may not have it yet
+    with replicas.primary():
+        row = db.session.execute(select(table.c.version, table.c.document).where(table.c.patient_id == patient_id)).first()
+        if row and row.version == _version():
+            document = json.loads(row.document)
+            if time.time() - document['built'] < current_app.config['TIMELINE_TTL']:
+                return _rename(document['visits'])
+        return _build(patient_id)
+
+def visits(patient_id):
+    """All visits as dicts (for templates)."""
+    return [dict(zip(FIELDS, visit)) for visit in load(patient_id)]
+
+def window(visits, date_from=None, date_to=None, start=0, limit=None):
+    """(total in the date range, visits[start:start + limit] of that range); dates are ISO strings."""
+    dates = [visit[1] for visit in visits]
+    low = bisect_left(dates, date_from) if date_from else 0
+    high = bisect_right(dates, date_to) if date_to else len(visits)
+    selected = visits[low:high]
+    return len(selected), selected[start:start + limit if limit else None]
+
+
+# --- INCREMENTAL UPDATES ---
+
+@event.listens_for(Session, 'after_flush')
+def _patch_on_flush(session, flush_context):
+    appointment_ids, patient_ids = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Appointment):
+            appointment_ids.add(obj.id)
+            patient_ids.update({obj.patient_id, *inspect(obj).attrs.patient_id.history.deleted} - {None})
+        elif isinstance(obj, Treatment):
+            appointment_ids.add(obj.appointment_id)
+    appointment_ids.discard(None)
+    if not appointment_ids:
+        return
+
+    conn = session.connection()
+    # The visits as this transaction now sees them; missing ids were deleted
+    changed = {}
+    for row in conn.execute(_live_visits().where(Appointment.id.in_(appointment_ids))):
+        changed.setdefault(row.patient_id, []).append(_visit(row))
+        patient_ids.add(row.patient_id)
+    _lock(conn, patient_ids)
+    stored = conn.execute(select(table.c.patient_id, table.c.document).where(table.c.patient_id.in_(patient_ids))).all()
+    for patient_id, raw in stored:
+        document = json.loads(raw)
+        visits = [v for v in document['visits'] if v[0] not in appointment_ids] + changed.get(patient_id, [])
+        conn.execute(update(table).where(table.c.patient_id == patient_id)
+                     .values(document=_dump(_sort(visits), document['built'])))
+
+@event.listens_for(Session, 'do_orm_execute')
+def _retire_on_bulk(orm_execute_state):
+    # Bulk statements do not say whose visits they change
+    mapper = orm_execute_state.bind_mapper
+    if not orm_execute_state.is_select and mapper is not None and mapper.class_ in (Appointment, Treatment):
+        cache.bump_on_commit(orm_execute_state.session, 'timelines')
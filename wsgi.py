@@ -0,0 +1,12 @@
+"""
+WSGI entry point for multi-worker servers.
+
+    gunicorn -w 4 -b 0.0.0.0:8000 wsgi:application                        # one request per worker process
+    gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:8000 wsgi:application  # threads share a process
+
+Run `python migrate.py` once before starting the workers - they do not
+create tables or rebuild the free slot / search indexes themselves.
+"""
+from app import create_app
+
+application = create_app()